@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from typing import Any, Hashable
+import threading
+import time
+from .config import settings
+
+
+_MISSING = object()
+
+
+class TTLCache:
+	"""Bounded in-process LRU cache whose entries expire after `ttl` seconds.
+
+	Sync endpoints run in FastAPI's threadpool, so access is guarded by a
+	plain threading lock rather than an asyncio one.
+	"""
+
+	def __init__(self, maxsize: int = 1024, ttl: float = 60.0) -> None:
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key: Hashable, default: Any = None) -> Any:
+		with self._lock:
+			entry = self._data.get(key, _MISSING)
+			if entry is _MISSING:
+				return default
+			expires_at, value = entry
+			if expires_at <= time.monotonic():
+				del self._data[key]
+				return default
+			self._data.move_to_end(key)
+			return value
+
+	def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+		"""Store `value`; `ttl` overrides the cache-wide lifetime for this entry."""
+		with self._lock:
+			self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def invalidate(self, *keys: Hashable) -> None:
+		with self._lock:
+			for key in keys:
+				self._data.pop(key, None)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._data.clear()
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+
+# Per-user trade counters for GET /trades/summary. Invalidated locally on every
+# trade write; the short TTL bounds staleness on the other workers.
+trade_summary_cache = TTLCache(maxsize=4096, ttl=settings.TRADE_SUMMARY_CACHE_TTL)
+
+# trade_id -> (from_user_id, to_user_id) for websocket authorization, so an
+# open socket never needs a pooled DB session. Invalidated on trade delete.
+trade_participants_cache = TTLCache(maxsize=16384, ttl=settings.TRADE_PARTICIPANTS_CACHE_TTL)
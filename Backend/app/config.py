@@ -19,6 +19,98 @@ class Settings(BaseSettings):
 	# Supabase configuration
 	SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
 	SUPABASE_ANON_KEY: str = os.getenv("SUPABASE_ANON_KEY", "")
+	# Per-call timeout (seconds) and pooled connections per worker for the
+	# Supabase Auth API; after SUPABASE_BREAKER_THRESHOLD consecutive failures
+	# calls fail fast for SUPABASE_BREAKER_COOLDOWN seconds
+	SUPABASE_TIMEOUT: float = 5.0
+	SUPABASE_MAX_CONNECTIONS: int = 20
+	SUPABASE_BREAKER_THRESHOLD: int = 5
+	SUPABASE_BREAKER_COOLDOWN: float = 30.0
+
+	# Access tokens carry the user's role and status and are honoured without
+	# a database lookup until they expire; clients renew them with a refresh
+	# token at POST /supabase-auth/refresh
+	ACCESS_TOKEN_TTL_MINUTES: int = 15
+	REFRESH_TOKEN_TTL_DAYS: int = 30
+
+	# Seconds a per-user GET /trades/summary result may be served from memory
+	TRADE_SUMMARY_CACHE_TTL: float = 30.0
+
+	# Seconds a trade's (from_user_id, to_user_id) may be served from memory
+	# when authorizing websockets; participants never change after creation
+	TRADE_PARTICIPANTS_CACHE_TTL: float = 300.0
+
+	# Seconds a bearer token's user (id, role, status, name) may be served from
+	# memory; changes on other workers are announced, this bounds the rest
+	PRINCIPAL_CACHE_TTL: float = 60.0
+
+	# Realtime fan-out across workers: "memory" (single process only), "local"
+	# (workers on one host, via a Unix domain socket) or "redis"
+	REALTIME_BACKEND: str = "local"
+	# Worker processes; gunicorn and uvicorn read the same variable
+	WEB_CONCURRENCY: int = 1
+	REALTIME_SOCKET_PATH: str = "/tmp/bayanihan-realtime.sock"
+	REALTIME_REDIS_URL: str = "redis://127.0.0.1:6379/0"
+	# Events buffered per websocket before the client is dropped as a slow consumer
+	WS_OUTBOUND_QUEUE_SIZE: int = 64
+	# Server sends {"type": "ping"} every interval; a socket with no inbound
+	# frame (pong or otherwise) for WS_IDLE_TIMEOUT seconds is closed
+	WS_PING_INTERVAL: float = 25.0
+	WS_IDLE_TIMEOUT: float = 75.0
+	# Open sockets allowed per user and per worker process
+	WS_MAX_CONNECTIONS_PER_USER: int = 8
+	WS_MAX_CONNECTIONS: int = 5000
+	# At most one typing broadcast per user per trade in this window
+	TYPING_THROTTLE_MS: int = 1000
+
+	# Recent events kept per trade for clients resuming with since_seq, and how
+	# long a worker stays subscribed to a trade after its last socket leaves
+	# (so a quick reconnect finds a gap-free buffer)
+	REALTIME_REPLAY_BUFFER_SIZE: int = 256
+	REALTIME_REPLAY_LINGER: float = 60.0
+
+	# Argon2/bcrypt run off the event loop in a "process" (default) or
+	# "thread" pool of PASSWORD_HASH_WORKERS per worker; calls beyond the
+	# workers plus PASSWORD_HASH_QUEUE_SIZE waiting get a 503
+	PASSWORD_HASH_EXECUTOR: str = "process"
+	PASSWORD_HASH_WORKERS: int = 2
+	PASSWORD_HASH_QUEUE_SIZE: int = 32
+	# Argon2id cost for new password hashes: passes, memory in KiB and lanes.
+	# The defaults are passlib's; calibrate_argon2.py picks values for the
+	# host. Logins with older hashes rehash them in the background.
+	ARGON2_TIME_COST: int = 3
+	ARGON2_MEMORY_COST: int = 65536
+	ARGON2_PARALLELISM: int = 4
+
+	# Password logins allowed per client IP and per email: a burst, then a
+	# steady rate per minute; more get a 429 before any hashing. A successful
+	# login gives its IP token back. Buckets are shared by the workers on a
+	# host through a file at LOGIN_RATE_LIMIT_PATH ("" keeps them per worker).
+	LOGIN_RATE_IP_BURST: int = 20
+	LOGIN_RATE_IP_PER_MINUTE: float = 20.0
+	LOGIN_RATE_EMAIL_BURST: int = 5
+	LOGIN_RATE_EMAIL_PER_MINUTE: float = 5.0
+	LOGIN_RATE_LIMIT_PATH: str = "/tmp/bayanihan-login-limits"
+	LOGIN_RATE_LIMIT_SLOTS: int = 16384
+
+	# Proxies in front of the app that append to X-Forwarded-For (Railway's
+	# edge is one); the client IP is the entry the outermost one added. 0 when
+	# clients connect directly, or they could choose their own IP.
+	TRUSTED_PROXY_HOPS: int = 1
+
+	# Seconds between each worker's purges of expired pending signups (0 turns
+	# the job off), and rows deleted per batch
+	PENDING_SIGNUP_PURGE_INTERVAL: float = 600.0
+	PENDING_SIGNUP_PURGE_BATCH: int = 500
+
+	# Longest a GET /supabase-auth/check-email/{email}/wait request waits for
+	# the signup to be verified, and how many may wait at once per worker;
+	# beyond that the current status is returned straight away
+	SIGNUP_STATUS_WAIT_SECONDS: float = 25.0
+	SIGNUP_STATUS_MAX_WAITERS: int = 1000
+
+	# Bearer token Prometheus sends to scrape /metrics; unset, /metrics is off
+	METRICS_TOKEN: str = ""
 
 	# Blockchain (Sepolia) configuration
 	sepolia_rpc_url: str | None = None
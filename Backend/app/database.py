@@ -2,6 +2,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 import os, tempfile
 from .config import settings
+from .metrics import DB_POOL_CHECKED_OUT
 
 # Optional SSL CA support for Aiven / other managed MySQL services.
 # Provide either:
@@ -33,6 +34,7 @@ if ssl_ca:
 
 engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True, connect_args=connect_args if connect_args else {})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DB_POOL_CHECKED_OUT.set_function(lambda: engine.pool.checkedout() if hasattr(engine.pool, "checkedout") else 0)
 
 
 class Base(DeclarativeBase):
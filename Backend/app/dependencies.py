@@ -1,15 +1,22 @@
 from fastapi import Depends, HTTPException, Header, status
-from sqlalchemy.orm import Session
-from .database import get_db
-from . import models
-from .security import decode_token
-
-def get_current_user(
-    authorization: str | None = Header(default=None),
-    db: Session = Depends(get_db)
-) -> models.User:
+from .principals import Principal, resolve_principal
+
+# Accounts in these states are refused on every authenticated endpoint
+BLOCKED_STATUSES = ("suspended", "banned")
+
+
+def get_current_user(authorization: str | None = Header(default=None)) -> Principal:
     """
     Dependency to get the current authenticated user from the Bearer token.
+
+    This is the one place a request's token is resolved. FastAPI caches a
+    dependency's result for the duration of a request, so role checks and
+    endpoints that depend on it share a single decode and principal lookup
+    (from the principal cache or the token's own claims, else the
+    id/role/status/name columns). Only that last lookup opens a database
+    session, so requests served from the cache or the claims never check out
+    a connection for authentication. The user is a Principal, not an ORM
+    row; load other columns explicitly.
     """
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(
@@ -17,23 +24,63 @@ def get_current_user(
             detail="Missing or invalid authentication token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+
     token = authorization.split(" ", 1)[1]
-    user_id = decode_token(token)
-    
+    user_id, user = resolve_principal(token)
+
     if not user_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+
+    if user.status in BLOCKED_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Your account has been suspended. Please contact support for assistance.",
+        )
+
     return user
+
+
+def connection_principal(token: str | None) -> Principal | None:
+    """
+    The principal for a realtime socket or event stream's token, or None if
+    the token is invalid, its user no longer exists or is blocked. The same
+    checks as get_current_user; a lookup's session is closed before it
+    returns, so a long-lived connection never holds one. Call it in the
+    threadpool.
+    """
+    if not token:
+        return None
+    _, user = resolve_principal(token)
+    if not user or user.status in BLOCKED_STATUSES:
+        return None
+    return user
+
+
+def require_role(*roles: str):
+    """
+    Dependency factory for role checks, e.g.
+    `current_user: Principal = Depends(require_role("admin"))`.
+    """
+    def check_role(user: Principal = Depends(get_current_user)) -> Principal:
+        if user.role not in roles:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"{' or '.join(role.capitalize() for role in roles)} access required",
+            )
+        return user
+
+    return check_role
+
+
+require_admin = require_role("admin")
@@ -0,0 +1,112 @@
+"""
+Password hashing off the event loop.
+
+Argon2 and bcrypt take ~100-200 ms of CPU per call. Run inline in an
+`async def` handler that stalls every request and websocket on the worker
+for as long; here they run in a small executor instead (separate processes
+by default, PASSWORD_HASH_EXECUTOR="thread" for threads), and the handler
+awaits the result.
+
+At most PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE calls are admitted
+per worker; beyond that callers get a 503 straight away rather than
+queueing behind a login storm for seconds.
+
+After a successful login, upgrade_password_hash replaces a legacy bcrypt or
+outdated Argon2 hash (security.needs_rehash) with one made with the
+configured parameters, as a background task so the login doesn't wait.
+"""
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+from . import models, security
+from .config import settings
+from .database import SessionLocal
+from .metrics import PASSWORD_HASH_IN_FLIGHT, PASSWORD_HASH_REJECTED, PASSWORD_HASH_SECONDS, PASSWORD_REHASHES
+
+_executor: Executor | None = None
+_in_flight = 0
+
+
+def _get_executor() -> Executor:
+	global _executor
+	if _executor is None:
+		workers = max(1, settings.PASSWORD_HASH_WORKERS)
+		if settings.PASSWORD_HASH_EXECUTOR == "thread":
+			_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+		else:
+			# spawn: forking a process that runs an event loop and DB pool threads is unsafe
+			_executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+	return _executor
+
+
+def shutdown() -> None:
+	global _executor
+	if _executor is not None:
+		_executor.shutdown(wait=False, cancel_futures=True)
+		_executor = None
+
+
+async def _run(operation: str, fn, *args):
+	global _in_flight
+	if _in_flight >= max(1, settings.PASSWORD_HASH_WORKERS) + settings.PASSWORD_HASH_QUEUE_SIZE:
+		PASSWORD_HASH_REJECTED.inc()
+		raise HTTPException(status_code=503, detail="Server is busy, please try again", headers={"Retry-After": "1"})
+	_in_flight += 1
+	PASSWORD_HASH_IN_FLIGHT.set(_in_flight)
+	started = time.perf_counter()
+	try:
+		return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+	except BrokenProcessPool:
+		# A pool process died (e.g. OOM-killed); start a fresh pool for the next call
+		shutdown()
+		raise
+	finally:
+		_in_flight -= 1
+		PASSWORD_HASH_IN_FLIGHT.set(_in_flight)
+		PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+
+async def hash_password_async(password: str) -> str:
+	"""security.hash_password, run in the hashing executor."""
+	return await _run("hash", security.hash_password, password)
+
+
+async def verify_password_async(plain_password: str, password_hash: str) -> bool:
+	"""security.verify_password, run in the hashing executor."""
+	return await _run("verify", security.verify_password, plain_password, password_hash)
+
+
+def _replace_hash(user_id: str, old_hash: str, new_hash: str) -> bool:
+	db = SessionLocal()
+	try:
+		# Only if unchanged since the login read it, so a password change in between wins
+		result = db.execute(
+			update(models.User)
+			.where(models.User.id == user_id, models.User.password_hash == old_hash)
+			.values(password_hash=new_hash)
+		)
+		db.commit()
+		return result.rowcount == 1
+	finally:
+		db.close()
+
+
+async def upgrade_password_hash(user_id: str, password: str, old_hash: str) -> None:
+	"""Rehash a just-verified password with the current parameters; for BackgroundTasks."""
+	try:
+		new_hash = await hash_password_async(password)
+		replaced = await run_in_threadpool(_replace_hash, user_id, old_hash, new_hash)
+	except HTTPException:
+		# Hashing queue full; the next login will try again
+		PASSWORD_REHASHES.labels("deferred").inc()
+		return
+	except Exception as e:
+		PASSWORD_REHASHES.labels("failed").inc()
+		print(f"Password rehash failed for user {user_id}: {e}")
+		return
+	PASSWORD_REHASHES.labels("upgraded" if replaced else "superseded").inc()
@@ -1,11 +1,18 @@
+import logging
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from .config import settings
 from .database import Base, engine, get_db
 from . import models
-from .routers import categories, items, trades, messages, realtime, admin, supabase_auth, support, reports
+from .routers import categories, items, trades, messages, realtime, events, admin, supabase_auth, support, reports
+from .pubsub import bus
+from .supabase_client import supabase
+from . import hashing
+from .services.pending_signups import pending_signup_purger
+from .metrics import metrics_app
 
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Bayanihan Exchange API")
 
@@ -19,6 +26,30 @@ app.add_middleware(
 )
 
 
+# Per-worker Prometheus metrics, for scrapers holding METRICS_TOKEN
+app.mount("/metrics", metrics_app(settings.METRICS_TOKEN))
+
+
+@app.on_event("startup")
+async def start_realtime_backend():
+	if settings.REALTIME_BACKEND.lower() == "memory" and settings.WEB_CONCURRENCY > 1:
+		logger.warning(
+			"REALTIME_BACKEND=memory with %d workers: realtime events, principal "
+			"changes and signup wake-ups will not reach the other workers",
+			settings.WEB_CONCURRENCY,
+		)
+	# Joined before any socket connects, to hear principal changes
+	await bus.start()
+	pending_signup_purger.start()
+
+
+@app.on_event("shutdown")
+async def close_clients():
+	await pending_signup_purger.stop()
+	await supabase.close()
+	hashing.shutdown()
+
+
 @app.get("/health")
 def health():
 	return {"status": "ok"}
@@ -96,6 +127,7 @@ app.include_router(trades.router)
 app.include_router(messages.router)
 app.include_router(supabase_auth.router)  # Supabase auth only
 app.include_router(realtime.router)
+app.include_router(events.router)
 app.include_router(admin.router)
 app.include_router(support.router)
 app.include_router(reports.router)
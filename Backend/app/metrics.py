@@ -0,0 +1,143 @@
+"""
+Prometheus metrics, exposed per worker at GET /metrics to scrapers that
+send METRICS_TOKEN as a bearer token.
+"""
+import hmac
+from prometheus_client import Counter, Gauge, Histogram, make_asgi_app
+from starlette.responses import PlainTextResponse
+
+
+def metrics_app(token: str):
+	"""
+	The /metrics ASGI app: 401 unless the request has `Authorization: Bearer
+	<token>`, and 404 while no token is configured.
+	"""
+	exporter = make_asgi_app()
+	expected = f"Bearer {token}".encode()
+
+	async def app(scope, receive, send):
+		if scope["type"] == "http":
+			supplied = dict(scope["headers"]).get(b"authorization", b"")
+			if not token:
+				await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+				return
+			if not hmac.compare_digest(supplied, expected):
+				response = PlainTextResponse("Unauthorized", status_code=401, headers={"WWW-Authenticate": "Bearer"})
+				await response(scope, receive, send)
+				return
+		await exporter(scope, receive, send)
+
+	return app
+
+# Realtime websocket delivery
+WS_QUEUE_DEPTH = Histogram(
+	"ws_outbound_queue_depth",
+	"Outbound queue depth of a websocket connection, sampled on every enqueue",
+	buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+WS_EVENTS_COALESCED = Counter(
+	"ws_events_coalesced_total",
+	"Outbound events merged into an event already waiting in a connection's queue",
+)
+WS_SLOW_CONSUMERS = Counter(
+	"ws_slow_consumer_disconnects_total",
+	"Websocket connections closed because their outbound queue overflowed",
+)
+WS_CONNECTIONS = Gauge(
+	"ws_connections",
+	"Websocket connections currently open on this worker",
+)
+WS_REAPED = Counter(
+	"ws_reaped_total",
+	"Websocket connections closed by the heartbeat for sending nothing within the idle timeout",
+)
+WS_REJECTED = Counter(
+	"ws_rejected_total",
+	"Websocket connections refused at a connection cap",
+	["reason"],
+)
+
+# Authentication
+PRINCIPAL_CACHE_LOOKUPS = Counter(
+	"principal_cache_lookups_total",
+	"Bearer tokens resolved from the principal cache (hit), their embedded claims (claims) or the database (miss)",
+	["result"],
+)
+
+# Supabase Auth API
+SUPABASE_REQUESTS = Counter(
+	"supabase_requests_total",
+	"Supabase Auth calls by outcome: ok, rejected_by_supabase (4xx), error, timeout, rejected (circuit open)",
+	["operation", "outcome"],
+)
+SUPABASE_REQUEST_SECONDS = Histogram(
+	"supabase_request_seconds",
+	"Supabase Auth call latency",
+	["operation"],
+	buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
+SUPABASE_CIRCUIT_OPEN = Gauge(
+	"supabase_circuit_open",
+	"1 while the Supabase circuit breaker is failing calls fast",
+)
+
+# Database connection pool
+DB_POOL_CHECKED_OUT = Gauge(
+	"db_pool_checked_out",
+	"SQLAlchemy pool connections currently checked out on this worker",
+)
+
+# Password hashing executor
+PASSWORD_HASH_IN_FLIGHT = Gauge(
+	"password_hash_in_flight",
+	"Password hash/verify calls running or queued in the hashing executor",
+)
+PASSWORD_HASH_REJECTED = Counter(
+	"password_hash_rejected_total",
+	"Password hash/verify calls refused with 503 because the hashing queue was full",
+)
+PASSWORD_HASH_SECONDS = Histogram(
+	"password_hash_seconds",
+	"Time from submitting a password hash/verify call to its result, queueing included",
+	["operation"],
+	buckets=(0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10),
+)
+PASSWORD_REHASHES = Counter(
+	"password_rehashes_total",
+	"Legacy or outdated password hashes replaced after a successful login, by outcome",
+	["outcome"],
+)
+
+# Login rate limiting
+LOGIN_ATTEMPTS = Counter(
+	"login_attempts_total",
+	"Password login attempts admitted to hashing or refused by the login rate limiter",
+	["endpoint", "outcome"],
+)
+LOGIN_RATE_LIMIT_EVICTIONS = Counter(
+	"login_rate_limit_evictions_total",
+	"Login rate-limit buckets dropped before refilling because their slots were full",
+	["scope"],
+)
+
+# Pending signup purge
+PENDING_SIGNUPS_PURGED = Counter(
+	"pending_signups_purged_total",
+	"Expired pending signups deleted by the purge job",
+)
+PENDING_SIGNUP_PURGE_RUNS = Counter(
+	"pending_signup_purge_runs_total",
+	"Runs of the pending signup purge job, by outcome",
+	["outcome"],
+)
+
+# Signup verification status
+SIGNUP_STATUS_WAITERS = Gauge(
+	"signup_status_waiters",
+	"Requests on this worker waiting for a pending signup to be verified",
+)
+SIGNUP_STATUS_WAITS = Counter(
+	"signup_status_waits_total",
+	"Waits for a pending signup's verification, by how they ended",
+	["outcome"],
+)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, Enum, ForeignKey, Text, JSON, Float
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, Enum, ForeignKey, Text, JSON, Float, Index
 from datetime import datetime
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -26,6 +26,11 @@ class User(Base):
 	latitude = Column(Float, nullable=True)
 	longitude = Column(Float, nullable=True)
 	supabase_user_id = Column(String(255), nullable=True)  # Supabase Auth ID
+	# Which verifier owns the password: 'local' (password_hash) or 'supabase';
+	# NULL until learned on the first successful login
+	auth_provider = Column(String(20), nullable=True)
+	# Embedded in issued tokens; bumped to invalidate the user's refresh tokens
+	token_version = Column(Integer, nullable=False, default=0)
 
 
 class PendingSignup(Base):
@@ -46,8 +51,23 @@ class PendingSignup(Base):
 	supabase_user_id = Column(String(255), nullable=True)  # Supabase Auth ID (optional)
 	expires_at = Column(DateTime, nullable=True)  # Optional expiration time
 
+	__table_args__ = (
+		Index("idx_pending_signups_expires_at", "expires_at"),
+	)
 
 
+class RevokedToken(Base):
+	"""Refresh tokens that were rotated or logged out; kept until they expire"""
+	__tablename__ = "revoked_tokens"
+
+	jti = Column(String(36), primary_key=True)
+	user_id = Column(String(36), nullable=False)
+	expires_at = Column(DateTime, nullable=False)
+	revoked_at = Column(DateTime, server_default=func.now())
+
+	__table_args__ = (
+		Index("idx_revoked_tokens_expires_at", "expires_at"),
+	)
 
 
 class Category(Base):
@@ -116,6 +136,31 @@ class Message(Base):
 	is_read = Column(Boolean, default=False)
 	created_at = Column(DateTime, server_default=func.now())
 
+	__table_args__ = (
+		# Latest message per trade and (created_at, id) keyset pages of history
+		Index("idx_messages_trade_created", "trade_id", "created_at", "id"),
+		# Unread counts per trade for a receiver
+		Index("idx_messages_receiver_unread", "receiver_id", "is_read", "trade_id"),
+	)
+
+
+class ConversationState(Base):
+	"""Per-participant inbox row for a trade, maintained on every message write"""
+	__tablename__ = "conversation_state"
+
+	trade_id = Column(String(36), ForeignKey('trades.id', ondelete='CASCADE'), primary_key=True)
+	user_id = Column(String(36), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+	other_user_id = Column(String(36), ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+	last_message_id = Column(String(36), nullable=True)
+	last_message_at = Column(DateTime, nullable=True)
+	last_message_preview = Column(String(255), nullable=True)
+	unread_count = Column(Integer, nullable=False, default=0)
+	updated_at = Column(DateTime, nullable=False)  # Last activity; drives inbox ordering
+
+	__table_args__ = (
+		Index("idx_conversation_state_user_updated", "user_id", "updated_at"),
+	)
+
 
 
 class Rating(Base):
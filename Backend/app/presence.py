@@ -0,0 +1,124 @@
+"""
+In-memory presence and typing throttling for the realtime layer. Nothing
+here touches the database.
+
+- PresenceRegistry: who is connected. Each worker counts its own sockets
+  per user and announces changes on the "presence" pub/sub channel, plus a
+  full list of its users on every heartbeat tick, so every worker can
+  answer is_online() for any user. A worker that stops refreshing (e.g. it
+  crashed) drops out after PRESENCE_TTL_FACTOR heartbeat intervals.
+- TypingThrottle: at most one typing broadcast per user per trade per
+  TYPING_THROTTLE_MS; the latest state in between is sent when the window
+  closes, so "stopped typing" is never lost.
+"""
+import asyncio
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Dict, Set, Tuple
+from .config import settings
+
+PRESENCE_CHANNEL = "presence"
+# Remote workers' user lists expire after this many missed heartbeat refreshes
+PRESENCE_TTL_FACTOR = 3
+
+
+class PresenceRegistry:
+	def __init__(self) -> None:
+		self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+		self._local: Dict[str, int] = {}
+		# worker id -> (expires_at, users online there)
+		self._remote: Dict[str, Tuple[float, Set[str]]] = {}
+
+	def local_count(self, user_id: str) -> int:
+		return self._local.get(user_id, 0)
+
+	def connected(self, user_id: str) -> bool:
+		"""Count a local socket; True if it is the user's first on this worker."""
+		self._local[user_id] = self._local.get(user_id, 0) + 1
+		return self._local[user_id] == 1
+
+	def disconnected(self, user_id: str) -> bool:
+		"""Uncount a local socket; True if it was the user's last on this worker."""
+		remaining = self._local.get(user_id, 0) - 1
+		if remaining > 0:
+			self._local[user_id] = remaining
+			return False
+		self._local.pop(user_id, None)
+		return True
+
+	def is_online(self, user_id: str) -> bool:
+		if user_id in self._local:
+			return True
+		now = time.monotonic()
+		return any(expires_at > now and user_id in users for expires_at, users in self._remote.values())
+
+	def snapshot_event(self, user_ids) -> dict:
+		"""Event telling a new connection which of `user_ids` are online."""
+		return {"type": "presence_snapshot", "users": {user_id: self.is_online(user_id) for user_id in user_ids}}
+
+	def change_event(self, user_id: str, online: bool) -> dict:
+		return {"worker": self.worker_id, "online" if online else "offline": [user_id]}
+
+	def refresh_event(self) -> dict:
+		return {"worker": self.worker_id, "full": True, "online": list(self._local)}
+
+	def apply(self, event: dict) -> None:
+		"""Merge another worker's announcement."""
+		worker = event.get("worker")
+		if not worker or worker == self.worker_id:
+			return
+		now = time.monotonic()
+		expires_at = now + settings.WS_PING_INTERVAL * PRESENCE_TTL_FACTOR
+		if event.get("full"):
+			self._remote[worker] = (expires_at, set(event.get("online") or ()))
+		else:
+			_, users = self._remote.get(worker, (expires_at, set()))
+			users.update(event.get("online") or ())
+			users.difference_update(event.get("offline") or ())
+			self._remote[worker] = (expires_at, users)
+		for stale in [w for w, (exp, _) in self._remote.items() if exp <= now]:
+			del self._remote[stale]
+
+
+class TypingThrottle:
+	"""Rate-limits typing broadcasts per (trade, user); see module docstring."""
+
+	def __init__(self, publish: Callable[[str, dict], Awaitable[None]], interval: float | None = None) -> None:
+		self._publish = publish
+		self.interval = interval if interval is not None else settings.TYPING_THROTTLE_MS / 1000
+		self._last_sent: Dict[Tuple[str, str], float] = {}
+		self._pending: Dict[Tuple[str, str], bool] = {}
+
+	async def submit(self, trade_id: str, user_id: str, is_typing: bool) -> None:
+		key = (trade_id, user_id)
+		now = time.monotonic()
+		if key in self._pending:
+			self._pending[key] = is_typing
+			return
+		wait = self._last_sent.get(key, 0.0) + self.interval - now
+		if wait <= 0:
+			self._last_sent[key] = now
+			await self._publish(trade_id, _typing_event(trade_id, user_id, is_typing))
+			self._prune(now)
+			return
+		self._pending[key] = is_typing
+		asyncio.get_running_loop().call_later(wait, lambda: asyncio.create_task(self._flush(key)))
+
+	async def _flush(self, key: Tuple[str, str]) -> None:
+		if key not in self._pending:
+			return
+		is_typing = self._pending.pop(key)
+		self._last_sent[key] = time.monotonic()
+		trade_id, user_id = key
+		await self._publish(trade_id, _typing_event(trade_id, user_id, is_typing))
+
+	def _prune(self, now: float) -> None:
+		# Keep the map to users who typed within the last window
+		if len(self._last_sent) > 10000:
+			cutoff = now - self.interval
+			self._last_sent = {key: sent for key, sent in self._last_sent.items() if sent > cutoff}
+
+
+def _typing_event(trade_id: str, user_id: str, is_typing: bool) -> dict:
+	return {"type": "typing", "tradeId": trade_id, "userId": user_id, "isTyping": is_typing}
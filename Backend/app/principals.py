@@ -0,0 +1,151 @@
+"""
+Cached principals for authenticated requests.
+
+Resolving a bearer token used to cost a jwt.decode and a full users row on
+every API call. principal_cache maps the token to a small Principal for up
+to PRINCIPAL_CACHE_TTL seconds, never past the token's own expiry.
+
+Each entry carries the user's version stamp from when it was loaded, and
+invalidate() bumps the stamp, so entries loaded before a suspend, delete,
+profile or password change are ignored - including one whose database read
+raced with the change. Other workers bump their stamp when the change is
+announced on PRINCIPALS_CHANNEL of the event bus (see
+announce_principal_change); the TTL bounds staleness should an
+announcement be lost.
+
+Access tokens issued by tokens.access_token_for embed the principal, so
+they need no lookup at all - unless this worker has a version stamp for the
+user, i.e. heard of a change within the access-token lifetime. Then the
+user is read from the database like for older tokens, and a token whose
+version is behind users.token_version is refused.
+"""
+import json
+import time
+from dataclasses import dataclass
+from . import models
+from .cache import TTLCache
+from .config import settings
+from .database import SessionLocal
+from .metrics import PRINCIPAL_CACHE_LOOKUPS
+from .pubsub import bus
+from .security import decode_token_claims
+
+PRINCIPALS_CHANNEL = "principals"
+
+
+@dataclass(frozen=True)
+class Principal:
+	"""The authenticated user, as much of it as authorization needs."""
+	id: str
+	role: str | None
+	status: str | None
+	name: str
+
+
+class PrincipalCache:
+	def __init__(self, maxsize: int = 16384, ttl: float = 60.0, version_ttl: float | None = None) -> None:
+		self.ttl = ttl
+		# token -> (principal, version stamp it was loaded under)
+		self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+		# user id -> version stamp; a stamp is kept at least as long as any
+		# entry loaded before it, so expiring it cannot revive a stale entry,
+		# and as long as an access token issued before it may still be used
+		self._versions = TTLCache(maxsize=maxsize, ttl=max(ttl, version_ttl or 0))
+
+	def version(self, user_id: str) -> int:
+		return self._versions.get(user_id, 0)
+
+	def get(self, token: str) -> Principal | None:
+		entry = self._entries.get(token)
+		if entry is None:
+			return None
+		principal, version = entry
+		if version != self.version(principal.id):
+			self._entries.invalidate(token)
+			return None
+		return principal
+
+	def set(self, token: str, principal: Principal, version: int, expires_at: float | None = None) -> None:
+		ttl = self.ttl if expires_at is None else min(self.ttl, expires_at - time.time())
+		if ttl > 0:
+			self._entries.set(token, (principal, version), ttl)
+
+	def invalidate(self, user_id: str) -> None:
+		"""Drop every cached principal of a user on this worker."""
+		self._versions.set(user_id, self.version(user_id) + 1)
+
+	def apply(self, event: dict) -> None:
+		"""Merge another worker's announcement of a changed user."""
+		user_id = event.get("user")
+		if user_id:
+			self.invalidate(user_id)
+
+
+principal_cache = PrincipalCache(
+	maxsize=16384,
+	ttl=settings.PRINCIPAL_CACHE_TTL,
+	version_ttl=settings.ACCESS_TOKEN_TTL_MINUTES * 60,
+)
+
+
+async def announce_principal_change(user_id: str, disconnect: bool = False) -> None:
+	"""
+	Invalidate a user's cached principals here and on every other worker.
+	With `disconnect`, for a suspended or deleted user, the user's realtime
+	connections are closed as well (see TradeConnectionManager.disconnect_user).
+	"""
+	principal_cache.invalidate(user_id)
+	event = {"user": user_id, "disconnect": True} if disconnect else {"user": user_id}
+	await bus.publish(PRINCIPALS_CHANNEL, json.dumps(event).encode())
+
+
+async def _on_principal_change(channel: str, data: bytes) -> None:
+	principal_cache.apply(json.loads(data))
+
+
+bus.listen(PRINCIPALS_CHANNEL, _on_principal_change)
+
+
+def resolve_principal(token: str) -> tuple[str | None, Principal | None]:
+	"""
+	(user id, principal) for a bearer token, from the cache when possible:
+	(None, None) if the token is invalid or expired, (user id, None) if its
+	user no longer exists. Only a miss opens a database session, closed
+	before returning; call it in the threadpool.
+	"""
+	principal = principal_cache.get(token)
+	if principal is not None:
+		PRINCIPAL_CACHE_LOOKUPS.labels(result="hit").inc()
+		return principal.id, principal
+
+	claims = decode_token_claims(token)
+	user_id = claims.get("sub") if claims else None
+	if not user_id:
+		PRINCIPAL_CACHE_LOOKUPS.labels(result="miss").inc()
+		return None, None
+	# Read the stamp before the row, so a change committed in between wins
+	version = principal_cache.version(user_id)
+	if "ver" in claims and version == 0:
+		PRINCIPAL_CACHE_LOOKUPS.labels(result="claims").inc()
+		return user_id, Principal(id=user_id, role=claims.get("role"), status=claims.get("status"), name=claims.get("name") or "")
+	PRINCIPAL_CACHE_LOOKUPS.labels(result="miss").inc()
+
+	db = SessionLocal()
+	try:
+		row = db.query(
+			models.User.id,
+			models.User.role,
+			models.User.status,
+			models.User.name,
+			models.User.token_version,
+		).filter(models.User.id == user_id).first()
+	finally:
+		db.close()
+	if not row:
+		return user_id, None
+	if "ver" in claims and claims["ver"] < (row.token_version or 0):
+		# Issued before a password change
+		return None, None
+	principal = Principal(id=row.id, role=row.role, status=row.status, name=row.name)
+	principal_cache.set(token, principal, version, claims.get("exp"))
+	return user_id, principal
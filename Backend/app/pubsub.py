@@ -0,0 +1,485 @@
+"""
+Pub/sub transports used to fan events out across worker processes, and the
+EventBus through which each worker shares one of them.
+
+- MemoryBackend: single process; publish delivers straight to local sockets.
+- LocalBackend: every worker on the host connects to a small broker on a
+  Unix domain socket. The first worker to start hosts the broker; if it
+  exits, the survivors elect a new one and resubscribe.
+- RedisBackend: same client, pointed at a Redis server over TCP.
+
+The broker speaks the subset of the Redis protocol (RESP) used here:
+SUBSCRIBE, UNSUBSCRIBE, PUBLISH, PING and EVAL of SEQUENCED_PUBLISH_SCRIPT,
+so one client serves both.
+
+Sequenced publishes prefix the message with b"<seq>\\n", where seq is a
+per-channel counter incremented atomically with the publish, so every
+subscriber sees a channel's messages in sequence order. Counters start from
+the current time in milliseconds rather than 1, so they keep increasing
+across broker restarts.
+
+EventBus (bus) is this worker's one connection to the backend. Modules
+register a handler for their channel with bus.listen() at import - the
+realtime sockets' presence, principal cache invalidations - and the bus
+subscribes to all of them when it starts at app startup. Channels joined
+and left at runtime, like a trade's while this worker has sockets in it,
+use subscribe() and unsubscribe().
+"""
+import asyncio
+import fcntl
+import logging
+import os
+from abc import ABC, abstractmethod
+import time
+from typing import Awaitable, Callable, Dict, Set
+from urllib.parse import urlparse
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[str, bytes], Awaitable[None]]
+
+# KEYS[1] = counter key, ARGV[1] = channel, ARGV[2] = data, ARGV[3] = counter base - 1
+SEQUENCED_PUBLISH_SCRIPT = (
+	"local seq = redis.call('INCR', KEYS[1]) "
+	"if seq == 1 then seq = redis.call('INCRBY', KEYS[1], ARGV[3]) end "
+	"redis.call('PUBLISH', ARGV[1], seq .. '\\n' .. ARGV[2]) "
+	"return seq"
+)
+
+
+def _sequence_base() -> int:
+	return int(time.time() * 1000)
+
+
+def _counter_key(channel: str | bytes) -> bytes:
+	if isinstance(channel, str):
+		channel = channel.encode()
+	return b"seq:" + channel
+
+
+class PubSubBackend(ABC):
+	"""Interface: deliver every message published on a subscribed channel to `handler`."""
+
+	@abstractmethod
+	async def start(self, handler: MessageHandler) -> None:
+		...
+
+	@abstractmethod
+	async def publish(self, channel: str, data: bytes) -> None:
+		...
+
+	@abstractmethod
+	async def publish_sequenced(self, channel: str, data: bytes) -> None:
+		"""Publish `data` prefixed with the channel's next sequence number."""
+
+	@abstractmethod
+	async def subscribe(self, channel: str) -> None:
+		...
+
+	@abstractmethod
+	async def unsubscribe(self, channel: str) -> None:
+		...
+
+	async def close(self) -> None:
+		pass
+
+
+class MemoryBackend(PubSubBackend):
+	def __init__(self) -> None:
+		self._handler: MessageHandler | None = None
+		self._channels: Set[str] = set()
+		self._counters: Dict[str, int] = {}
+
+	async def start(self, handler: MessageHandler) -> None:
+		self._handler = handler
+
+	async def publish(self, channel: str, data: bytes) -> None:
+		if self._handler and channel in self._channels:
+			await self._handler(channel, data)
+
+	async def publish_sequenced(self, channel: str, data: bytes) -> None:
+		seq = self._counters.get(channel) or _sequence_base()
+		self._counters[channel] = seq + 1
+		await self.publish(channel, b"%d\n" % seq + data)
+
+	async def subscribe(self, channel: str) -> None:
+		self._channels.add(channel)
+
+	async def unsubscribe(self, channel: str) -> None:
+		self._channels.discard(channel)
+
+
+# --- RESP helpers -------------------------------------------------------------
+
+def _bulk(part: bytes | str) -> bytes:
+	if isinstance(part, str):
+		part = part.encode()
+	return b"$%d\r\n%s\r\n" % (len(part), part)
+
+
+def encode_command(*parts: bytes | str) -> bytes:
+	return b"*%d\r\n" % len(parts) + b"".join(_bulk(part) for part in parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+	line = await reader.readline()
+	if not line:
+		raise ConnectionError("Connection closed")
+	kind, rest = line[:1], line[1:-2]
+	if kind == b"+":
+		return rest
+	if kind == b"-":
+		raise ConnectionError(rest.decode(errors="replace"))
+	if kind == b":":
+		return int(rest)
+	if kind == b"$":
+		length = int(rest)
+		if length < 0:
+			return None
+		data = await reader.readexactly(length + 2)
+		return data[:-2]
+	if kind == b"*":
+		count = int(rest)
+		if count < 0:
+			return None
+		return [await read_reply(reader) for _ in range(count)]
+	raise ConnectionError(f"Unexpected RESP reply: {line!r}")
+
+
+class LocalBroker:
+	"""In-worker RESP pub/sub broker listening on a Unix domain socket."""
+
+	def __init__(self, path: str) -> None:
+		self.path = path
+		self._server: asyncio.AbstractServer | None = None
+		self._subscribers: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+		self._counters: Dict[bytes, int] = {}
+
+	async def start(self) -> None:
+		self._server = await asyncio.start_unix_server(self._handle_client, path=self.path)
+
+	async def close(self) -> None:
+		if self._server:
+			self._server.close()
+			await self._server.wait_closed()
+			self._server = None
+
+	async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+		channels: Set[bytes] = set()
+		try:
+			while True:
+				command = await read_reply(reader)
+				if not isinstance(command, list) or not command:
+					break
+				name = command[0].upper()
+				args = command[1:]
+				if name == b"PUBLISH" and len(args) == 2:
+					writer.write(b":%d\r\n" % self._publish(args[0], args[1]))
+				elif name == b"EVAL" and len(args) == 6 and args[0] == SEQUENCED_PUBLISH_SCRIPT.encode():
+					# Only the sequenced-publish script is understood, evaluated natively
+					key, channel, data = args[2], args[3], args[4]
+					seq = self._counters.get(key) or int(args[5]) + 1
+					self._counters[key] = seq + 1
+					self._publish(channel, b"%d\n" % seq + data)
+					writer.write(b":%d\r\n" % seq)
+				elif name == b"SUBSCRIBE":
+					for channel in args:
+						self._subscribers.setdefault(channel, set()).add(writer)
+						channels.add(channel)
+						writer.write(b"*3\r\n" + _bulk(b"subscribe") + _bulk(channel) + b":%d\r\n" % len(channels))
+				elif name == b"UNSUBSCRIBE":
+					for channel in args:
+						self._drop(channel, writer)
+						channels.discard(channel)
+						writer.write(b"*3\r\n" + _bulk(b"unsubscribe") + _bulk(channel) + b":%d\r\n" % len(channels))
+				elif name == b"PING":
+					writer.write(b"+PONG\r\n")
+				else:
+					writer.write(b"-ERR unsupported command\r\n")
+		except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+			pass
+		finally:
+			for channel in channels:
+				self._drop(channel, writer)
+			writer.close()
+
+	def _publish(self, channel: bytes, data: bytes) -> int:
+		targets = self._subscribers.get(channel, ())
+		frame = encode_command(b"message", channel, data)
+		for target in list(targets):
+			target.write(frame)
+		return len(targets)
+
+	def _drop(self, channel: bytes, writer: asyncio.StreamWriter) -> None:
+		subscribers = self._subscribers.get(channel)
+		if subscribers is not None:
+			subscribers.discard(writer)
+			if not subscribers:
+				self._subscribers.pop(channel, None)
+
+
+class RespPubSubBackend(PubSubBackend):
+	"""
+	RESP client holding two connections, since a subscribed connection may
+	not PUBLISH. Reconnects and resubscribes when the server goes away.
+	Writes wait for the socket buffer to drain, so a slow server holds up
+	publishers instead of growing the buffer without bound.
+	"""
+
+	reconnect_delay = 0.5
+	ready_timeout = 5.0
+
+	def __init__(self) -> None:
+		self._handler: MessageHandler | None = None
+		self._channels: Set[str] = set()
+		self._pub_writer: asyncio.StreamWriter | None = None
+		self._sub_writer: asyncio.StreamWriter | None = None
+		self._tasks: list[asyncio.Task] = []
+		self._ready = asyncio.Event()
+		self._closed = False
+
+	@abstractmethod
+	async def _open(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+		...
+
+	async def start(self, handler: MessageHandler) -> None:
+		self._handler = handler
+		self._tasks.append(asyncio.create_task(self._run()))
+		await self._wait_ready()
+
+	async def _wait_ready(self) -> bool:
+		try:
+			await asyncio.wait_for(self._ready.wait(), self.ready_timeout)
+			return True
+		except asyncio.TimeoutError:
+			return False
+
+	async def _run(self) -> None:
+		while not self._closed:
+			try:
+				pub_reader, self._pub_writer = await self._open()
+				sub_reader, self._sub_writer = await self._open()
+				if self._channels:
+					self._sub_writer.write(encode_command(b"SUBSCRIBE", *self._channels))
+					await self._sub_writer.drain()
+				self._ready.set()
+				tasks = {
+					asyncio.create_task(self._read_messages(sub_reader)),
+					asyncio.create_task(self._drain_replies(pub_reader)),
+				}
+				done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+				for task in pending:
+					task.cancel()
+				for task in done:
+					task.result()
+			except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+				logger.warning("Realtime pub/sub connection lost: %s", e)
+			self._ready.clear()
+			for writer in (self._pub_writer, self._sub_writer):
+				if writer:
+					writer.close()
+			self._pub_writer = self._sub_writer = None
+			if not self._closed:
+				await asyncio.sleep(self.reconnect_delay)
+
+	async def _drain_replies(self, reader: asyncio.StreamReader) -> None:
+		# PUBLISH replies (receiver counts) are not needed; keep the socket drained
+		while True:
+			await read_reply(reader)
+
+	async def _read_messages(self, reader: asyncio.StreamReader) -> None:
+		while True:
+			reply = await read_reply(reader)
+			if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+				try:
+					await self._handler(reply[1].decode(), reply[2])
+				except Exception as e:
+					logger.exception("Realtime handler error: %s", e)
+
+	async def publish(self, channel: str, data: bytes) -> None:
+		await self._send_publish(channel, encode_command(b"PUBLISH", channel, data))
+
+	async def publish_sequenced(self, channel: str, data: bytes) -> None:
+		await self._send_publish(channel, encode_command(
+			b"EVAL", SEQUENCED_PUBLISH_SCRIPT, b"1", _counter_key(channel), channel, data, str(_sequence_base() - 1),
+		))
+
+	async def _send_publish(self, channel: str, command: bytes) -> None:
+		if not await self._wait_ready():
+			logger.warning("Realtime pub/sub unavailable; dropped event on %s", channel)
+			return
+		writer = self._pub_writer
+		writer.write(command)
+		try:
+			await writer.drain()
+		except ConnectionError as e:
+			# The reconnect loop notices too; this event is lost
+			logger.warning("Realtime pub/sub connection lost; dropped event on %s: %s", channel, e)
+
+	async def subscribe(self, channel: str) -> None:
+		self._channels.add(channel)
+		await self._send_subscription(b"SUBSCRIBE", channel)
+
+	async def unsubscribe(self, channel: str) -> None:
+		self._channels.discard(channel)
+		await self._send_subscription(b"UNSUBSCRIBE", channel)
+
+	async def _send_subscription(self, command: bytes, channel: str) -> None:
+		writer = self._sub_writer
+		if writer:
+			writer.write(encode_command(command, channel))
+			try:
+				await writer.drain()
+			except ConnectionError:
+				# Resubscribed to self._channels on reconnect
+				pass
+
+	async def close(self) -> None:
+		self._closed = True
+		for task in self._tasks:
+			task.cancel()
+		for writer in (self._pub_writer, self._sub_writer):
+			if writer:
+				writer.close()
+
+
+class LocalBackend(RespPubSubBackend):
+	"""Same-host fan-out through a broker hosted by one of the workers."""
+
+	election_retry_delay = 0.05
+
+	def __init__(self, path: str) -> None:
+		super().__init__()
+		self.path = path
+		self._broker: LocalBroker | None = None
+
+	async def _open(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+		try:
+			return await asyncio.open_unix_connection(self.path)
+		except (FileNotFoundError, ConnectionRefusedError):
+			await self._elect_broker()
+			return await asyncio.open_unix_connection(self.path)
+
+	async def _elect_broker(self) -> None:
+		# Serialize the election so two workers never unlink each other's socket
+		with open(self.path + ".lock", "w") as lock:
+			# Non-blocking, retried: a blocking flock would stall this worker's event loop
+			while True:
+				try:
+					fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+					break
+				except BlockingIOError:
+					await asyncio.sleep(self.election_retry_delay)
+			try:
+				try:
+					_, writer = await asyncio.open_unix_connection(self.path)
+					writer.close()
+					return
+				except (FileNotFoundError, ConnectionRefusedError):
+					pass
+				if os.path.exists(self.path):
+					os.unlink(self.path)
+				self._broker = LocalBroker(self.path)
+				await self._broker.start()
+				logger.info("Realtime broker started on %s (pid %d)", self.path, os.getpid())
+			finally:
+				fcntl.flock(lock, fcntl.LOCK_UN)
+
+	async def close(self) -> None:
+		await super().close()
+		if self._broker:
+			await self._broker.close()
+
+
+class RedisBackend(RespPubSubBackend):
+	def __init__(self, url: str) -> None:
+		super().__init__()
+		parsed = urlparse(url)
+		self.host = parsed.hostname or "127.0.0.1"
+		self.port = parsed.port or 6379
+		self.password = parsed.password
+
+	async def _open(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+		reader, writer = await asyncio.open_connection(self.host, self.port)
+		if self.password:
+			writer.write(encode_command(b"AUTH", self.password))
+			await read_reply(reader)
+		return reader, writer
+
+
+def create_backend(kind: str | None = None) -> PubSubBackend:
+	kind = (kind or settings.REALTIME_BACKEND).lower()
+	if kind == "local":
+		return LocalBackend(settings.REALTIME_SOCKET_PATH)
+	if kind == "redis":
+		return RedisBackend(settings.REALTIME_REDIS_URL)
+	return MemoryBackend()
+
+
+class EventBus:
+	"""This worker's connection to the pub/sub backend, shared by every channel's handlers."""
+
+	def __init__(self, backend: PubSubBackend | None = None) -> None:
+		self._backend = backend
+		self._handlers: Dict[str, list[MessageHandler]] = {}
+		self._started = False
+		self._start_lock = asyncio.Lock()
+
+	@property
+	def started(self) -> bool:
+		return self._started
+
+	def listen(self, channel: str, handler: MessageHandler) -> None:
+		"""Deliver `channel`'s messages to `handler` for the life of the worker."""
+		handlers = self._handlers.setdefault(channel, [])
+		handlers.append(handler)
+		if self._started and len(handlers) == 1:
+			asyncio.get_running_loop().create_task(self._backend.subscribe(channel))
+
+	async def start(self) -> PubSubBackend:
+		if not self._started:
+			async with self._start_lock:
+				if not self._started:
+					if self._backend is None:
+						self._backend = create_backend()
+					await self._backend.start(self._dispatch)
+					for channel in self._handlers:
+						await self._backend.subscribe(channel)
+					self._started = True
+		return self._backend
+
+	async def subscribe(self, channel: str, handler: MessageHandler) -> None:
+		backend = await self.start()
+		handlers = self._handlers.setdefault(channel, [])
+		handlers.append(handler)
+		if len(handlers) == 1:
+			await backend.subscribe(channel)
+
+	async def unsubscribe(self, channel: str, handler: MessageHandler) -> None:
+		handlers = self._handlers.get(channel)
+		if not handlers or handler not in handlers:
+			return
+		handlers.remove(handler)
+		if not handlers:
+			del self._handlers[channel]
+			if self._started:
+				await self._backend.unsubscribe(channel)
+
+	async def publish(self, channel: str, data: bytes) -> None:
+		backend = await self.start()
+		await backend.publish(channel, data)
+
+	async def publish_sequenced(self, channel: str, data: bytes) -> None:
+		backend = await self.start()
+		await backend.publish_sequenced(channel, data)
+
+	async def _dispatch(self, channel: str, data: bytes) -> None:
+		for handler in list(self._handlers.get(channel, ())):
+			try:
+				await handler(channel, data)
+			except Exception as e:
+				logger.exception("Realtime handler error on %s: %s", channel, e)
+
+
+bus = EventBus()
@@ -0,0 +1,181 @@
+"""
+Login rate limiting, checked before any password is hashed.
+
+Every login attempt costs ~100-200 ms of Argon2 CPU whether or not the
+password is right, so a burst of guesses at /auth/login or
+/supabase-auth/login would otherwise spend worker CPU at the attacker's
+rate. login_limiter keeps two token buckets per attempt - one for the
+client IP, one for the email - and refuses with a 429 once either is empty.
+The IP bucket is charged first, so guesses at an already-limited email
+still use up the sender's own allowance. A login that succeeds gives its IP
+token back, so many users behind one NAT don't lock each other out.
+
+Behind a proxy the socket peer is the proxy, so client_ip() takes the
+address from X-Forwarded-For, counting TRUSTED_PROXY_HOPS entries from the
+right: those are added by our proxies, anything further left by the client.
+
+Buckets live in a fixed-size table in a memory-mapped file
+(LOGIN_RATE_LIMIT_PATH), so every worker on the host shares them; updates
+are serialized with flock. Keys are stored as 64-bit hashes, open addressing
+over a few neighbouring slots. When all of them are taken, the bucket that
+was idle longest makes way - it has usually refilled and so holds nothing
+worth keeping. With LOGIN_RATE_LIMIT_PATH empty, each worker keeps its own
+table in anonymous memory.
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from fastapi import HTTPException, Request
+from .config import settings
+from .metrics import LOGIN_ATTEMPTS, LOGIN_RATE_LIMIT_EVICTIONS
+
+# key hash (0 = empty slot), tokens, time of last update
+_SLOT = struct.Struct("<Qdd")
+# Neighbouring slots searched for a key before one is evicted
+_PROBE = 8
+
+
+class SharedTokenBuckets:
+	"""Token buckets of `capacity` tokens refilling at `per_second`, keyed by string."""
+
+	def __init__(self, name: str, capacity: float, per_second: float, slots: int, path: str | None = None) -> None:
+		self.name = name
+		self.capacity = capacity
+		self.per_second = per_second
+		self.slots = slots
+		self._lock = threading.Lock()
+		self._fd: int | None = None
+		size = slots * _SLOT.size
+		if path:
+			# The slot count is part of the name, so workers never disagree about the layout
+			self._fd = os.open(f"{path}-{name}-{slots}", os.O_RDWR | os.O_CREAT, 0o600)
+			with self._file_lock():
+				if os.fstat(self._fd).st_size < size:
+					os.ftruncate(self._fd, size)
+			self._map = mmap.mmap(self._fd, size)
+		else:
+			self._map = mmap.mmap(-1, size)
+
+	@contextmanager
+	def _file_lock(self):
+		if self._fd is None:
+			yield
+			return
+		fcntl.flock(self._fd, fcntl.LOCK_EX)
+		try:
+			yield
+		finally:
+			fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+	def _refilled(self, tokens: float, updated: float, now: float) -> float:
+		return min(self.capacity, tokens + max(0.0, now - updated) * self.per_second)
+
+	def take(self, key: str) -> float:
+		"""
+		Take one token from `key`'s bucket. Returns 0 if there was one, else
+		the seconds until there will be (nothing is taken then).
+		"""
+		key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+		start = key_hash % self.slots
+		with self._lock, self._file_lock():
+			now = time.time()
+			slot, free, oldest, oldest_updated = None, None, None, math.inf
+			for i in range(_PROBE):
+				index = (start + i) % self.slots
+				stored_hash, tokens, updated = _SLOT.unpack_from(self._map, index * _SLOT.size)
+				if stored_hash == key_hash:
+					slot = index
+					tokens = self._refilled(tokens, updated, now)
+					break
+				if free is None and (stored_hash == 0 or self._refilled(tokens, updated, now) >= self.capacity):
+					# Empty, or a bucket that has refilled: free to reuse
+					free = index
+				if updated < oldest_updated:
+					oldest, oldest_updated = index, updated
+			else:
+				if free is None:
+					LOGIN_RATE_LIMIT_EVICTIONS.labels(self.name).inc()
+				slot, tokens = oldest if free is None else free, self.capacity
+
+			if tokens < 1:
+				_SLOT.pack_into(self._map, slot * _SLOT.size, key_hash, tokens, now)
+				return (1 - tokens) / self.per_second
+			_SLOT.pack_into(self._map, slot * _SLOT.size, key_hash, tokens - 1, now)
+			return 0.0
+
+	def refund(self, key: str) -> None:
+		"""Give back a token taken from `key`'s bucket (if it is still in the table)."""
+		key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+		start = key_hash % self.slots
+		with self._lock, self._file_lock():
+			now = time.time()
+			for i in range(_PROBE):
+				index = (start + i) % self.slots
+				stored_hash, tokens, updated = _SLOT.unpack_from(self._map, index * _SLOT.size)
+				if stored_hash == key_hash:
+					tokens = min(self.capacity, self._refilled(tokens, updated, now) + 1)
+					_SLOT.pack_into(self._map, index * _SLOT.size, key_hash, tokens, now)
+					return
+
+
+def client_ip(request: Request) -> str | None:
+	"""The client's IP address, as seen by the outermost of our proxies."""
+	hops = settings.TRUSTED_PROXY_HOPS
+	if hops > 0:
+		forwarded = [
+			host.strip()
+			for header in request.headers.getlist("x-forwarded-for")
+			for host in header.split(",")
+			if host.strip()
+		]
+		if len(forwarded) >= hops:
+			return forwarded[-hops]
+	return request.client.host if request.client else None
+
+
+class LoginRateLimiter:
+	def __init__(self) -> None:
+		self._buckets: tuple[SharedTokenBuckets, SharedTokenBuckets] | None = None
+
+	def _get_buckets(self) -> tuple[SharedTokenBuckets, SharedTokenBuckets]:
+		# Opened on first use, in the worker process rather than at import
+		if self._buckets is None:
+			path = settings.LOGIN_RATE_LIMIT_PATH or None
+			slots = max(_PROBE, settings.LOGIN_RATE_LIMIT_SLOTS)
+			self._buckets = (
+				SharedTokenBuckets("ip", settings.LOGIN_RATE_IP_BURST, settings.LOGIN_RATE_IP_PER_MINUTE / 60, slots, path),
+				SharedTokenBuckets("email", settings.LOGIN_RATE_EMAIL_BURST, settings.LOGIN_RATE_EMAIL_PER_MINUTE / 60, slots, path),
+			)
+		return self._buckets
+
+	def check(self, endpoint: str, email: str, client_ip: str | None) -> None:
+		"""Admit one login attempt, or raise a 429 with Retry-After."""
+		ip_buckets, email_buckets = self._get_buckets()
+		wait = ip_buckets.take(client_ip or "unknown")
+		outcome = "limited_ip"
+		if not wait:
+			wait = email_buckets.take(email.strip().lower())
+			outcome = "limited_email"
+		if not wait:
+			LOGIN_ATTEMPTS.labels(endpoint, "admitted").inc()
+			return
+		LOGIN_ATTEMPTS.labels(endpoint, outcome).inc()
+		raise HTTPException(
+			status_code=429,
+			detail="Too many login attempts, please try again later",
+			headers={"Retry-After": str(math.ceil(wait))},
+		)
+
+	def succeeded(self, client_ip: str | None) -> None:
+		"""Give back the IP token of an admitted login that succeeded."""
+		ip_buckets, _ = self._get_buckets()
+		ip_buckets.refund(client_ip or "unknown")
+
+
+login_limiter = LoginRateLimiter()
@@ -1,37 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.orm import Session
 from sqlalchemy import update, delete
 from uuid import uuid4
 from ..database import get_db
 from .. import models
-from ..security import decode_token, create_access_token
+from ..principals import Principal, principal_cache, announce_principal_change
+from ..dependencies import require_admin
+from ..cache import trade_summary_cache, trade_participants_cache
+from ..signup_status import announce_signup_verified
+from ..websocket_manager import trade_ws_manager
+from ..services.messaging import trade_event
+from ..services.conversation_state import touch_conversation
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
-def require_admin(authorization: str | None = Header(default=None), db: Session = Depends(get_db)):
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing token")
-    token = authorization.split(" ", 1)[1]
-    user_id = decode_token(token)
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # In a real app, check user.role == 'admin'
-    # For now, we might skip this check or assume the user is admin if they can access the page
-    # But for security, let's enforce it if possible. 
-    # Since I don't have an easy way to make myself admin right now without DB access, 
-    # I will comment out the strict role check but leave the structure.
-    # if user.role != 'admin':
-    #     raise HTTPException(status_code=403, detail="Admin access required")
-    
-    return user
-
 @router.get("/users")
-def get_users(db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def get_users(db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """List all users + pending admin verifications"""
     
     try:
@@ -72,7 +56,7 @@ def get_users(db: Session = Depends(get_db), current_user: models.User = Depends
         raise HTTPException(status_code=500, detail=f"Failed to fetch users: {str(e)}")
 
 @router.post("/users/{id}/approve")
-def approve_user(id: str, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def approve_user(id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Approve a pending user"""
     pending = db.query(models.PendingSignup).filter(models.PendingSignup.id == id).first()
     if not pending:
@@ -84,6 +68,8 @@ def approve_user(id: str, db: Session = Depends(get_db), current_user: models.Us
         name=pending.name,
         email=pending.email,
         password_hash=pending.password_hash,
+        # Admin-verified signups hash their password locally; others are learned on login
+        auth_provider="local" if pending.verification_method == "admin" else None,
         role='user',
         is_verified=True,
         status='active',
@@ -94,31 +80,36 @@ def approve_user(id: str, db: Session = Depends(get_db), current_user: models.Us
     db.add(new_user)
     db.delete(pending)
     db.commit()
+    background_tasks.add_task(announce_signup_verified, new_user.email)
     
     return {"message": "User approved successfully"}
 
 @router.post("/users/{id}/suspend")
-def suspend_user(id: str, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def suspend_user(id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     user = db.query(models.User).filter(models.User.id == id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     user.status = 'suspended'
     db.commit()
+    principal_cache.invalidate(id)
+    background_tasks.add_task(announce_principal_change, id, disconnect=True)
     return {"message": "User suspended"}
 
 @router.post("/users/{id}/restore")
-def restore_user(id: str, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def restore_user(id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     user = db.query(models.User).filter(models.User.id == id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     user.status = 'active'
     db.commit()
+    principal_cache.invalidate(id)
+    background_tasks.add_task(announce_principal_change, id)
     return {"message": "User restored"}
 
 @router.delete("/users/{id}")
-def delete_user(id: str, type: str = "user", db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def delete_user(id: str, background_tasks: BackgroundTasks, type: str = "user", db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     if type == "pending":
         pending = db.query(models.PendingSignup).filter(models.PendingSignup.id == id).first()
         if pending:
@@ -131,11 +122,13 @@ def delete_user(id: str, type: str = "user", db: Session = Depends(get_db), curr
         if user:
             db.delete(user)
             db.commit()
+            principal_cache.invalidate(id)
+            background_tasks.add_task(announce_principal_change, id, disconnect=True)
             return {"message": "User deleted"}
         raise HTTPException(status_code=404, detail="User not found")
 
 @router.get("/stats")
-def get_stats(db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def get_stats(db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Get dashboard statistics"""
     try:
         total_users = db.query(models.User).count()
@@ -155,7 +148,7 @@ def get_stats(db: Session = Depends(get_db), current_user: models.User = Depends
         raise HTTPException(status_code=500, detail=f"Failed to fetch stats: {str(e)}")
 
 @router.get("/items")
-def get_items(skip: int = 0, limit: int = 20, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def get_items(skip: int = 0, limit: int = 20, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Get all items for admin view"""
     try:
         items = db.query(models.Item).offset(skip).limit(limit).all()
@@ -184,7 +177,7 @@ def get_items(skip: int = 0, limit: int = 20, db: Session = Depends(get_db), cur
         raise HTTPException(status_code=500, detail=f"Failed to fetch items: {str(e)}")
 
 @router.get("/trades")
-def get_trades(skip: int = 0, limit: int = 20, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def get_trades(skip: int = 0, limit: int = 20, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Get all trades for admin view"""
     try:
         trades = db.query(models.Trade).offset(skip).limit(limit).all()
@@ -205,7 +198,7 @@ def get_trades(skip: int = 0, limit: int = 20, db: Session = Depends(get_db), cu
 
 
 @router.delete("/items/{item_id}")
-def delete_item(item_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def delete_item(item_id: str, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Delete an item"""
     item = db.query(models.Item).filter(models.Item.id == item_id).first()
     if not item:
@@ -217,7 +210,7 @@ def delete_item(item_id: str, db: Session = Depends(get_db), current_user: model
 
 
 @router.put("/items/{item_id}/status")
-def update_item_status(item_id: str, payload: dict, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def update_item_status(item_id: str, payload: dict, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Update item status (available, traded, etc)"""
     item = db.query(models.Item).filter(models.Item.id == item_id).first()
     if not item:
@@ -232,19 +225,24 @@ def update_item_status(item_id: str, payload: dict, db: Session = Depends(get_db
 
 
 @router.delete("/trades/{trade_id}")
-def delete_trade(trade_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def delete_trade(trade_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Delete a trade"""
     trade = db.query(models.Trade).filter(models.Trade.id == trade_id).first()
     if not trade:
         raise HTTPException(status_code=404, detail="Trade not found")
     
+    participants = (trade.from_user_id, trade.to_user_id)
+    ws_payload = trade_event(trade, "deleted")
     db.delete(trade)
     db.commit()
+    trade_summary_cache.invalidate(*participants)
+    trade_participants_cache.invalidate(trade_id)
+    background_tasks.add_task(trade_ws_manager.broadcast_message, trade_id, ws_payload)
     return {"message": "Trade deleted successfully"}
 
 
 @router.put("/trades/{trade_id}/status")
-def update_trade_status(trade_id: str, payload: dict, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def update_trade_status(trade_id: str, payload: dict, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Update trade status"""
     trade = db.query(models.Trade).filter(models.Trade.id == trade_id).first()
     if not trade:
@@ -253,12 +251,25 @@ def update_trade_status(trade_id: str, payload: dict, db: Session = Depends(get_
     status = payload.get("status")
     if status:
         trade.status = status
+        touch_conversation(db, trade.id)
         db.commit()
+        trade_summary_cache.invalidate(trade.from_user_id, trade.to_user_id)
+        background_tasks.add_task(trade_ws_manager.broadcast_message, trade.id, trade_event(trade, "updated"))
     
     return {"message": "Trade status updated successfully"}
 
+@router.get("/realtime")
+def get_realtime_stats(current_user: Principal = Depends(require_admin)):
+    """Outbound queue depth of every websocket held by this worker"""
+    queues = trade_ws_manager.queue_stats()
+    return {
+        "connections": len(queues),
+        "queue_size": trade_ws_manager.queue_size,
+        "queues": queues
+    }
+
 @router.get("/recent-activity")
-def get_recent_activity(limit: int = 10, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def get_recent_activity(limit: int = 10, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Get recent activity for admin dashboard"""
     try:
         from datetime import datetime
@@ -315,7 +326,7 @@ def get_recent_activity(limit: int = 10, db: Session = Depends(get_db), current_
 
 
 @router.get("/user-reports")
-def get_user_reports(skip: int = 0, limit: int = 50, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def get_user_reports(skip: int = 0, limit: int = 50, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Get all user reports for admin review"""
     try:
         reports = db.query(models.UserReport).order_by(models.UserReport.created_at.desc()).offset(skip).limit(limit).all()
@@ -349,7 +360,7 @@ def get_user_reports(skip: int = 0, limit: int = 50, db: Session = Depends(get_d
 
 
 @router.post("/user-reports/{report_id}/resolve")
-def resolve_user_report(report_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def resolve_user_report(report_id: str, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Mark a user report as resolved"""
     report = db.query(models.UserReport).filter(models.UserReport.id == report_id).first()
     if not report:
@@ -361,7 +372,7 @@ def resolve_user_report(report_id: str, db: Session = Depends(get_db), current_u
 
 
 @router.get("/support-requests")
-def get_support_requests(skip: int = 0, limit: int = 50, db: Session = Depends(get_db), current_user: models.User = Depends(require_admin)):
+def get_support_requests(skip: int = 0, limit: int = 50, db: Session = Depends(get_db), current_user: Principal = Depends(require_admin)):
     """Get all support requests for admin review"""
     try:
         requests = db.query(models.SupportRequest).offset(skip).limit(limit).all()
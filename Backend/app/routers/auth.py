@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from sqlalchemy import update
@@ -6,7 +7,12 @@ from uuid import uuid4
 from datetime import datetime, timedelta
 from ..database import get_db
 from .. import models
-from ..security import hash_password, verify_password, create_access_token, decode_token
+from ..security import needs_rehash
+from ..tokens import issue_tokens
+from ..hashing import hash_password_async, verify_password_async, upgrade_password_hash
+from ..ratelimit import client_ip, login_limiter
+from ..principals import Principal, principal_cache, announce_principal_change
+from ..dependencies import get_current_user
 from ..email_service import send_password_reset_email, send_verification_email, generate_reset_token, generate_verification_token, generate_otp, send_otp_email
 
 
@@ -31,7 +37,7 @@ async def signup(payload: dict, db: Session = Depends(get_db)):
 			raise HTTPException(status_code=400, detail="Email already registered")
 		
 		# Generate password hash for local storage
-		password_hash = hash_password(password)
+		password_hash = await hash_password_async(password)
 		
 		verification_method = payload.get("verification_method", "email")
 		
@@ -46,6 +52,7 @@ async def signup(payload: dict, db: Session = Depends(get_db)):
 			pending.latitude = payload.get("latitude")
 			pending.longitude = payload.get("longitude")
 			pending.verification_method = verification_method
+			pending.expires_at = datetime.utcnow() + timedelta(hours=24)
 		else:
 			# Create new pending signup
 			pending = models.PendingSignup(
@@ -56,7 +63,8 @@ async def signup(payload: dict, db: Session = Depends(get_db)):
 				location=payload.get("location"),
 				latitude=payload.get("latitude"),
 				longitude=payload.get("longitude"),
-				verification_method=verification_method
+				verification_method=verification_method,
+				expires_at=datetime.utcnow() + timedelta(hours=24)
 			)
 			db.add(pending)
 		
@@ -67,7 +75,7 @@ async def signup(payload: dict, db: Session = Depends(get_db)):
 			try:
 				supabase = get_supabase_client()
 				# sign_in_with_otp sends a magic link/code
-				supabase.auth.sign_in_with_otp({"email": email})
+				await supabase.sign_in_with_otp(email)
 				
 				return {
 					"message": "Verification code sent via Supabase. Please check your email.",
@@ -92,10 +100,9 @@ async def signup(payload: dict, db: Session = Depends(get_db)):
 		raise HTTPException(status_code=500, detail=f"An error occurred during registration: {str(e)}")
 
 
-@router.post("/login")
-def login(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def _login_user(db: Session, email: str):
 	# Include location, coordinates, and status in the query
-	user = db.query(
+	return db.query(
 		models.User.id,
 		models.User.name,
 		models.User.email,
@@ -105,11 +112,21 @@ def login(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get
 		models.User.latitude,
 		models.User.longitude,
 		models.User.is_verified,
-		models.User.status
-	).filter(models.User.email == form.username).first()
+		models.User.status,
+		models.User.token_version
+	).filter(models.User.email == email).first()
+
+
+@router.post("/login")
+async def login(request: Request, background_tasks: BackgroundTasks, form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+	ip = client_ip(request)
+	login_limiter.check("auth", form.username, ip)
+	# async for the hashing executor; the query still runs in the threadpool
+	user = await run_in_threadpool(_login_user, db, form.username)
 	
-	if not user or not verify_password(form.password, user.password_hash):
+	if not user or not await verify_password_async(form.password, user.password_hash):
 		raise HTTPException(status_code=400, detail="Invalid credentials")
+	login_limiter.succeeded(ip)
 	
 	if not user.is_verified:
 		# This might happen for legacy users or if we keep is_verified=False logic
@@ -119,7 +136,10 @@ def login(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get
 	if hasattr(user, 'status') and user.status == 'suspended':
 		raise HTTPException(status_code=403, detail="Your account has been suspended. Please contact support for assistance.")
 
-	token = create_access_token(user.id)
+	if needs_rehash(user.password_hash):
+		background_tasks.add_task(upgrade_password_hash, user.id, form.password, user.password_hash)
+
+	tokens = issue_tokens(user)
 	return {
 		"user": {
 			"id": user.id, 
@@ -130,18 +150,12 @@ def login(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get
 			"latitude": getattr(user, "latitude", None),
 			"longitude": getattr(user, "longitude", None)
 		}, 
-		"token": token
+		**tokens
 	}
 
 
 @router.get("/me")
-def me(authorization: str | None = Header(default=None), db: Session = Depends(get_db)):
-	if not authorization or not authorization.lower().startswith("bearer "):
-		raise HTTPException(status_code=401, detail="Missing token")
-	token = authorization.split(" ", 1)[1]
-	user_id = decode_token(token)
-	if not user_id:
-		raise HTTPException(status_code=401, detail="Invalid token")
+def me(principal: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
 	# Include location and coordinates in the query
 	user = db.query(
 		models.User.id,
@@ -151,7 +165,7 @@ def me(authorization: str | None = Header(default=None), db: Session = Depends(g
 		models.User.location,
 		models.User.latitude,
 		models.User.longitude
-	).filter(models.User.id == user_id).first()
+	).filter(models.User.id == principal.id).first()
 	if not user:
 		raise HTTPException(status_code=404, detail="User not found")
 	return {
@@ -165,28 +179,8 @@ def me(authorization: str | None = Header(default=None), db: Session = Depends(g
 	}
 
 
-def _require_user_from_token(authorization: str | None, db: Session):
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing token")
-    token = authorization.split(" ", 1)[1]
-    user_id = decode_token(token)
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    # Use explicit column selection to avoid loading location if it doesn't exist
-    user = db.query(
-        models.User.id,
-        models.User.name,
-        models.User.email,
-        models.User.password_hash
-    ).filter(models.User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
-
-
 @router.put("/profile")
-def update_profile(payload: dict, authorization: str | None = Header(default=None), db: Session = Depends(get_db)):
-    user_row = _require_user_from_token(authorization, db)
+def update_profile(payload: dict, background_tasks: BackgroundTasks, user_row: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     name = payload.get("name")
     location = payload.get("location")
     latitude = payload.get("latitude")
@@ -211,6 +205,8 @@ def update_profile(payload: dict, authorization: str | None = Header(default=Non
     stmt = update(models.User).where(models.User.id == user_row.id).values(**update_values)
     db.execute(stmt)
     db.commit()
+    principal_cache.invalidate(user_row.id)
+    background_tasks.add_task(announce_principal_change, user_row.id)
     
     # Query back with location and coordinates included
     updated_user = db.query(
@@ -232,22 +228,43 @@ def update_profile(payload: dict, authorization: str | None = Header(default=Non
     }
 
 
+def _current_password_hash(db: Session, user_id: str) -> str | None:
+    return db.query(models.User.password_hash).filter(models.User.id == user_id).scalar()
+
+
+def _store_password_hash(db: Session, user_id: str, password_hash: str):
+    # Update using SQL UPDATE to avoid loading full model with location column
+    # Bumping token_version signs out every other session
+    stmt = update(models.User).where(models.User.id == user_id).values(
+        password_hash=password_hash,
+        token_version=models.User.token_version + 1
+    )
+    db.execute(stmt)
+    db.commit()
+    return db.query(
+        models.User.id,
+        models.User.role,
+        models.User.status,
+        models.User.name,
+        models.User.token_version
+    ).filter(models.User.id == user_id).first()
+
+
 @router.post("/change-password")
-def change_password(payload: dict, authorization: str | None = Header(default=None), db: Session = Depends(get_db)):
-    user_row = _require_user_from_token(authorization, db)
+async def change_password(payload: dict, user_row: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     old_password = payload.get("old_password")
     new_password = payload.get("new_password")
     if not old_password or not new_password:
         raise HTTPException(status_code=400, detail="Old and new passwords are required")
     
-    if not verify_password(old_password, user_row.password_hash):
+    # async for the hashing executor; queries still run in the threadpool
+    current_hash = await run_in_threadpool(_current_password_hash, db, user_row.id)
+    if not await verify_password_async(old_password, current_hash or ""):
         raise HTTPException(status_code=400, detail="Old password is incorrect")
-    # Update using SQL UPDATE to avoid loading full model with location column
-    from sqlalchemy import update
-    stmt = update(models.User).where(models.User.id == user_row.id).values(password_hash=hash_password(new_password))
-    db.execute(stmt)
-    db.commit()
-    return {"message": "Password updated"}
+    password_hash = await hash_password_async(new_password)
+    user = await run_in_threadpool(_store_password_hash, db, user_row.id, password_hash)
+    await announce_principal_change(user_row.id)
+    return {"message": "Password updated", **issue_tokens(user)}
 
 
 @router.get("/user/{user_id}")
@@ -325,13 +342,16 @@ async def reset_password(payload: dict, db: Session = Depends(get_db)):
 		raise HTTPException(status_code=400, detail="Reset token has expired")
 	
 	# Update password and clear reset token
+	password_hash = await hash_password_async(new_password)
 	stmt = update(models.User).where(models.User.id == user.id).values(
-		password_hash=hash_password(new_password),
+		password_hash=password_hash,
 		password_reset_token=None,
-		password_reset_expires=None
+		password_reset_expires=None,
+		token_version=models.User.token_version + 1
 	)
 	db.execute(stmt)
 	db.commit()
+	await announce_principal_change(user.id)
 	
 	return {"message": "Password has been reset successfully"}
 
@@ -349,9 +369,9 @@ async def verify_email(payload: dict, db: Session = Depends(get_db)):
 	try:
 		supabase = get_supabase_client()
 		# Verify the OTP
-		res = supabase.auth.verify_otp({"email": email, "token": otp, "type": "email"})
+		auth_user = await supabase.verify_otp(email, otp, "email")
 		
-		if not res.user:
+		if not auth_user:
 			raise HTTPException(status_code=400, detail="Invalid OTP")
 			
 	except Exception as e:
@@ -371,6 +391,7 @@ async def verify_email(payload: dict, db: Session = Depends(get_db)):
 			name=pending.name,
 			email=pending.email,
 			password_hash=pending.password_hash,
+			auth_provider="local",
 			role='user',
 			is_verified=True,
 			location=pending.location,
@@ -383,12 +404,12 @@ async def verify_email(payload: dict, db: Session = Depends(get_db)):
 		db.delete(pending)
 		db.commit()
 		
-		# Generate token
-		token = create_access_token(user_id)
+		# Generate tokens
+		tokens = issue_tokens(new_user)
 		
 		return {
 			"message": "Email verified and account created successfully",
-			"token": token,
+			**tokens,
 			"user": {
 				"id": new_user.id,
 				"name": new_user.name,
@@ -407,6 +428,8 @@ async def verify_email(payload: dict, db: Session = Depends(get_db)):
 		models.User.email,
 		models.User.is_verified,
 		models.User.role,
+		models.User.status,
+		models.User.token_version,
 		models.User.location,
 		models.User.latitude,
 		models.User.longitude
@@ -427,11 +450,11 @@ async def verify_email(payload: dict, db: Session = Depends(get_db)):
 	db.execute(stmt)
 	db.commit()
 	
-	token = create_access_token(user.id)
+	tokens = issue_tokens(user)
 	
 	return {
 		"message": "Email verified successfully",
-		"token": token,
+		**tokens,
 		"user": {
 			"id": user.id,
 			"name": user.name,
@@ -454,7 +477,7 @@ async def resend_verification(payload: dict, db: Session = Depends(get_db)):
 	
 	try:
 		supabase = get_supabase_client()
-		supabase.auth.sign_in_with_otp({"email": email})
+		await supabase.sign_in_with_otp(email)
 		return {"message": "Verification code sent."}
 	except Exception as e:
 		print(f"Failed to resend Supabase OTP: {str(e)}")
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from ..database import SessionLocal
+from ..dependencies import connection_principal
+from ..websocket_manager import trade_ws_manager, trade_channel, user_channel, PING_EVENT
+from ..services.conversation_state import conversations_changed_since
+from ..services.messaging import resync_snapshot
+from ..services.trade_access import load_counterparts, counterpart
+
+router = APIRouter(prefix="/events", tags=["realtime"])
+
+# Client reconnect delay advertised to EventSource
+RETRY_MS = 3000
+# Margin for clock differences between workers when resuming by time
+RESUME_CLOCK_SKEW = timedelta(seconds=2)
+# Trades resynced from the database on resume; beyond this the client is told to refetch
+RESUME_MAX_TRADES = 20
+
+
+class SSEConnection:
+	"""
+	Stands in for a WebSocket in trade_ws_manager, so an event stream shares
+	the broadcast path, outbound queue, heartbeat and connection caps of the
+	sockets. Frames handed to send_text are picked up by the response body.
+	"""
+
+	def __init__(self) -> None:
+		# One slot: a stalled client backs up into the writer's bounded queue
+		self._frames: asyncio.Queue = asyncio.Queue(maxsize=1)
+		self.closed = False
+
+	async def accept(self) -> None:
+		pass
+
+	async def send_text(self, text: str) -> None:
+		if self.closed:
+			raise RuntimeError("Event stream closed")
+		await self._frames.put(text)
+
+	async def close(self, code: int = 1000, reason: str = "") -> None:
+		self.closed = True
+		try:
+			self._frames.put_nowait(None)
+		except asyncio.QueueFull:
+			pass
+
+	async def next_frame(self) -> str | None:
+		if self.closed and self._frames.empty():
+			return None
+		return await self._frames.get()
+
+
+def _event_id(event: dict) -> str | None:
+	trade_id = event.get("tradeId")
+	seq = event.get("seq")
+	if not trade_id or seq is None:
+		return None
+	# Trade, its sequence number and when it was sent; see _resume()
+	return f"{trade_id}:{seq}:{int(time.time() * 1000)}"
+
+
+def _render(text: str) -> str:
+	if text == PING_EVENT:
+		return ": ping\n\n"
+	event = json.loads(text)
+	if event.get("type") == "replay":
+		# Unpack so every replayed event carries its own id
+		return "".join(_frame(json.dumps(e, separators=(",", ":")), _event_id(e)) for e in event["events"])
+	return _frame(text, _event_id(event))
+
+
+def _frame(data: str, event_id: str | None) -> str:
+	if event_id:
+		return f"id: {event_id}\ndata: {data}\n\n"
+	return f"data: {data}\n\n"
+
+
+def _parse_event_id(value: str | None) -> tuple[str, int, datetime] | None:
+	try:
+		trade_id, seq, sent_ms = value.rsplit(":", 2)
+		sent_at = datetime.fromtimestamp(int(sent_ms) / 1000, timezone.utc).replace(tzinfo=None)
+		return trade_id, int(seq), sent_at
+	except (AttributeError, ValueError, OverflowError, OSError):
+		return None
+
+
+@router.get("/stream")
+async def event_stream(
+	trade_id: str | None = Query(default=None),
+	token: str | None = Query(default=None),
+	last_event_id: str | None = Query(default=None),
+	authorization: str | None = Header(default=None),
+	last_event_id_header: str | None = Header(default=None, alias="Last-Event-ID"),
+):
+	"""
+	Server-Sent Events for clients that cannot open websockets: the same
+	message, typing, read and trade events as /ws/user (or /ws/trades/{id}
+	with `?trade_id=`), one JSON object per `data:` line.
+
+	Authenticate with `Authorization: Bearer` or, since EventSource cannot
+	set headers, `?token=`. Each trade event has an id; on reconnect the
+	browser sends it back as Last-Event-ID (or pass `?last_event_id=`) and
+	the stream first replays what was missed, as individual events or as
+	{"type": "resync"} snapshots when this worker no longer buffers them.
+	"""
+	if not token and authorization and authorization.lower().startswith("bearer "):
+		token = authorization.split(" ", 1)[1]
+	principal = await run_in_threadpool(connection_principal, token)
+	if not principal:
+		raise HTTPException(status_code=401, detail="Invalid or expired token")
+	user_id = principal.id
+
+	if trade_id:
+		other_user_id = await counterpart(trade_id, user_id)
+		if not other_user_id:
+			raise HTTPException(status_code=404, detail="Trade not found")
+		counterparts = {trade_id: other_user_id}
+	else:
+		counterparts = await run_in_threadpool(load_counterparts, user_id)
+	trade_ids = list(counterparts)
+
+	connection = SSEConnection()
+	if not await trade_ws_manager.register(connection, user_id):
+		raise HTTPException(status_code=429, detail="Too many connections")
+
+	try:
+		if not trade_id:
+			await trade_ws_manager.subscribe(connection, user_channel(user_id))
+		resume = _parse_event_id(last_event_id_header or last_event_id)
+		replayed = False
+		for tid in trade_ids:
+			if resume and resume[0] == tid:
+				replayed = await trade_ws_manager.subscribe(connection, trade_channel(tid), resume[1])
+			else:
+				await trade_ws_manager.subscribe(connection, trade_channel(tid))
+		if resume:
+			await _resume(connection, user_id, trade_id, resume, replayed)
+		await trade_ws_manager.send_personal(connection, trade_ws_manager.presence.snapshot_event(set(counterparts.values())))
+	except Exception:
+		await trade_ws_manager.unregister(connection)
+		raise
+
+	return StreamingResponse(
+		_stream(connection),
+		media_type="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+
+async def _resume(
+	connection: SSEConnection,
+	user_id: str,
+	stream_trade_id: str | None,
+	resume: tuple[str, int, datetime],
+	replayed: bool,
+) -> None:
+	"""
+	Catch up trades whose events were not replayed from a buffer. Only the
+	last event's trade has a known sequence number; for the others, the
+	time the last event was sent bounds what was missed, so trades changed
+	since then are resynced from the database.
+	"""
+	last_trade_id, _, sent_at = resume
+	since = sent_at - RESUME_CLOCK_SKEW
+
+	def _changed() -> list[str]:
+		db = SessionLocal()
+		try:
+			return conversations_changed_since(db, user_id, since)
+		finally:
+			db.close()
+
+	changed = [stream_trade_id] if stream_trade_id else await run_in_threadpool(_changed)
+	pending = [tid for tid in changed if not (tid == last_trade_id and replayed)]
+	if len(pending) > RESUME_MAX_TRADES:
+		await trade_ws_manager.send_personal(connection, {"type": "reset", "detail": "Too many changes to resume; refetch conversations"})
+		return
+	for tid in pending:
+		seq = trade_ws_manager.latest_seq(tid)
+		snapshot = await run_in_threadpool(resync_snapshot, tid, None, since)
+		if snapshot is not None:
+			await trade_ws_manager.send_personal(connection, {"type": "resync", "tradeId": tid, "seq": seq, **snapshot})
+
+
+async def _stream(connection: SSEConnection):
+	try:
+		yield f"retry: {RETRY_MS}\n\n"
+		while True:
+			text = await connection.next_frame()
+			if text is None:
+				break
+			yield _render(text)
+			# The previous frame was taken by the server; counts as activity for idle reaping
+			trade_ws_manager.touch(connection)
+	finally:
+		# The response task may be cancelled on disconnect; don't await in it
+		asyncio.get_running_loop().create_task(trade_ws_manager.unregister(connection))
@@ -6,6 +6,7 @@ from uuid import uuid4
 from ..database import get_db
 from .. import models, schemas
 from ..dependencies import get_current_user
+from ..principals import Principal
 from datetime import datetime, timezone
 
 
@@ -128,7 +129,7 @@ def list_items(
 def create_item(
     payload: schemas.ItemCreate, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     try:
         obj = models.Item(
@@ -180,7 +181,7 @@ def update_item(
     item_id: str, 
     payload: schemas.ItemUpdate, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     obj = db.query(models.Item).filter(models.Item.id == item_id).first()
     if not obj:
@@ -207,7 +208,7 @@ def update_item(
 def delete_item(
     item_id: str, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     obj = db.query(models.Item).filter(models.Item.id == item_id).first()
     if not obj:
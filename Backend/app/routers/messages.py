@@ -1,23 +1,42 @@
 from fastapi import APIRouter, Depends, Query, BackgroundTasks, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, or_, func
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import desc, or_
 from uuid import uuid4
 from datetime import datetime, timezone
 from ..database import get_db
 from .. import models, schemas
 from ..websocket_manager import trade_ws_manager
 from ..dependencies import get_current_user
+from ..principals import Principal
+from ..services.conversation_state import record_message, missing_conversations
+from ..services.messaging import message_event, read_event, mark_read, message_cursor_filter
 
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
 
-@router.get("/", response_model=list[schemas.Message])
+MESSAGE_PAGE_SIZE = 50
+
+
+@router.get("/", response_model=schemas.MessagePage)
 def list_messages(
     trade_id: str = Query(...), 
+    before: str | None = Query(default=None, description="Message id; return messages older than it"),
+    after: str | None = Query(default=None, description="Message id; return messages newer than it"),
+    limit: int = Query(default=MESSAGE_PAGE_SIZE, ge=1, le=200),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
+    """
+    One page of a trade's messages, always returned oldest-first.
+    Without a cursor this is the latest page; pass `next_before` as `before`
+    to scroll back, or `next_after` as `after` to catch up. `has_more` says
+    whether there is another page in that direction.
+    Pages are keyed on (created_at, id) so they are stable under inserts.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+
     # Authorization: Only participants or admin can view messages
     if current_user.role != 'admin':
         trade = db.query(models.Trade).filter(models.Trade.id == trade_id).first()
@@ -27,87 +46,125 @@ def list_messages(
         if trade.from_user_id != current_user.id and trade.to_user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to view these messages")
 
-    return (
-        db.query(models.Message)
-        .where(models.Message.trade_id == trade_id)
-        .order_by(models.Message.created_at.asc())
+    q = db.query(models.Message).where(models.Message.trade_id == trade_id)
+
+    cursor_id = before or after
+    if cursor_id:
+        condition = message_cursor_filter(db, trade_id, cursor_id, newer=bool(after))
+        if condition is None:
+            raise HTTPException(status_code=400, detail="Invalid message cursor")
+        q = q.filter(condition)
+
+    # One row past the page tells whether there is another
+    if after:
+        page = (
+            q.order_by(models.Message.created_at.asc(), models.Message.id.asc())
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(page) > limit
+        page = page[:limit]
+        return {
+            "messages": page,
+            "has_more": has_more,
+            "next_after": page[-1].id if has_more else None,
+        }
+
+    page = (
+        q.order_by(models.Message.created_at.desc(), models.Message.id.desc())
+        .limit(limit + 1)
         .all()
     )
+    has_more = len(page) > limit
+    page = page[:limit]
+    page.reverse()
+    return {
+        "messages": page,
+        "has_more": has_more,
+        "next_before": page[0].id if has_more else None,
+    }
 
 
 @router.get("/conversations")
 def list_conversations(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     user_id = current_user.id
-    
-    # Find trades where user participates
-    trades = (
-        db.query(models.Trade)
-        .filter(or_(models.Trade.from_user_id == user_id, models.Trade.to_user_id == user_id))
-        .order_by(desc(models.Trade.updated_at))
+    from_item = aliased(models.Item)
+    to_item = aliased(models.Item)
+    cs = models.ConversationState
+
+    # One range scan over the user's inbox rows; everything else is a PK join
+    rows = (
+        db.query(
+            cs,
+            models.Trade.from_user_id,
+            models.User.name.label("other_name"),
+            from_item.title.label("from_item_title"),
+            to_item.title.label("to_item_title"),
+        )
+        .join(models.Trade, models.Trade.id == cs.trade_id)
+        .join(models.User, models.User.id == cs.other_user_id)
+        .outerjoin(from_item, from_item.id == models.Trade.from_item_id)
+        .outerjoin(to_item, to_item.id == models.Trade.to_item_id)
+        .filter(cs.user_id == user_id)
+        .order_by(desc(cs.updated_at))
         .all()
     )
 
-    # Preload referenced items to avoid N+1 queries
-    item_ids = {t.from_item_id for t in trades if t.from_item_id} | {t.to_item_id for t in trades if t.to_item_id}
-    item_map = {}
-    if item_ids:
-        for item in db.query(models.Item.id, models.Item.title).filter(models.Item.id.in_(item_ids)).all():
-            item_map[item.id] = item.title
-
-    convs = []
-    for t in trades:
-        other_id = t.to_user_id if t.from_user_id == user_id else t.from_user_id
-        other = (
+    # Trades with no inbox row yet (created before the table was backfilled)
+    # are summarized from messages, so they still show up
+    missing = missing_conversations(db, user_id)
+    if missing:
+        names = dict(
             db.query(models.User.id, models.User.name)
-            .filter(models.User.id == other_id)
-            .first()
+            .filter(models.User.id.in_({state.other_user_id for state in missing}))
+            .all()
         )
-        if not other:
-            continue
-
-        # last message
-        last_msg = (
-            db.query(models.Message)
-            .filter(models.Message.trade_id == t.id)
-            .order_by(desc(models.Message.created_at))
-            .first()
-        )
-
-        # unread messages for current user
-        unread_count = (
-            db.query(models.Message)
-            .filter(
-                models.Message.trade_id == t.id,
-                models.Message.receiver_id == user_id,
-                models.Message.is_read == False,  # noqa: E712
+        trades = {
+            row.id: row
+            for row in (
+                db.query(
+                    models.Trade.id,
+                    models.Trade.from_user_id,
+                    from_item.title.label("from_item_title"),
+                    to_item.title.label("to_item_title"),
+                )
+                .outerjoin(from_item, from_item.id == models.Trade.from_item_id)
+                .outerjoin(to_item, to_item.id == models.Trade.to_item_id)
+                .filter(models.Trade.id.in_([state.trade_id for state in missing]))
+                .all()
             )
-            .count()
-        )
+        }
+        rows = list(rows) + [
+            (
+                state,
+                trades[state.trade_id].from_user_id,
+                names.get(state.other_user_id),
+                trades[state.trade_id].from_item_title,
+                trades[state.trade_id].to_item_title,
+            )
+            for state in missing
+        ]
+        rows.sort(key=lambda row: row[0].updated_at.replace(tzinfo=None), reverse=True)
 
-        trade_item_title = None
-        if user_id == t.from_user_id:
-            trade_item_title = item_map.get(t.from_item_id) or item_map.get(t.to_item_id)
+    convs = []
+    for state, from_user_id, other_name, from_item_title, to_item_title in rows:
+        if user_id == from_user_id:
+            trade_item_title = from_item_title or to_item_title
         else:
-            trade_item_title = item_map.get(t.to_item_id) or item_map.get(t.from_item_id)
-
-        last_msg_time = ''
-        if last_msg:
-            if last_msg.created_at:
-                last_msg_time = last_msg.created_at.isoformat()
-            else:
-                # Fallback to trade timestamps so list ordering still works
-                last_msg_time = t.updated_at.isoformat() if t.updated_at else ''
+            trade_item_title = to_item_title or from_item_title
 
         convs.append({
-            "tradeId": t.id,
-            "otherUser": {"id": other.id, "name": other.name},
+            "tradeId": state.trade_id,
+            "otherUser": {"id": state.other_user_id, "name": other_name},
             "tradeItemTitle": trade_item_title or '',
-            "lastMessage": last_msg.content if last_msg else '',
-            "lastMessageTime": last_msg_time,
-            "unreadCount": unread_count,
+            "lastMessage": state.last_message_preview or '',
+            "lastMessageTime": state.last_message_at.isoformat() if state.last_message_at else '',
+            "unreadCount": state.unread_count or 0,
+            # In-memory registry of live sockets, no query
+            "online": trade_ws_manager.presence.is_online(state.other_user_id),
         })
     return convs
 
@@ -117,7 +174,7 @@ def create_message(
     payload: schemas.MessageCreate, 
     background_tasks: BackgroundTasks, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     # Verify trade exists and user is participant
     trade = db.query(models.Trade).filter(models.Trade.id == payload.trade_id).first()
@@ -137,6 +194,7 @@ def create_message(
         trade_id=payload.trade_id,
         sender_id=current_user.id,
         receiver_id=payload.receiver_id,
+        content=payload.content,
         is_read=False,
         created_at=datetime.now(timezone.utc),
     )
@@ -144,25 +202,49 @@ def create_message(
     
     # Update trade updated_at to surface conversation
     trade.updated_at = datetime.now(timezone.utc)
+
+    # Keep both participants' inbox rows in the same transaction
+    record_message(db, obj, trade)
     
     db.commit()
     db.refresh(obj)
 
-    ws_payload = {
-        "type": "message",
-        "message": {
-            "id": obj.id,
-            "tradeId": obj.trade_id,
-            "senderId": obj.sender_id,
-            "receiverId": obj.receiver_id,
-            "content": obj.content,
-            "isRead": obj.is_read,
-            "isRead": obj.is_read,
-            "createdAt": obj.created_at.isoformat() if obj.created_at else datetime.now(timezone.utc).isoformat()
-        }
-    }
+    ws_payload = message_event(obj)
     background_tasks.add_task(trade_ws_manager.broadcast_message, obj.trade_id, ws_payload)
     return obj
 
 
+@router.post("/read")
+def mark_messages_read(
+    payload: schemas.MessageRead,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Mark every message the current user received in a trade, up to and
+    including `up_to_message_id` (or all of them), as read with one UPDATE,
+    then echo a read receipt to the trade's websocket.
+    """
+    trade = db.query(models.Trade).filter(models.Trade.id == payload.trade_id).first()
+    if not trade:
+        raise HTTPException(status_code=404, detail="Trade not found")
+
+    if current_user.id not in [trade.from_user_id, trade.to_user_id]:
+        raise HTTPException(status_code=403, detail="You are not a participant in this trade")
+
+    updated, up_to = mark_read(
+        db,
+        payload.trade_id,
+        current_user.id,
+        [payload.up_to_message_id] if payload.up_to_message_id else None,
+    )
+    if updated < 0:
+        raise HTTPException(status_code=404, detail="Message not found")
+    db.commit()
+
+    if updated:
+        ws_payload = read_event(payload.trade_id, current_user.id, up_to)
+        background_tasks.add_task(trade_ws_manager.broadcast_message, payload.trade_id, ws_payload)
 
+    return {"trade_id": payload.trade_id, "updated": updated}
@@ -1,34 +1,218 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
-from sqlalchemy.orm import Session
-from ..database import get_db
-from .. import models
-from ..websocket_manager import trade_ws_manager
+import json
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from fastapi.concurrency import run_in_threadpool
+from ..database import SessionLocal
+from ..dependencies import connection_principal
+from ..websocket_manager import trade_ws_manager, trade_channel, user_channel, typing_throttle
+from ..services.messaging import message_writer, PendingMessage, mark_read, read_event, resync_snapshot
+from ..services.trade_access import load_counterparts, counterpart
 
 router = APIRouter(prefix="/ws", tags=["realtime"])
 
+MAX_MESSAGE_LENGTH = 5000
+
 
 @router.websocket("/trades/{trade_id}")
 async def trade_messages_socket(
 	websocket: WebSocket,
 	trade_id: str,
-	user_id: str = Query(...),
-	db: Session = Depends(get_db)
+	token: str | None = Query(default=None),
+	since_seq: int | None = Query(default=None),
+	after: str | None = Query(default=None)
 ):
-	trade = (
-		db.query(models.Trade)
-		.filter(models.Trade.id == trade_id)
-		.first()
-	)
+	"""
+	Trade chat socket. Authenticate once with `?token=<access token>`; the
+	socket then accepts typed frames:
+
+	- {"type": "send", "content": "...", "clientId": "..."} -> persisted, acked
+	  with {"type": "ack", "clientId", "message"} and broadcast to the trade
+	- {"type": "typing", "isTyping": true} (broadcast at most once per
+	  TYPING_THROTTLE_MS, the latest state winning)
+	- {"type": "read", "messageIds": [...]} (marks up to the newest of them)
+	- {"type": "resume", "sinceSeq": n, "after": "<message id>"} (see below)
+	- {"type": "pong"} in reply to the server's {"type": "ping"}; a socket that
+	  sends nothing for WS_IDLE_TIMEOUT seconds is closed
+
+	Trade events carry a per-trade "seq". To reconnect without refetching,
+	pass the last seen one as `?since_seq=` (and the last message id as
+	`?after=`): the missed events arrive as one {"type": "replay", "events"}
+	event, or, if this worker no longer holds them, as {"type": "resync",
+	"trade", "messages", "hasMore", "seq"} built from the database. Clients
+	dedupe by seq and message id.
+
+	Sockets without a valid token (including the old `?user_id=` form) are
+	closed with 1008.
+	"""
+	principal = await run_in_threadpool(connection_principal, token)
+	if not principal:
+		await websocket.close(code=1008)
+		return
+	user_id = principal.id
+
+	# No Depends(get_db): a session held for the socket's lifetime would pin a pooled connection
+	other_user_id = await counterpart(trade_id, user_id)
+	if not other_user_id:
+		await websocket.close(code=1008)
+		return
+
+	if not await trade_ws_manager.register(websocket, user_id):
+		return
+	try:
+		replayed = await trade_ws_manager.subscribe(websocket, trade_channel(trade_id), since_seq)
+		if since_seq is not None and not replayed:
+			await _resync(websocket, trade_id, after)
+		await trade_ws_manager.send_personal(websocket, {
+			"type": "presence",
+			"tradeId": trade_id,
+			"userId": other_user_id,
+			"online": trade_ws_manager.presence.is_online(other_user_id),
+		})
+
+		while True:
+			raw = await websocket.receive_text()
+			trade_ws_manager.touch(websocket)
+			frame = await _parse_frame(websocket, raw)
+			if frame is not None:
+				await _dispatch(websocket, trade_id, user_id, other_user_id, frame)
+	except WebSocketDisconnect:
+		pass
+	finally:
+		await trade_ws_manager.unregister(websocket)
 
-	if not trade or user_id not in (trade.from_user_id, trade.to_user_id):
+
+@router.websocket("/user")
+async def user_socket(websocket: WebSocket, token: str | None = Query(default=None)):
+	"""
+	One socket for all of a user's trades. Authenticate once with
+	`?token=<access token>`; the socket receives message, typing, read and
+	trade events for every trade the user is part of, including trades
+	created after it connected, starting with a {"type": "presence_snapshot"}
+	of the user's counterparts. Frames are the same as on /ws/trades/{id}
+	plus a "tradeId" field saying which trade they are for; send a "resume"
+	frame per trade after reconnecting.
+	"""
+	principal = await run_in_threadpool(connection_principal, token)
+	if not principal:
 		await websocket.close(code=1008)
 		return
+	user_id = principal.id
 
-	await trade_ws_manager.connect(trade_id, websocket)
+	# Participant lookups use short-lived sessions, so the socket never pins a pooled connection
+	counterparts = await run_in_threadpool(load_counterparts, user_id)
 
+	if not await trade_ws_manager.register(websocket, user_id):
+		return
 	try:
+		await trade_ws_manager.subscribe(websocket, user_channel(user_id))
+		for trade_id in counterparts:
+			await trade_ws_manager.subscribe(websocket, trade_channel(trade_id))
+		await trade_ws_manager.send_personal(websocket, trade_ws_manager.presence.snapshot_event(set(counterparts.values())))
+
 		while True:
-			await websocket.receive_text()
+			raw = await websocket.receive_text()
+			trade_ws_manager.touch(websocket)
+			frame = await _parse_frame(websocket, raw)
+			if frame is None or frame.get("type") == "pong":
+				continue
+			trade_id = frame.get("tradeId")
+			if not isinstance(trade_id, str):
+				await trade_ws_manager.send_personal(websocket, {"type": "error", "clientId": frame.get("clientId"), "detail": "tradeId is required"})
+				continue
+			if trade_id not in counterparts:
+				# A trade created since connecting: verify and remember it
+				other_user_id = await counterpart(trade_id, user_id)
+				if not other_user_id:
+					await trade_ws_manager.send_personal(websocket, {"type": "error", "clientId": frame.get("clientId"), "detail": "Trade not found"})
+					continue
+				counterparts[trade_id] = other_user_id
+				await trade_ws_manager.subscribe(websocket, trade_channel(trade_id))
+			await _dispatch(websocket, trade_id, user_id, counterparts[trade_id], frame)
 	except WebSocketDisconnect:
-		await trade_ws_manager.disconnect(trade_id, websocket)
+		pass
+	finally:
+		await trade_ws_manager.unregister(websocket)
+
+
+async def _parse_frame(websocket: WebSocket, raw: str) -> dict | None:
+	try:
+		frame = json.loads(raw)
+	except ValueError:
+		await trade_ws_manager.send_personal(websocket, {"type": "error", "detail": "Invalid JSON"})
+		return None
+	return frame if isinstance(frame, dict) else None
+
+
+async def _dispatch(websocket: WebSocket, trade_id: str, user_id: str, other_user_id: str, frame: dict) -> None:
+	frame_type = frame.get("type")
+	if frame_type == "send":
+		await _handle_send(websocket, trade_id, user_id, other_user_id, frame)
+	elif frame_type == "typing":
+		await typing_throttle.submit(trade_id, user_id, bool(frame.get("isTyping")))
+	elif frame_type == "read":
+		await _handle_read(trade_id, user_id, frame)
+	elif frame_type == "resume":
+		await _handle_resume(websocket, trade_id, frame)
+
+
+async def _handle_send(websocket: WebSocket, trade_id: str, user_id: str, receiver_id: str, frame: dict) -> None:
+	client_id = frame.get("clientId")
+	content = frame.get("content")
+	if not isinstance(content, str) or not content.strip() or len(content) > MAX_MESSAGE_LENGTH:
+		await trade_ws_manager.send_personal(websocket, {"type": "error", "clientId": client_id, "detail": "Invalid message content"})
+		return
+
+	try:
+		message = await message_writer.submit(PendingMessage(
+			trade_id=trade_id,
+			sender_id=user_id,
+			receiver_id=receiver_id,
+			content=content,
+		))
+	except Exception as e:
+		print(f"Websocket send failed for trade {trade_id}: {e}")
+		await trade_ws_manager.send_personal(websocket, {"type": "error", "clientId": client_id, "detail": "Failed to send message"})
+		return
+
+	await trade_ws_manager.send_personal(websocket, {"type": "ack", "clientId": client_id, "message": message})
+	await trade_ws_manager.broadcast_message(trade_id, {"type": "message", "tradeId": trade_id, "message": message})
 
+
+async def _handle_read(trade_id: str, user_id: str, frame: dict) -> None:
+	message_ids = frame.get("messageIds")
+	if message_ids is None and frame.get("messageId"):
+		message_ids = [frame["messageId"]]
+	if message_ids is not None and (not isinstance(message_ids, list) or not message_ids):
+		return
+
+	def _mark() -> tuple[int, str | None]:
+		db = SessionLocal()
+		try:
+			marked = mark_read(db, trade_id, user_id, message_ids)
+			db.commit()
+			return marked
+		finally:
+			db.close()
+
+	updated, up_to = await run_in_threadpool(_mark)
+	if updated > 0:
+		await trade_ws_manager.broadcast_message(trade_id, read_event(trade_id, user_id, up_to))
+
+
+async def _handle_resume(websocket: WebSocket, trade_id: str, frame: dict) -> None:
+	since_seq = frame.get("sinceSeq")
+	if not isinstance(since_seq, int) or isinstance(since_seq, bool):
+		since_seq = None
+	after = frame.get("after") if isinstance(frame.get("after"), str) else None
+	if since_seq is not None and await trade_ws_manager.subscribe(websocket, trade_channel(trade_id), since_seq):
+		return
+	await _resync(websocket, trade_id, after)
+
+
+async def _resync(websocket: WebSocket, trade_id: str, after: str | None) -> None:
+	# Taken before the query: events up to this seq were committed before being published
+	seq = trade_ws_manager.latest_seq(trade_id)
+	snapshot = await run_in_threadpool(resync_snapshot, trade_id, after)
+	if snapshot is None:
+		await trade_ws_manager.send_personal(websocket, {"type": "error", "tradeId": trade_id, "detail": "Cannot resume trade"})
+		return
+	await trade_ws_manager.send_personal(websocket, {"type": "resync", "tradeId": trade_id, "seq": seq, **snapshot})
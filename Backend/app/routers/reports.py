@@ -1,33 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 import uuid
 from .. import models
 from ..database import get_db
-from ..security import decode_token
+from ..dependencies import get_current_user
+from ..principals import Principal
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 
-def get_current_user(authorization: str | None = Header(default=None), db: Session = Depends(get_db)):
-    """Get current authenticated user"""
-    if not authorization or not authorization.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid token")
-    
-    token = authorization.split(" ", 1)[1]
-    user_id = decode_token(token)
-    
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    return user
-
-
-
 class ReportUserRequest(BaseModel):
     reported_user_id: str
     reason: str  # 'spam', 'inappropriate', 'scam', 'harassment', 'other'
@@ -38,7 +20,7 @@ class ReportUserRequest(BaseModel):
 def report_user(
     report: ReportUserRequest,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Report another user"""
     # Check if reported user exists
@@ -69,7 +51,7 @@ def report_user(
 @router.get("/my-reports")
 def get_my_reports(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get reports made by current user"""
     reports = db.query(models.UserReport).filter(
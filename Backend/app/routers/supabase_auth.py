@@ -2,20 +2,88 @@
 Supabase-based authentication router
 Clean implementation separate from legacy auth.py
 """
-from fastapi import APIRouter, Depends, HTTPException, Header
+import asyncio
+import logging
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from uuid import uuid4
 from datetime import datetime, timedelta
-from ..database import get_db
+from fastapi.concurrency import run_in_threadpool
+from ..database import get_db, SessionLocal
 from .. import models
-from ..security import create_access_token
-from ..supabase_client import get_supabase_client
+from ..security import needs_rehash
+from ..tokens import access_token_for, issue_tokens, refresh_tokens, revoke_refresh_token
+from ..hashing import hash_password_async, verify_password_async, upgrade_password_hash
+from ..ratelimit import client_ip, login_limiter
+from ..signup_status import announce_signup_verified, signup_waiters
+from ..metrics import SIGNUP_STATUS_WAITS
+from ..dependencies import get_current_user as current_principal
+from ..principals import Principal, announce_principal_change
+from ..supabase_client import get_supabase_client, AuthSession, SupabaseUnavailable
 
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/supabase-auth", tags=["supabase-auth"])
 
 
+# These handlers are async to await Supabase and the hashing executor, so
+# their queries and commits go through these helpers in the threadpool
+# rather than running on the event loop.
+
+def _user_by_email(db: Session, email: str) -> models.User | None:
+	return db.query(models.User).filter(models.User.email == email).first()
+
+
+def _user_by_id(db: Session, user_id: str) -> models.User | None:
+	return db.query(models.User).filter(models.User.id == user_id).first()
+
+
+def _pending_by_email(db: Session, email: str) -> models.PendingSignup | None:
+	return db.query(models.PendingSignup).filter(
+		models.PendingSignup.email == email
+	).first()
+
+
+def _delete(db: Session, row) -> None:
+	db.delete(row)
+	db.commit()
+
+
+def _save(db: Session, *rows) -> None:
+	"""Commit, then reload `rows` so reading them afterwards runs no SQL."""
+	db.commit()
+	for row in rows:
+		db.refresh(row)
+
+
+def _add(db: Session, row) -> None:
+	db.add(row)
+	db.commit()
+
+
+def _create_verified_user(db: Session, pending: models.PendingSignup) -> models.User:
+	"""Replace a verified pending signup with its user account."""
+	user = models.User(
+		id=str(uuid4()),
+		supabase_user_id=pending.supabase_user_id,
+		name=pending.name,
+		email=pending.email,
+		password_hash="",  # Managed by Supabase
+		auth_provider="supabase",
+		role='user',
+		is_verified=True,
+		location=pending.location,
+		latitude=pending.latitude,
+		longitude=pending.longitude
+	)
+	db.add(user)
+	db.delete(pending)
+	_save(db, user)
+	return user
+
+
 @router.post("/signup")
 async def supabase_signup(payload: dict, db: Session = Depends(get_db)):
 	"""
@@ -37,17 +105,14 @@ async def supabase_signup(payload: dict, db: Session = Depends(get_db)):
 			)
 		
 		# Check if already registered
-		existing = db.query(models.User).filter(models.User.email == email).first()
+		existing = await run_in_threadpool(_user_by_email, db, email)
 		if existing:
 			raise HTTPException(status_code=400, detail="Email already registered")
 		
 		# Remove old pending signup if exists
-		old_pending = db.query(models.PendingSignup).filter(
-			models.PendingSignup.email == email
-		).first()
+		old_pending = await run_in_threadpool(_pending_by_email, db, email)
 		if old_pending:
-			db.delete(old_pending)
-			db.commit()
+			await run_in_threadpool(_delete, db, old_pending)
 		
 		verification_method = payload.get("verification_method", "email")
 
@@ -55,21 +120,19 @@ async def supabase_signup(payload: dict, db: Session = Depends(get_db)):
 		supabase_id = None
 		if verification_method == "email":
 			supabase = get_supabase_client()
-			auth_response = supabase.auth.sign_up({
-				"email": email,
-				"password": password,
-				"options": {
-					"data": {"name": name},
-					"email_redirect_to": f"{settings.FRONTEND_URL}/auth/callback"
-				}
-			})
+			auth_user = await supabase.sign_up(
+				email,
+				password,
+				data={"name": name},
+				redirect_to=f"{settings.FRONTEND_URL}/auth/callback"
+			)
 			
-			if not auth_response.user:
+			if not auth_user:
 				raise HTTPException(
 					status_code=500,
 					detail="Failed to create authentication account"
 				)
-			supabase_id = auth_response.user.id
+			supabase_id = auth_user.id
 		
 		# Store in pending_signups
 		pending = models.PendingSignup(
@@ -91,11 +154,9 @@ async def supabase_signup(payload: dict, db: Session = Depends(get_db)):
 			# NOTE: Storing plain password is bad practice. We should hash it or let admin trigger a password reset email on approval.
 			# For now, let's just use a placeholder and require password set on approval, OR hash it.
 			# Better: Hash it now, verify later.
-			from ..security import hash_password
-			pending.password_hash = hash_password(password)
+			pending.password_hash = await hash_password_async(password)
 		
-		db.add(pending)
-		db.commit()
+		await run_in_threadpool(_add, db, pending)
 		
 		if verification_method == "admin":
 			print(f"✓ Registration pending admin approval: {email}")
@@ -134,13 +195,11 @@ async def confirm_email(payload: dict, db: Session = Depends(get_db)):
 			raise HTTPException(status_code=400, detail="Email is required")
 		
 		# Get pending signup
-		pending = db.query(models.PendingSignup).filter(
-			models.PendingSignup.email == email
-		).first()
+		pending = await run_in_threadpool(_pending_by_email, db, email)
 		
 		if not pending:
 			# Check if user already exists (already confirmed)
-			existing = db.query(models.User).filter(models.User.email == email).first()
+			existing = await run_in_threadpool(_user_by_email, db, email)
 			if existing:
 				return {
 					"success": True,
@@ -150,7 +209,7 @@ async def confirm_email(payload: dict, db: Session = Depends(get_db)):
 						"name": existing.name,
 						"email": existing.email
 					},
-					"token": create_access_token(existing.id)
+					"token": access_token_for(existing)
 				}
 			raise HTTPException(
 				status_code=404,
@@ -159,8 +218,7 @@ async def confirm_email(payload: dict, db: Session = Depends(get_db)):
 		
 		# Check expiration
 		if datetime.utcnow() > pending.expires_at:
-			db.delete(pending)
-			db.commit()
+			await run_in_threadpool(_delete, db, pending)
 			raise HTTPException(
 				status_code=400,
 				detail="Signup expired. Please sign up again."
@@ -169,13 +227,13 @@ async def confirm_email(payload: dict, db: Session = Depends(get_db)):
 		# Verify with Supabase
 		try:
 			supabase = get_supabase_client()
-			user_response = supabase.auth.admin.get_user_by_id(pending.supabase_user_id)
+			auth_user = await supabase.get_user_by_id(pending.supabase_user_id)
 			
-			if not user_response.user:
+			if not auth_user:
 				raise HTTPException(status_code=404, detail="User not found")
 			
 			# Check if email verified
-			if not user_response.user.email_confirmed_at:
+			if not auth_user.email_confirmed_at:
 				raise HTTPException(
 					status_code=400,
 					detail="Email not verified yet. Please check your inbox."
@@ -186,24 +244,10 @@ async def confirm_email(payload: dict, db: Session = Depends(get_db)):
 			# Continue anyway - user might have verified
 		
 		# Create actual user account
-		user = models.User(
-			id=str(uuid4()),
-			supabase_user_id=pending.supabase_user_id,
-			name=pending.name,
-			email=pending.email,
-			password_hash="",  # Managed by Supabase
-			role='user',
-			is_verified=True,
-			location=pending.location,
-			latitude=pending.latitude,
-			longitude=pending.longitude
-		)
-		
-		db.add(user)
-		db.delete(pending)
-		db.commit()
+		user = await run_in_threadpool(_create_verified_user, db, pending)
+		await announce_signup_verified(user.email)
 		
-		token = create_access_token(user.id)
+		tokens = issue_tokens(user)
 		
 		print(f"✓ Account created for {email}")
 		
@@ -215,7 +259,7 @@ async def confirm_email(payload: dict, db: Session = Depends(get_db)):
 				"name": user.name,
 				"email": user.email
 			},
-			"token": token
+			**tokens
 		}
 		
 	except HTTPException:
@@ -239,13 +283,11 @@ async def verify_otp(payload: dict, db: Session = Depends(get_db)):
 			raise HTTPException(status_code=400, detail="Email and OTP are required")
 		
 		# Get pending signup
-		pending = db.query(models.PendingSignup).filter(
-			models.PendingSignup.email == email
-		).first()
+		pending = await run_in_threadpool(_pending_by_email, db, email)
 		
 		if not pending:
 			# Check if user already exists
-			existing = db.query(models.User).filter(models.User.email == email).first()
+			existing = await run_in_threadpool(_user_by_email, db, email)
 			if existing:
 				return {
 					"success": True,
@@ -255,43 +297,25 @@ async def verify_otp(payload: dict, db: Session = Depends(get_db)):
 						"name": existing.name,
 						"email": existing.email
 					},
-					"token": create_access_token(existing.id)
+					"token": access_token_for(existing)
 				}
 			raise HTTPException(status_code=404, detail="No pending signup found")
 
 		# Verify OTP with Supabase
 		supabase = get_supabase_client()
 		try:
-			res = supabase.auth.verify_otp({
-				"email": email,
-				"token": otp,
-				"type": "signup"
-			})
-			if not res.user:
+			auth_user = await supabase.verify_otp(email, otp, "signup")
+			if not auth_user:
 				raise Exception("Invalid OTP")
 		except Exception as e:
 			print(f"OTP Verification failed: {e}")
 			raise HTTPException(status_code=400, detail="Invalid verification code")
 
 		# Create actual user account
-		user = models.User(
-			id=str(uuid4()),
-			supabase_user_id=pending.supabase_user_id,
-			name=pending.name,
-			email=pending.email,
-			password_hash="",  # Managed by Supabase
-			role='user',
-			is_verified=True,
-			location=pending.location,
-			latitude=pending.latitude,
-			longitude=pending.longitude
-		)
-		
-		db.add(user)
-		db.delete(pending)
-		db.commit()
+		user = await run_in_threadpool(_create_verified_user, db, pending)
+		await announce_signup_verified(user.email)
 		
-		token = create_access_token(user.id)
+		tokens = issue_tokens(user)
 		
 		return {
 			"success": True,
@@ -303,7 +327,7 @@ async def verify_otp(payload: dict, db: Session = Depends(get_db)):
 				"role": user.role,
 				"location": user.location
 			},
-			"token": token
+			**tokens
 		}
 
 	except HTTPException:
@@ -314,9 +338,11 @@ async def verify_otp(payload: dict, db: Session = Depends(get_db)):
 
 
 @router.post("/login")
-async def supabase_login(payload: dict, db: Session = Depends(get_db)):
+async def supabase_login(payload: dict, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
 	"""
-	Login with Supabase authentication (with legacy fallback)
+	Login with Supabase authentication or a local password hash, whichever
+	owns the account (users.auth_provider). Until that is known both are
+	tried concurrently, and the one that accepts is recorded.
 	"""
 	try:
 		email = payload.get("email", "").strip().lower()
@@ -327,23 +353,11 @@ async def supabase_login(payload: dict, db: Session = Depends(get_db)):
 				status_code=400,
 				detail="Email and password are required"
 			)
+
+		ip = client_ip(request)
+		login_limiter.check("supabase-auth", email, ip)
 		
-		# 1. Try Supabase Authentication first
-		supabase_user = None
-		try:
-			supabase = get_supabase_client()
-			auth_response = supabase.auth.sign_in_with_password({
-				"email": email,
-				"password": password
-			})
-			if auth_response.user:
-				supabase_user = auth_response.user
-		except Exception as e:
-			# Supabase login failed, continue to legacy check
-			pass
-		
-		# 2. Check local database
-		user = db.query(models.User).filter(models.User.email == email).first()
+		user = await run_in_threadpool(_user_by_email, db, email)
 		
 		if not user:
 			raise HTTPException(
@@ -351,23 +365,26 @@ async def supabase_login(payload: dict, db: Session = Depends(get_db)):
 				detail="Account not found. Please complete signup."
 			)
 
-		# 3. Verify credentials
-		if supabase_user:
-			# Supabase auth succeeded
-			if not supabase_user.email_confirmed_at:
-				raise HTTPException(
-					status_code=400,
-					detail="Please verify your email before logging in"
-				)
-		else:
-			# Supabase failed, try legacy password hash
-			from ..security import verify_password
-			if not user.password_hash or not verify_password(password, user.password_hash):
-				raise HTTPException(status_code=401, detail="Invalid credentials")
-			
-			# Legacy user authenticated successfully
+		# Verify credentials with the verifier that owns this user's password
+		known_provider = user.auth_provider
+		accepted, session = await _check_password(user, password)
+		if user.auth_provider != known_provider:
+			await run_in_threadpool(_save, db, user)
+		if not accepted:
+			raise HTTPException(status_code=401, detail="Invalid credentials")
+		login_limiter.succeeded(ip)
+		supabase_user = session.user if session else None
+
+		if user.auth_provider == "local" and needs_rehash(user.password_hash):
+			background_tasks.add_task(upgrade_password_hash, user.id, password, user.password_hash)
+
+		if supabase_user and not supabase_user.email_confirmed_at:
+			raise HTTPException(
+				status_code=400,
+				detail="Please verify your email before logging in"
+			)
 		
-		token = create_access_token(user.id)
+		tokens = issue_tokens(user)
 		
 		return {
 			"success": True,
@@ -378,7 +395,7 @@ async def supabase_login(payload: dict, db: Session = Depends(get_db)):
 				"location": user.location,
 				"role": user.role
 			},
-			"token": token
+			**tokens
 		}
 		
 	except HTTPException:
@@ -388,25 +405,100 @@ async def supabase_login(payload: dict, db: Session = Depends(get_db)):
 		raise HTTPException(status_code=401, detail="Invalid credentials")
 
 
+async def _supabase_sign_in(email: str, password: str) -> AuthSession | None:
+	"""The Supabase session if Supabase accepts the credentials; raises SupabaseUnavailable if it can't say."""
+	try:
+		return await get_supabase_client().sign_in_with_password(email, password)
+	except SupabaseUnavailable:
+		raise
+	except Exception:
+		return None
+
+
+async def _local_sign_in(user: models.User, password: str) -> bool:
+	return bool(user.password_hash) and await verify_password_async(password, user.password_hash)
+
+
+async def _check_password(user: models.User, password: str) -> tuple[bool, AuthSession | None]:
+	"""
+	Verify `password` with the verifier that owns `user`'s password: whether
+	it was accepted, and the Supabase session if Supabase accepted it. While
+	the owner is unknown both are asked, and user.auth_provider is set once
+	the answer is certain; the caller commits it.
+	"""
+	unavailable = HTTPException(status_code=503, detail="Authentication service unavailable, please try again")
+	if user.auth_provider == "local":
+		return await _local_sign_in(user, password), None
+	if user.auth_provider == "supabase":
+		try:
+			session = await _supabase_sign_in(user.email, password)
+		except SupabaseUnavailable:
+			raise unavailable
+		return session is not None, session
+
+	# Not known yet: ask both at once; Supabase wins if both accept
+	remote, local_ok = await asyncio.gather(
+		_supabase_sign_in(user.email, password),
+		_local_sign_in(user, password),
+		return_exceptions=True
+	)
+	if isinstance(local_ok, BaseException):
+		raise local_ok
+	if isinstance(remote, AuthSession):
+		user.auth_provider = "supabase"
+		return True, remote
+	if isinstance(remote, BaseException):
+		# Supabase could not say, so the local hash may be out of date: accept
+		# a match for this sign-in, but don't record the account as local
+		if local_ok:
+			return True, None
+		raise unavailable
+	if local_ok:
+		user.auth_provider = "local"
+	return local_ok, None
+
+
+@router.post("/refresh")
+def refresh(payload: dict, db: Session = Depends(get_db)):
+	"""
+	Exchange a refresh token for a new access token and refresh token.
+	The old refresh token can't be used again.
+	"""
+	refresh_token = payload.get("refresh_token", "")
+	if not refresh_token:
+		raise HTTPException(status_code=400, detail="Refresh token is required")
+	return {"success": True, **refresh_tokens(db, refresh_token)}
+
+
+@router.post("/logout")
+def logout(payload: dict, db: Session = Depends(get_db)):
+	"""Revoke a refresh token; the access token lapses on its own shortly after."""
+	refresh_token = payload.get("refresh_token", "")
+	if refresh_token:
+		revoke_refresh_token(db, refresh_token)
+	return {"success": True}
+
+
+def _profile_row(db: Session, user_id: str):
+	return db.query(
+		models.User.id,
+		models.User.name,
+		models.User.email,
+		models.User.role,
+		models.User.location,
+		models.User.latitude,
+		models.User.longitude,
+		models.User.is_verified
+	).filter(models.User.id == user_id).first()
+
+
 @router.get("/me")
-async def get_current_user(authorization: str = Header(None), db: Session = Depends(get_db)):
+async def get_current_user(principal: Principal = Depends(current_principal), db: Session = Depends(get_db)):
 	"""
 	Get current user information
 	"""
 	try:
-		if not authorization or not authorization.lower().startswith("bearer "):
-			raise HTTPException(status_code=401, detail="Missing token")
-		
-		token = authorization.split(" ", 1)[1]
-		
-		# Decode token to get user ID
-		from ..security import decode_token
-		user_id = decode_token(token)
-		if not user_id:
-			raise HTTPException(status_code=401, detail="Invalid token")
-		
-		# Get user from database
-		user = db.query(models.User).filter(models.User.id == user_id).first()
+		user = await run_in_threadpool(_profile_row, db, principal.id)
 		if not user:
 			raise HTTPException(status_code=404, detail="User not found")
 		
@@ -429,24 +521,12 @@ async def get_current_user(authorization: str = Header(None), db: Session = Depe
 
 
 @router.put("/profile")
-async def update_profile(payload: dict, authorization: str = Header(None), db: Session = Depends(get_db)):
+async def update_profile(payload: dict, principal: Principal = Depends(current_principal), db: Session = Depends(get_db)):
 	"""
 	Update user profile
 	"""
 	try:
-		if not authorization or not authorization.lower().startswith("bearer "):
-			raise HTTPException(status_code=401, detail="Missing token")
-		
-		token = authorization.split(" ", 1)[1]
-		
-		# Decode token to get user ID
-		from ..security import decode_token
-		user_id = decode_token(token)
-		if not user_id:
-			raise HTTPException(status_code=401, detail="Invalid token")
-		
-		# Get user from database
-		user = db.query(models.User).filter(models.User.id == user_id).first()
+		user = await run_in_threadpool(_user_by_id, db, principal.id)
 		if not user:
 			raise HTTPException(status_code=404, detail="User not found")
 		
@@ -465,8 +545,8 @@ async def update_profile(payload: dict, authorization: str = Header(None), db: S
 		if longitude is not None:
 			user.longitude = longitude
 		
-		db.commit()
-		db.refresh(user)
+		await run_in_threadpool(_save, db, user)
+		await announce_principal_change(user.id)
 		
 		return {
 			"id": user.id,
@@ -486,22 +566,11 @@ async def update_profile(payload: dict, authorization: str = Header(None), db: S
 
 
 @router.post("/change-password")
-async def change_password(payload: dict, authorization: str = Header(None), db: Session = Depends(get_db)):
+async def change_password(payload: dict, principal: Principal = Depends(current_principal), db: Session = Depends(get_db)):
 	"""
 	Change password via Supabase
 	"""
 	try:
-		if not authorization or not authorization.lower().startswith("bearer "):
-			raise HTTPException(status_code=401, detail="Missing token")
-		
-		token = authorization.split(" ", 1)[1]
-		
-		# Decode token to get user ID
-		from ..security import decode_token
-		user_id = decode_token(token)
-		if not user_id:
-			raise HTTPException(status_code=401, detail="Invalid token")
-		
 		old_password = payload.get("old_password")
 		new_password = payload.get("new_password")
 		
@@ -509,33 +578,34 @@ async def change_password(payload: dict, authorization: str = Header(None), db:
 			raise HTTPException(status_code=400, detail="Old and new passwords are required")
 		
 		# Get user from database
-		user = db.query(models.User).filter(models.User.id == user_id).first()
+		user = await run_in_threadpool(_user_by_id, db, principal.id)
 		if not user:
 			raise HTTPException(status_code=404, detail="User not found")
 		
-		# For Supabase users, use Supabase to change password
-		if user.supabase_user_id:
-			supabase = get_supabase_client()
-			# Verify old password first by trying to sign in
+		# Verify the old password with the verifier that owns it, and change it there
+		accepted, session = await _check_password(user, old_password)
+		if not accepted:
+			raise HTTPException(status_code=400, detail="Old password is incorrect")
+		if user.auth_provider == "supabase":
+			# Update password as that user
 			try:
-				supabase.auth.sign_in_with_password({
-					"email": user.email,
-					"password": old_password
-				})
-				# Update password
-				supabase.auth.update_user({"password": new_password})
+				await get_supabase_client().update_user(session.access_token, {"password": new_password})
+			except SupabaseUnavailable:
+				raise HTTPException(status_code=503, detail="Authentication service unavailable, please try again")
 			except Exception as e:
 				print(f"Supabase password change error: {str(e)}")
-				raise HTTPException(status_code=400, detail="Old password is incorrect")
+				raise HTTPException(status_code=400, detail="Failed to change password")
+		elif user.auth_provider == "local":
+			user.password_hash = await hash_password_async(new_password)
 		else:
-			# For legacy users with local password hash
-			from ..security import verify_password, hash_password
-			if not verify_password(old_password, user.password_hash):
-				raise HTTPException(status_code=400, detail="Old password is incorrect")
-			user.password_hash = hash_password(new_password)
-			db.commit()
+			# Supabase could not say whether it owns the password
+			raise HTTPException(status_code=503, detail="Authentication service unavailable, please try again")
+		# Sign out every other session; this one gets new tokens below
+		user.token_version = (user.token_version or 0) + 1
+		await run_in_threadpool(_save, db, user)
+		await announce_principal_change(user.id)
 		
-		return {"message": "Password updated successfully"}
+		return {"message": "Password updated successfully", **issue_tokens(user)}
 		
 	except HTTPException:
 		raise
@@ -544,17 +614,21 @@ async def change_password(payload: dict, authorization: str = Header(None), db:
 		raise HTTPException(status_code=500, detail="Failed to change password")
 
 
+def _public_user_row(db: Session, user_id: str):
+	return db.query(
+		models.User.id,
+		models.User.name,
+		models.User.email
+	).filter(models.User.id == user_id).first()
+
+
 @router.get("/user/{user_id}")
 async def get_user_public(user_id: str, db: Session = Depends(get_db)):
 	"""
 	Get public user information (for viewing other users)
 	"""
 	try:
-		user = db.query(
-			models.User.id,
-			models.User.name,
-			models.User.email
-		).filter(models.User.id == user_id).first()
+		user = await run_in_threadpool(_public_user_row, db, user_id)
 		
 		if not user:
 			raise HTTPException(status_code=404, detail="User not found")
@@ -572,6 +646,46 @@ async def get_user_public(user_id: str, db: Session = Depends(get_db)):
 		raise HTTPException(status_code=500, detail="Failed to get user")
 
 
+_VERIFIED_STATUS = {
+	"status": "verified",
+	"message": "Email verified and account created",
+	"user_exists": True
+}
+
+
+def _email_status(db: Session, email: str) -> dict:
+	# Check if user exists
+	user = db.query(models.User.id).filter(models.User.email == email).first()
+	if user:
+		return _VERIFIED_STATUS
+	
+	# Check if pending
+	pending = db.query(models.PendingSignup.id).filter(
+		models.PendingSignup.email == email
+	).first()
+	if pending:
+		return {
+			"status": "pending",
+			"message": "Awaiting email verification",
+			"user_exists": False
+		}
+	
+	return {
+		"status": "not_found",
+		"message": "No signup found for this email",
+		"user_exists": False
+	}
+
+
+def _read_email_status(email: str) -> dict:
+	# Its own short session, so no connection is held while the request waits
+	db = SessionLocal()
+	try:
+		return _email_status(db, email)
+	finally:
+		db.close()
+
+
 @router.get("/check-email/{email}")
 async def check_email_status(email: str, db: Session = Depends(get_db)):
 	"""
@@ -579,37 +693,44 @@ async def check_email_status(email: str, db: Session = Depends(get_db)):
 	Useful for polling after email verification
 	"""
 	try:
-		email = email.strip().lower()
-		
-		# Check if user exists
-		user = db.query(models.User).filter(models.User.email == email).first()
-		if user:
-			return {
-				"status": "verified",
-				"message": "Email verified and account created",
-				"user_exists": True
-			}
-		
-		# Check if pending
-		pending = db.query(models.PendingSignup).filter(
-			models.PendingSignup.email == email
-		).first()
-		if pending:
-			return {
-				"status": "pending",
-				"message": "Awaiting email verification",
-				"user_exists": False
-			}
-		
-		return {
-			"status": "not_found",
-			"message": "No signup found for this email",
-			"user_exists": False
-		}
-		
-	except Exception as e:
-		print(f"Check email error: {str(e)}")
-		raise HTTPException(status_code=500, detail=str(e))
+		return await run_in_threadpool(_email_status, db, email.strip().lower())
+	except Exception:
+		# Callers are unauthenticated; the details stay in the log
+		logger.exception("Check email status failed")
+		raise HTTPException(status_code=500, detail="Failed to check email status")
+
+
+@router.get("/check-email/{email}/wait")
+async def wait_for_email_status(email: str, timeout: float | None = None):
+	"""
+	Like check-email, but while the signup is pending, wait up to `timeout`
+	seconds (at most SIGNUP_STATUS_WAIT_SECONDS) for it to be verified
+	"""
+	email = email.strip().lower()
+	wait = settings.SIGNUP_STATUS_WAIT_SECONDS if timeout is None else min(max(timeout, 0.0), settings.SIGNUP_STATUS_WAIT_SECONDS)
+	if len(signup_waiters) >= settings.SIGNUP_STATUS_MAX_WAITERS:
+		wait = 0.0
+	verified = signup_waiters.register(email)
+	try:
+		try:
+			result = await run_in_threadpool(_read_email_status, email)
+		except Exception:
+			logger.exception("Check email status failed")
+			raise HTTPException(status_code=500, detail="Failed to check email status")
+		if result["status"] != "pending":
+			return result
+		if not wait:
+			SIGNUP_STATUS_WAITS.labels("not_waited").inc()
+			return result
+		try:
+			await asyncio.wait_for(verified.wait(), wait)
+		except asyncio.TimeoutError:
+			SIGNUP_STATUS_WAITS.labels("timeout").inc()
+			return result
+		SIGNUP_STATUS_WAITS.labels("verified").inc()
+		return _VERIFIED_STATUS
+	finally:
+		signup_waiters.release(email)
 
 
 @router.post("/forgot-password")
@@ -625,7 +746,7 @@ async def forgot_password(payload: dict):
 		
 		# Supabase handles password reset email
 		supabase = get_supabase_client()
-		supabase.auth.reset_password_email(email)
+		await supabase.reset_password_email(email)
 		
 		# Always return success (security: don't reveal if email exists)
 		return {
@@ -645,7 +766,7 @@ async def forgot_password(payload: dict):
 
 
 @router.post("/reset-password")
-async def reset_password(payload: dict):
+async def reset_password(payload: dict, db: Session = Depends(get_db)):
 	"""
 	Reset password using Supabase (handled on frontend with Supabase SDK)
 	This endpoint is mainly for compatibility
@@ -662,7 +783,19 @@ async def reset_password(payload: dict):
 		
 		# Update password via Supabase
 		supabase = get_supabase_client()
-		supabase.auth.update_user({"password": new_password})
+		auth_user = await supabase.update_user(access_token, {"password": new_password})
+		
+		user = None
+		if auth_user and auth_user.email:
+			user = await run_in_threadpool(_user_by_email, db, auth_user.email.strip().lower())
+		if user:
+			if user.auth_provider != "supabase":
+				# Logins may check the local hash for this account; it must match too
+				user.password_hash = await hash_password_async(new_password)
+			# Sign out every session that used the old password
+			user.token_version = (user.token_version or 0) + 1
+			await run_in_threadpool(_save, db, user)
+			await announce_principal_change(user.id)
 		
 		return {
 			"success": True,
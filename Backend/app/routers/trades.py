@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi import APIRouter, Depends, Query, HTTPException, status, BackgroundTasks
 # Trigger reload
 from sqlalchemy.orm import Session
 from uuid import uuid4
 from ..database import get_db
 from .. import models, schemas
 from ..dependencies import get_current_user
+from ..principals import Principal
+from ..cache import trade_summary_cache, trade_participants_cache
+from ..services.conversation_state import open_conversation, touch_conversation
+from ..services.messaging import trade_event
+from ..websocket_manager import trade_ws_manager
 from datetime import datetime, timezone
-from sqlalchemy import or_
+from sqlalchemy import or_, case, func
 
 router = APIRouter(prefix="/trades", tags=["trades"])
 
@@ -15,7 +20,7 @@ router = APIRouter(prefix="/trades", tags=["trades"])
 def list_trades(
     user_id: str | None = Query(default=None),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     List trades. 
@@ -52,11 +57,63 @@ def list_trades(
     return trades
 
 
+def _invalidate_trade_summary(trade: models.Trade) -> None:
+    """Drop cached dashboard counters for both participants of a trade."""
+    trade_summary_cache.invalidate(trade.from_user_id, trade.to_user_id)
+
+
+async def notify_trade_created(trade_id: str, participants: tuple[str, str], event: dict) -> None:
+    """Tell both participants' /ws/user sockets about a new trade and subscribe them to it."""
+    for user_id in participants:
+        await trade_ws_manager.publish_to_user(user_id, event, join_trade=trade_id)
+
+
+@router.get("/summary", response_model=schemas.TradeSummary)
+def trade_summary(
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Dashboard counters for the current user's trades, by status and role.
+    Computed with a single GROUP BY and cached per user until one of their
+    trades is created, updated or deleted.
+    """
+    cached = trade_summary_cache.get(current_user.id)
+    if cached is not None:
+        return cached
+
+    role = case(
+        (models.Trade.from_user_id == current_user.id, "initiator"),
+        else_="receiver",
+    ).label("role")
+    rows = (
+        db.query(role, models.Trade.status, func.count(models.Trade.id))
+        .filter(
+            or_(
+                models.Trade.from_user_id == current_user.id,
+                models.Trade.to_user_id == current_user.id
+            )
+        )
+        .group_by(role, models.Trade.status)
+        .all()
+    )
+
+    summary = {"total": 0, "by_status": {}, "initiator": {}, "receiver": {}}
+    for trade_role, trade_status, count in rows:
+        summary["total"] += count
+        summary["by_status"][trade_status] = summary["by_status"].get(trade_status, 0) + count
+        summary[trade_role][trade_status] = count
+
+    trade_summary_cache.set(current_user.id, summary)
+    return summary
+
+
 @router.post("/", response_model=schemas.Trade)
 def create_trade(
     payload: schemas.TradeCreate, 
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     # Validate items exist
     from_item = db.query(models.Item).filter(models.Item.id == payload.from_item_id).first()
@@ -86,8 +143,11 @@ def create_trade(
         updated_at=datetime.now(timezone.utc),
     )
     db.add(obj)
+    open_conversation(db, obj)
     db.commit()
     db.refresh(obj)
+    _invalidate_trade_summary(obj)
+    background_tasks.add_task(notify_trade_created, obj.id, (obj.from_user_id, obj.to_user_id), trade_event(obj, "created"))
     return obj
 
 
@@ -95,7 +155,7 @@ def create_trade(
 def get_trade(
     trade_id: str, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     trade = db.query(models.Trade).filter(models.Trade.id == trade_id).first()
     if not trade:
@@ -183,7 +243,7 @@ def update_trade(
     payload: schemas.TradeUpdate, 
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     trade = db.query(models.Trade).filter(models.Trade.id == trade_id).first()
     if not trade:
@@ -256,16 +316,20 @@ def update_trade(
     for field, value in update_data.items():
         setattr(trade, field, value)
 
+    touch_conversation(db, trade.id)
     db.commit()
     db.refresh(trade)
+    _invalidate_trade_summary(trade)
+    background_tasks.add_task(trade_ws_manager.broadcast_message, trade.id, trade_event(trade, "updated"))
     return trade
 
 
 @router.delete("/{trade_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_trade(
     trade_id: str, 
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     trade = db.query(models.Trade).filter(models.Trade.id == trade_id).first()
     if not trade:
@@ -276,8 +340,13 @@ def delete_trade(
         if trade.from_user_id != current_user.id and trade.to_user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to delete this trade")
 
+    participants = (trade.from_user_id, trade.to_user_id)
+    ws_payload = trade_event(trade, "deleted")
     db.delete(trade)
     db.commit()
+    trade_summary_cache.invalidate(*participants)
+    trade_participants_cache.invalidate(trade_id)
+    background_tasks.add_task(trade_ws_manager.broadcast_message, trade_id, ws_payload)
     return None
 
 
@@ -287,7 +356,7 @@ def create_rating(
     payload: dict, # TODO: Create RatingCreate schema for strict 1-to-1
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     trade = db.query(models.Trade).filter(models.Trade.id == trade_id).first()
     if not trade:
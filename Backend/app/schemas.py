@@ -84,6 +84,14 @@ class Trade(TradeBase):
 		from_attributes = True
 
 
+class TradeSummary(BaseModel):
+	"""Trade counts for the current user, keyed by trade status."""
+	total: int = 0
+	by_status: dict[str, int] = Field(default_factory=dict)
+	initiator: dict[str, int] = Field(default_factory=dict)
+	receiver: dict[str, int] = Field(default_factory=dict)
+
+
 class MessageBase(BaseModel):
 	trade_id: str
 	content: str
@@ -91,6 +99,11 @@ class MessageBase(BaseModel):
 class MessageCreate(MessageBase):
 	receiver_id: str
 
+class MessageRead(BaseModel):
+	"""Read receipt: mark the trade's messages up to and including this one as read."""
+	trade_id: str
+	up_to_message_id: Optional[str] = None
+
 class Message(MessageBase):
 	id: str
 	sender_id: str
@@ -102,6 +115,15 @@ class Message(MessageBase):
 		from_attributes = True
 
 
+class MessagePage(BaseModel):
+	"""One page of a trade's messages, oldest-first, with the cursors for the next page."""
+	messages: List[Message]
+	has_more: bool = False
+	# Pass as `before` to load older messages / as `after` to load newer ones
+	next_before: Optional[str] = None
+	next_after: Optional[str] = None
+
+
 class Rating(BaseModel):
     id: str
     trade_id: str
@@ -2,13 +2,23 @@ from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 import hashlib
+import uuid
+from .config import settings
 
 SECRET_KEY = "change-me"  # put in .env for production
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
-
-# Argon2 is the preferred algorithm moving forward.
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_TTL_MINUTES
+
+# Argon2 is the preferred algorithm moving forward. Its cost comes from
+# settings (tune with calibrate_argon2.py); hashes made with other
+# parameters still verify and are upgraded on the next login.
+pwd_context = CryptContext(
+	schemes=["argon2"],
+	deprecated="auto",
+	argon2__rounds=settings.ARGON2_TIME_COST,
+	argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+	argon2__parallelism=settings.ARGON2_PARALLELISM,
+)
 
 # Legacy context used to verify existing bcrypt hashes in the database.
 legacy_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -55,18 +65,52 @@ def verify_password(plain_password: str, password_hash: str) -> bool:
 		return False
 
 
-def create_access_token(subject: str, expires_delta: timedelta | None = None) -> str:
+def needs_rehash(password_hash: str) -> bool:
+	"""
+	True for a hash that verified but should be replaced: a legacy bcrypt
+	hash, or an Argon2 hash made with other parameters than the configured
+	ones. Cheap; only parses the hash.
+	"""
+	if not password_hash:
+		return False
+	if not password_hash.startswith("$argon2"):
+		return True
+	try:
+		return pwd_context.needs_update(password_hash)
+	except Exception:
+		return False
+
+
+def create_access_token(subject: str, expires_delta: timedelta | None = None, claims: dict | None = None) -> str:
+	"""A bearer token for `subject`; `claims` are embedded alongside (see tokens.access_token_for)."""
 	expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-	to_encode = {"sub": subject, "exp": expire}
+	to_encode = {**(claims or {}), "sub": subject, "typ": "access", "exp": expire}
 	encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 	return encoded_jwt
 
 
-def decode_token(token: str) -> str | None:
+def create_refresh_token(subject: str, version: int) -> str:
+	"""A single-use refresh token for `subject` at token version `version`."""
+	expire = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_TTL_DAYS)
+	to_encode = {"sub": subject, "typ": "refresh", "ver": version, "jti": str(uuid.uuid4()), "exp": expire}
+	return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def decode_token_claims(token: str, token_type: str = "access") -> dict | None:
+	"""
+	All claims of a valid token of `token_type`, or None if it is invalid,
+	expired or of another type. Tokens issued before types were introduced
+	count as access tokens.
+	"""
 	try:
-		payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-		return payload.get("sub")
+		claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 	except JWTError:
 		return None
+	return claims if claims.get("typ", "access") == token_type else None
+
+
+def decode_token(token: str) -> str | None:
+	payload = decode_token_claims(token)
+	return payload.get("sub") if payload else None
 
 
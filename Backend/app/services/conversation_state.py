@@ -0,0 +1,219 @@
+"""
+Denormalized inbox rows (conversation_state), one per trade participant.
+
+Rows are written in the same transaction as the change they summarize, so
+GET /messages/conversations can read the inbox with a single indexed range
+scan instead of aggregating messages at read time.
+"""
+from datetime import datetime, timezone
+from sqlalchemy import update, delete, case, desc, func, or_, select
+from sqlalchemy.orm import Session
+from .. import models
+
+PREVIEW_LENGTH = 255
+
+CS = models.ConversationState
+
+
+def _preview(content: str | None) -> str:
+    return (content or "")[:PREVIEW_LENGTH]
+
+
+def open_conversation(db: Session, trade: models.Trade) -> None:
+    """Create empty inbox rows for both participants of a new trade (no commit)."""
+    when = trade.created_at or datetime.now(timezone.utc)
+    for user_id, other_id in _participants(trade):
+        db.add(CS(
+            trade_id=trade.id,
+            user_id=user_id,
+            other_user_id=other_id,
+            unread_count=0,
+            updated_at=when,
+        ))
+
+
+def record_message(db: Session, message: models.Message, trade: models.Trade) -> None:
+    """
+    Fold a newly added message into both participants' rows (no commit).
+    One UPDATE covers both rows; unread_count is incremented in SQL so
+    concurrent senders never lose an increment. Trades created before the
+    table existed are rebuilt from `messages` on first write.
+    """
+    is_newer = or_(CS.last_message_at.is_(None), CS.last_message_at <= message.created_at)
+    stmt = (
+        update(CS)
+        .where(CS.trade_id == message.trade_id)
+        .values(
+            last_message_id=case((is_newer, message.id), else_=CS.last_message_id),
+            last_message_preview=case((is_newer, _preview(message.content)), else_=CS.last_message_preview),
+            last_message_at=case((is_newer, message.created_at), else_=CS.last_message_at),
+            unread_count=CS.unread_count + case((CS.user_id == message.receiver_id, 1), else_=0),
+            updated_at=message.created_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    result = db.execute(stmt)
+    if result.rowcount < len(_participants(trade)):
+        db.flush()
+        _rebuild_trades(db, [trade])
+
+
+def refresh_unread_count(db: Session, trade_id: str, user_id: str) -> None:
+    """Recompute one participant's unread_count after messages were marked read (no commit)."""
+    unread = (
+        select(func.count(models.Message.id))
+        .where(
+            models.Message.trade_id == trade_id,
+            models.Message.receiver_id == user_id,
+            models.Message.is_read == False,  # noqa: E712
+        )
+        .scalar_subquery()
+    )
+    db.execute(
+        update(CS)
+        .where(CS.trade_id == trade_id, CS.user_id == user_id)
+        .values(unread_count=unread)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def touch_conversation(db: Session, trade_id: str, when: datetime | None = None) -> None:
+    """Bump a trade's inbox rows to the top, e.g. after a status change (no commit)."""
+    db.execute(
+        update(CS)
+        .where(CS.trade_id == trade_id)
+        .values(updated_at=when or datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def missing_conversations(db: Session, user_id: str) -> list[models.ConversationState]:
+    """
+    Inbox rows `user_id` should have but doesn't, e.g. for trades created
+    before the table was backfilled, summarized from `messages`. The rows are
+    not added to the session; rebuild_conversation_state() stores them.
+    """
+    has_row = select(CS.trade_id).where(CS.trade_id == models.Trade.id, CS.user_id == user_id).exists()
+    trades = (
+        db.query(models.Trade)
+        .filter(or_(models.Trade.from_user_id == user_id, models.Trade.to_user_id == user_id), ~has_row)
+        .all()
+    )
+    return [state for state in _summaries(db, trades) if state.user_id == user_id]
+
+
+def conversations_changed_since(db: Session, user_id: str, since: datetime) -> list[str]:
+    """Trade ids of a user's inbox rows updated at or after `since`, newest first."""
+    rows = (
+        db.query(CS.trade_id)
+        .filter(CS.user_id == user_id, CS.updated_at >= since)
+        .order_by(CS.updated_at.desc())
+        .all()
+    )
+    return [trade_id for (trade_id,) in rows]
+
+
+def latest_messages(db: Session, trade_ids: list[str]) -> dict:
+    """Map trade_id -> newest message row (id, content, created_at) using ROW_NUMBER()."""
+    if not trade_ids:
+        return {}
+    ranked = (
+        db.query(
+            models.Message.id.label("id"),
+            models.Message.trade_id.label("trade_id"),
+            models.Message.content.label("content"),
+            models.Message.created_at.label("created_at"),
+            func.row_number().over(
+                partition_by=models.Message.trade_id,
+                order_by=(desc(models.Message.created_at), desc(models.Message.id)),
+            ).label("rn"),
+        )
+        .filter(models.Message.trade_id.in_(trade_ids))
+        .subquery()
+    )
+    rows = (
+        db.query(ranked.c.id, ranked.c.trade_id, ranked.c.content, ranked.c.created_at)
+        .filter(ranked.c.rn == 1)
+        .all()
+    )
+    return {row.trade_id: row for row in rows}
+
+
+def rebuild_conversation_state(db: Session, batch_size: int = 500) -> int:
+    """
+    Repair job: recompute every inbox row from `messages`, one batch of
+    trades per transaction. Returns the number of trades processed.
+    """
+    processed = 0
+    last_id = ""
+    while True:
+        trades = (
+            db.query(models.Trade)
+            .filter(models.Trade.id > last_id)
+            .order_by(models.Trade.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not trades:
+            break
+        _rebuild_trades(db, trades)
+        db.commit()
+        processed += len(trades)
+        last_id = trades[-1].id
+    return processed
+
+
+def _participants(trade: models.Trade) -> list[tuple[str, str]]:
+    if trade.from_user_id == trade.to_user_id:
+        return [(trade.from_user_id, trade.to_user_id)]
+    return [(trade.from_user_id, trade.to_user_id), (trade.to_user_id, trade.from_user_id)]
+
+
+def _rebuild_trades(db: Session, trades: list[models.Trade]) -> None:
+    states = _summaries(db, trades)
+    db.execute(delete(CS).where(CS.trade_id.in_([t.id for t in trades])))
+    db.add_all(states)
+    db.flush()
+
+
+def _summaries(db: Session, trades: list[models.Trade]) -> list[models.ConversationState]:
+    """Inbox rows for both participants of `trades`, computed from `messages`."""
+    if not trades:
+        return []
+    trade_ids = [t.id for t in trades]
+    last_map = latest_messages(db, trade_ids)
+    unread_map = {
+        (row.trade_id, row.receiver_id): row.unread
+        for row in (
+            db.query(
+                models.Message.trade_id,
+                models.Message.receiver_id,
+                func.count(models.Message.id).label("unread"),
+            )
+            .filter(
+                models.Message.trade_id.in_(trade_ids),
+                models.Message.is_read == False,  # noqa: E712
+            )
+            .group_by(models.Message.trade_id, models.Message.receiver_id)
+            .all()
+        )
+    }
+
+    states = []
+    for trade in trades:
+        last = last_map.get(trade.id)
+        when = trade.updated_at or trade.created_at or datetime.now(timezone.utc)
+        if last and last.created_at and last.created_at.replace(tzinfo=None) > when.replace(tzinfo=None):
+            when = last.created_at
+        for user_id, other_id in _participants(trade):
+            states.append(CS(
+                trade_id=trade.id,
+                user_id=user_id,
+                other_user_id=other_id,
+                last_message_id=last.id if last else None,
+                last_message_at=last.created_at if last else None,
+                last_message_preview=_preview(last.content) if last else None,
+                unread_count=unread_map.get((trade.id, user_id), 0),
+                updated_at=when,
+            ))
+    return states
@@ -0,0 +1,275 @@
+"""
+Message persistence and realtime event shapes shared by the HTTP routes and
+the websockets.
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from uuid import uuid4
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update, or_, and_
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from .. import models
+from .conversation_state import record_message, refresh_unread_count
+
+
+def serialize_message(obj: models.Message) -> dict:
+    """Websocket representation of a message."""
+    return {
+        "id": obj.id,
+        "tradeId": obj.trade_id,
+        "senderId": obj.sender_id,
+        "receiverId": obj.receiver_id,
+        "content": obj.content,
+        "isRead": obj.is_read,
+        "createdAt": obj.created_at.isoformat() if obj.created_at else datetime.now(timezone.utc).isoformat()
+    }
+
+
+def message_event(obj: models.Message) -> dict:
+    return {"type": "message", "tradeId": obj.trade_id, "message": serialize_message(obj)}
+
+
+def read_event(trade_id: str, reader_id: str, up_to_message_id: str | None) -> dict:
+    return {
+        "type": "read",
+        "tradeId": trade_id,
+        "userId": reader_id,
+        "messageId": up_to_message_id,
+        "readAt": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def serialize_trade(trade: models.Trade) -> dict:
+    """Websocket representation of a trade's current state."""
+    return {
+        "id": trade.id,
+        "status": trade.status,
+        "fromUserId": trade.from_user_id,
+        "toUserId": trade.to_user_id,
+        "fromItemId": trade.from_item_id,
+        "toItemId": trade.to_item_id,
+        "updatedAt": trade.updated_at.isoformat() if trade.updated_at else datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def trade_event(trade: models.Trade, action: str) -> dict:
+    """Websocket event for a trade being created, updated or deleted."""
+    return {"type": "trade", "action": action, "tradeId": trade.id, "trade": serialize_trade(trade)}
+
+
+def message_cursor_filter(db: Session, trade_id: str, message_id: str, newer: bool):
+    """
+    Keyset condition selecting messages older (or newer) than `message_id`
+    in (created_at, id) order, or None if the id is not in the trade.
+    """
+    cursor = (
+        db.query(models.Message.created_at, models.Message.id)
+        .filter(models.Message.id == message_id, models.Message.trade_id == trade_id)
+        .first()
+    )
+    if not cursor:
+        return None
+    # Expanded row comparison so MySQL can range-scan (trade_id, created_at, id)
+    if newer:
+        return or_(
+            models.Message.created_at > cursor.created_at,
+            and_(models.Message.created_at == cursor.created_at, models.Message.id > cursor.id),
+        )
+    return or_(
+        models.Message.created_at < cursor.created_at,
+        and_(models.Message.created_at == cursor.created_at, models.Message.id < cursor.id),
+    )
+
+
+def messages_after(db: Session, trade_id: str, message_id: str | None, limit: int) -> list[models.Message] | None:
+    """
+    Up to `limit` messages of a trade newer than `message_id`, oldest first;
+    without an id, the latest `limit` messages. None if the id is unknown.
+    """
+    q = db.query(models.Message).filter(models.Message.trade_id == trade_id)
+    if message_id is None:
+        page = q.order_by(models.Message.created_at.desc(), models.Message.id.desc()).limit(limit).all()
+        page.reverse()
+        return page
+    condition = message_cursor_filter(db, trade_id, message_id, newer=True)
+    if condition is None:
+        return None
+    return q.filter(condition).order_by(models.Message.created_at.asc(), models.Message.id.asc()).limit(limit).all()
+
+
+def messages_since(db: Session, trade_id: str, since: datetime, limit: int) -> list[models.Message]:
+    """Up to `limit` messages of a trade created at or after `since`, oldest first."""
+    return (
+        db.query(models.Message)
+        .filter(models.Message.trade_id == trade_id, models.Message.created_at >= since)
+        .order_by(models.Message.created_at.asc(), models.Message.id.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+# Messages sent in one resync event when a replay buffer cannot cover a gap
+RESYNC_MESSAGE_LIMIT = 200
+
+
+def resync_snapshot(trade_id: str, after: str | None = None, since: datetime | None = None) -> dict | None:
+    """
+    Trade state plus the messages after message `after` (or created since
+    `since`; otherwise the latest page), for clients whose missed realtime
+    events are no longer buffered. Uses its own short-lived session. None if
+    the trade or cursor does not exist.
+    """
+    db = SessionLocal()
+    try:
+        trade = db.query(models.Trade).filter(models.Trade.id == trade_id).first()
+        if not trade:
+            return None
+        if since is not None and after is None:
+            messages = messages_since(db, trade_id, since, RESYNC_MESSAGE_LIMIT)
+        else:
+            messages = messages_after(db, trade_id, after, RESYNC_MESSAGE_LIMIT)
+        if messages is None:
+            return None
+        return {
+            "trade": serialize_trade(trade),
+            "messages": [serialize_message(m) for m in messages],
+            "hasMore": len(messages) == RESYNC_MESSAGE_LIMIT,
+        }
+    finally:
+        db.close()
+
+
+def mark_read(db: Session, trade_id: str, user_id: str, message_ids: list[str] | None = None) -> tuple[int, str | None]:
+    """
+    Mark messages `user_id` received in a trade as read with a single UPDATE
+    (no commit). With `message_ids`, only messages up to the newest of them
+    are marked; ids from other trades are ignored. Returns the number of rows
+    updated (-1 if none of the ids belong to the trade) and the id of that
+    newest message, for the read receipt.
+    """
+    stmt = (
+        update(models.Message)
+        .where(
+            models.Message.trade_id == trade_id,
+            models.Message.receiver_id == user_id,
+            models.Message.is_read == False,  # noqa: E712
+        )
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    )
+    up_to = None
+    if message_ids:
+        # Newest by time, whatever order the client listed the ids in
+        newest = (
+            db.query(models.Message.id, models.Message.created_at)
+            .filter(models.Message.id.in_(message_ids), models.Message.trade_id == trade_id)
+            .order_by(models.Message.created_at.desc(), models.Message.id.desc())
+            .first()
+        )
+        if newest is None:
+            return -1, None
+        up_to = newest.id
+        stmt = stmt.where(models.Message.created_at <= newest.created_at)
+
+    updated = db.execute(stmt).rowcount
+    refresh_unread_count(db, trade_id, user_id)
+    return updated, up_to
+
+
+@dataclass
+class PendingMessage:
+    trade_id: str
+    sender_id: str
+    receiver_id: str
+    content: str
+
+
+class MessageBatchWriter:
+    """
+    Group commit for messages sent over websockets.
+
+    Senders enqueue and await a future; a single writer task takes everything
+    that queued up while the previous commit was running and persists it in
+    one transaction. An idle worker commits each message immediately, a busy
+    one amortizes the commit across every concurrent sender.
+    """
+
+    def __init__(self, max_batch: int = 200) -> None:
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    async def submit(self, pending: PendingMessage) -> dict:
+        """Persist one message and return its serialized form once committed."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((pending, future))
+        return await future
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                results = await run_in_threadpool(self._write_batch, [pending for pending, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _write_batch(self, batch: list[PendingMessage]) -> list:
+        db = SessionLocal()
+        try:
+            trade_ids = {pending.trade_id for pending in batch}
+            trades = {
+                t.id: t
+                for t in db.query(models.Trade).filter(models.Trade.id.in_(trade_ids)).all()
+            }
+
+            results = []
+            for pending in batch:
+                trade = trades.get(pending.trade_id)
+                if not trade:
+                    results.append(LookupError("Trade not found"))
+                    continue
+                now = datetime.now(timezone.utc)
+                obj = models.Message(
+                    id=str(uuid4()),
+                    trade_id=pending.trade_id,
+                    sender_id=pending.sender_id,
+                    receiver_id=pending.receiver_id,
+                    content=pending.content,
+                    is_read=False,
+                    created_at=now,
+                )
+                db.add(obj)
+                trade.updated_at = now
+                record_message(db, obj, trade)
+                # Serialize before commit so expired attributes aren't reloaded
+                results.append(serialize_message(obj))
+
+            db.commit()
+            return results
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+message_writer = MessageBatchWriter()
@@ -0,0 +1,112 @@
+"""
+Scheduled purge of expired pending signups.
+
+Email-verification signups expire 24 hours after they are made, and until
+now their rows stayed in pending_signups for good. Every
+PENDING_SIGNUP_PURGE_INTERVAL seconds each worker deletes expired rows in
+batches of PENDING_SIGNUP_PURGE_BATCH, oldest first along
+idx_pending_signups_expires_at, committing after each batch so no
+transaction holds many row locks. The deletes are idempotent, so workers
+whose runs overlap only find fewer rows to delete.
+
+Signups waiting for admin approval are kept whatever their expires_at:
+approval does not check it.
+"""
+import asyncio
+import random
+from datetime import datetime
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_
+from ..config import settings
+from ..database import SessionLocal
+from .. import models
+from ..metrics import PENDING_SIGNUPS_PURGED, PENDING_SIGNUP_PURGE_RUNS
+
+# Per run, so a large backlog is worked off over several runs
+MAX_BATCHES_PER_RUN = 50
+
+
+def _expired(now: datetime):
+    return (
+        models.PendingSignup.expires_at < now,
+        or_(models.PendingSignup.verification_method.is_(None), models.PendingSignup.verification_method != "admin"),
+    )
+
+
+def purge_expired_batch(batch_size: int, now: datetime | None = None) -> int:
+    """Delete up to `batch_size` expired pending signups; returns how many were deleted."""
+    now = now or datetime.utcnow()
+    db = SessionLocal()
+    try:
+        ids = [
+            row.id
+            for row in db.query(models.PendingSignup.id)
+            .filter(*_expired(now))
+            .order_by(models.PendingSignup.expires_at)
+            .limit(batch_size)
+        ]
+        if not ids:
+            return 0
+        deleted = (
+            db.query(models.PendingSignup)
+            .filter(models.PendingSignup.id.in_(ids), *_expired(now))
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+async def purge_expired_pending_signups(batch_size: int | None = None) -> int:
+    """Delete expired pending signups a batch at a time; returns how many were deleted."""
+    batch_size = batch_size or settings.PENDING_SIGNUP_PURGE_BATCH
+    now = datetime.utcnow()
+    total = 0
+    for _ in range(MAX_BATCHES_PER_RUN):
+        deleted = await run_in_threadpool(purge_expired_batch, batch_size, now)
+        PENDING_SIGNUPS_PURGED.inc(deleted)
+        total += deleted
+        if deleted < batch_size:
+            break
+    return total
+
+
+class PendingSignupPurger:
+    """Runs purge_expired_pending_signups on this worker every PENDING_SIGNUP_PURGE_INTERVAL."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if settings.PENDING_SIGNUP_PURGE_INTERVAL <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        interval = settings.PENDING_SIGNUP_PURGE_INTERVAL
+        # Spread the workers' runs over the interval
+        await asyncio.sleep(random.uniform(0, interval))
+        while True:
+            try:
+                deleted = await purge_expired_pending_signups()
+                PENDING_SIGNUP_PURGE_RUNS.labels("ok").inc()
+                if deleted:
+                    print(f"Purged {deleted} expired pending signups")
+            except Exception as e:
+                PENDING_SIGNUP_PURGE_RUNS.labels("error").inc()
+                print(f"Pending signup purge failed: {e}")
+            await asyncio.sleep(interval)
+
+
+pending_signup_purger = PendingSignupPurger()
@@ -0,0 +1,55 @@
+"""
+Trade participant lookups for the realtime endpoints. Long-lived sockets and
+streams authorize through these instead of Depends(get_db), so they never
+pin a pooled connection: lookups use short-lived sessions and a TTL cache.
+"""
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_
+from ..cache import trade_participants_cache
+from ..database import SessionLocal
+from .. import models
+
+
+def load_counterparts(user_id: str) -> dict[str, str]:
+    """Trade id -> the other participant, for every trade of the user."""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(models.Trade.id, models.Trade.from_user_id, models.Trade.to_user_id)
+            .filter(or_(models.Trade.from_user_id == user_id, models.Trade.to_user_id == user_id))
+            .all()
+        )
+    finally:
+        db.close()
+    counterparts = {}
+    for trade_id, from_id, to_id in rows:
+        trade_participants_cache.set(trade_id, (from_id, to_id))
+        counterparts[trade_id] = to_id if from_id == user_id else from_id
+    return counterparts
+
+
+def _load_participants(trade_id: str) -> tuple[str, str] | None:
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(models.Trade.from_user_id, models.Trade.to_user_id)
+            .filter(models.Trade.id == trade_id)
+            .first()
+        )
+    finally:
+        db.close()
+    return (row.from_user_id, row.to_user_id) if row else None
+
+
+async def counterpart(trade_id: str, user_id: str) -> str | None:
+    """The other participant of a trade, or None if `user_id` is not part of it."""
+    participants = trade_participants_cache.get(trade_id)
+    if participants is None:
+        participants = await run_in_threadpool(_load_participants, trade_id)
+        if participants is None:
+            return None
+        trade_participants_cache.set(trade_id, participants)
+    from_id, to_id = participants
+    if user_id not in participants:
+        return None
+    return to_id if from_id == user_id else from_id
@@ -0,0 +1,73 @@
+"""
+Waiting for a pending signup to become an account.
+
+Rather than polling GET /supabase-auth/check-email/{email}, a client can
+call GET /supabase-auth/check-email/{email}/wait. The signup's status is read
+once, and if it is still pending the request sleeps here until the account
+is created or SIGNUP_STATUS_WAIT_SECONDS pass. confirm_email, verify_otp and
+admin approve_user announce the new account on SIGNUPS_CHANNEL of the event
+bus (see announce_signup_verified), and every worker wakes its waiters for
+that email, so a waiting request costs no database work until it is
+answered. Should an announcement be lost, the client's next wait reads
+the status again.
+
+The waiter is registered before the status is read, so an account created
+in between still wakes it.
+"""
+import asyncio
+import json
+from .metrics import SIGNUP_STATUS_WAITERS
+from .pubsub import bus
+
+SIGNUPS_CHANNEL = "signups"
+
+
+class SignupWaiters:
+	"""Requests on this worker waiting for an email's account, by email."""
+
+	def __init__(self) -> None:
+		# email -> (event set once the account exists, requests waiting on it)
+		self._waiting: dict[str, tuple[asyncio.Event, int]] = {}
+		self._count = 0
+
+	def __len__(self) -> int:
+		return self._count
+
+	def register(self, email: str) -> asyncio.Event:
+		"""Start waiting for `email`'s account; every register needs a release."""
+		event, waiting = self._waiting.get(email) or (asyncio.Event(), 0)
+		self._waiting[email] = (event, waiting + 1)
+		self._count += 1
+		SIGNUP_STATUS_WAITERS.inc()
+		return event
+
+	def release(self, email: str) -> None:
+		event, waiting = self._waiting[email]
+		if waiting > 1:
+			self._waiting[email] = (event, waiting - 1)
+		else:
+			del self._waiting[email]
+		self._count -= 1
+		SIGNUP_STATUS_WAITERS.dec()
+
+	def notify(self, email: str) -> None:
+		"""Wake the requests waiting for `email`'s account."""
+		entry = self._waiting.get(email)
+		if entry:
+			entry[0].set()
+
+
+signup_waiters = SignupWaiters()
+
+
+async def announce_signup_verified(email: str) -> None:
+	"""Wake requests waiting for `email`'s account here and on every other worker."""
+	signup_waiters.notify(email)
+	await bus.publish(SIGNUPS_CHANNEL, json.dumps({"email": email}).encode())
+
+
+async def _on_signup_verified(channel: str, data: bytes) -> None:
+	signup_waiters.notify(json.loads(data)["email"])
+
+
+bus.listen(SIGNUPS_CHANNEL, _on_signup_verified)
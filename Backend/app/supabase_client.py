@@ -1,31 +1,228 @@
 """
 Supabase configuration and client setup
+
+SupabaseAuthClient calls the Supabase Auth (GoTrue) REST API directly over
+one shared httpx.AsyncClient per worker, so auth endpoints await the network
+instead of blocking the event loop, and connections are reused between
+calls. It keeps no session state: calls made on behalf of a user take that
+user's access token.
+
+Every call has a timeout (SUPABASE_TIMEOUT). A circuit breaker counts
+consecutive failures (timeouts, connection errors, 5xx); after
+SUPABASE_BREAKER_THRESHOLD of them, calls fail fast with SupabaseUnavailable
+for SUPABASE_BREAKER_COOLDOWN seconds, then a single trial call decides
+whether to close the circuit again. Rejections such as a wrong password
+(4xx) are answers, not failures, and raise SupabaseError.
 """
-import os
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Dict
+import httpx
+from .config import settings
+from .metrics import SUPABASE_REQUESTS, SUPABASE_REQUEST_SECONDS, SUPABASE_CIRCUIT_OPEN
+
+
+class SupabaseError(Exception):
+    """Supabase answered with an error (e.g. invalid credentials or OTP)."""
+
+    def __init__(self, message: str, status_code: int | None = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SupabaseUnavailable(SupabaseError):
+    """Supabase could not be reached, timed out, failed, or the circuit is open."""
+
+
+@dataclass(frozen=True)
+class AuthUser:
+    id: str
+    email: str | None
+    email_confirmed_at: str | None
+
+
+@dataclass(frozen=True)
+class AuthSession:
+    access_token: str
+    user: AuthUser
+
+
+def _auth_user(body: Dict[str, Any] | None) -> AuthUser | None:
+    # Some endpoints return the user itself, others a session holding it
+    if body and isinstance(body.get("user"), dict):
+        body = body["user"]
+    if not body or not body.get("id"):
+        return None
+    return AuthUser(id=body["id"], email=body.get("email"), email_confirmed_at=body.get("email_confirmed_at"))
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_running = False
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < self.cooldown or self._trial_running:
+            return False
+        # Half-open: let one call through to probe
+        self._trial_running = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        SUPABASE_CIRCUIT_OPEN.set(0)
+
+    def abandon(self) -> None:
+        """A call let through ended without an outcome; allow another trial."""
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_running = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            SUPABASE_CIRCUIT_OPEN.set(1)
+
+
+class SupabaseAuthClient:
+    def __init__(self, url: str, anon_key: str) -> None:
+        self.url = url.rstrip("/")
+        self.anon_key = anon_key
+        self.breaker = CircuitBreaker(settings.SUPABASE_BREAKER_THRESHOLD, settings.SUPABASE_BREAKER_COOLDOWN)
+        self._http: httpx.AsyncClient | None = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.url and self.anon_key)
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=f"{self.url}/auth/v1",
+                headers={"apikey": self.anon_key},
+                timeout=httpx.Timeout(settings.SUPABASE_TIMEOUT, connect=min(settings.SUPABASE_TIMEOUT, 3.0)),
+                limits=httpx.Limits(
+                    max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.SUPABASE_MAX_CONNECTIONS,
+                ),
+            )
+        return self._http
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _request(
+        self,
+        operation: str,
+        method: str,
+        path: str,
+        json: Dict[str, Any] | None = None,
+        params: Dict[str, str] | None = None,
+        access_token: str | None = None,
+    ) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            SUPABASE_REQUESTS.labels(operation, "rejected").inc()
+            raise SupabaseUnavailable("Supabase is unavailable (circuit open)")
+
+        headers = {"Authorization": f"Bearer {access_token or self.anon_key}"}
+        started = time.perf_counter()
+        try:
+            response = await self._client().request(method, path, json=json, params=params, headers=headers)
+        except httpx.TimeoutException as e:
+            self.breaker.record_failure()
+            SUPABASE_REQUESTS.labels(operation, "timeout").inc()
+            raise SupabaseUnavailable(f"Supabase {operation} timed out") from e
+        except (httpx.HTTPError, OSError) as e:
+            self.breaker.record_failure()
+            SUPABASE_REQUESTS.labels(operation, "error").inc()
+            raise SupabaseUnavailable(f"Supabase {operation} failed: {e}") from e
+        except asyncio.CancelledError:
+            # The caller went away; don't hold the half-open trial slot forever
+            self.breaker.abandon()
+            raise
+        finally:
+            SUPABASE_REQUEST_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            SUPABASE_REQUESTS.labels(operation, "error").inc()
+            raise SupabaseUnavailable(f"Supabase {operation} failed with {response.status_code}", response.status_code)
+        self.breaker.record_success()
+        try:
+            body = response.json() if response.content else {}
+        except ValueError:
+            body = {}
+        if response.status_code >= 400:
+            SUPABASE_REQUESTS.labels(operation, "rejected_by_supabase").inc()
+            message = body.get("msg") or body.get("error_description") or body.get("message") or response.text
+            raise SupabaseError(f"Supabase {operation}: {message}", response.status_code)
+        SUPABASE_REQUESTS.labels(operation, "ok").inc()
+        return body
+
+    async def sign_up(self, email: str, password: str, data: Dict[str, Any] | None = None, redirect_to: str | None = None) -> AuthUser | None:
+        body = await self._request(
+            "sign_up", "POST", "/signup",
+            json={"email": email, "password": password, "data": data or {}},
+            params={"redirect_to": redirect_to} if redirect_to else None,
+        )
+        return _auth_user(body)
+
+    async def sign_in_with_password(self, email: str, password: str) -> AuthSession:
+        body = await self._request(
+            "sign_in_with_password", "POST", "/token",
+            json={"email": email, "password": password},
+            params={"grant_type": "password"},
+        )
+        user = _auth_user(body)
+        if not body.get("access_token") or not user:
+            raise SupabaseError("Supabase sign_in_with_password: no session returned")
+        return AuthSession(access_token=body["access_token"], user=user)
+
+    async def sign_in_with_otp(self, email: str) -> None:
+        await self._request("sign_in_with_otp", "POST", "/otp", json={"email": email, "create_user": True})
+
+    async def verify_otp(self, email: str, token: str, type: str) -> AuthUser | None:
+        body = await self._request("verify_otp", "POST", "/verify", json={"email": email, "token": token, "type": type})
+        return _auth_user(body)
+
+    async def get_user_by_id(self, user_id: str) -> AuthUser | None:
+        """Admin API; needs a service role key in SUPABASE_ANON_KEY."""
+        body = await self._request("get_user_by_id", "GET", f"/admin/users/{user_id}")
+        return _auth_user(body)
+
+    async def update_user(self, access_token: str, attributes: Dict[str, Any]) -> AuthUser | None:
+        """Update the user that `access_token` belongs to."""
+        body = await self._request("update_user", "PUT", "/user", json=attributes, access_token=access_token)
+        return _auth_user(body)
 
-load_dotenv()
+    async def reset_password_email(self, email: str, redirect_to: str | None = None) -> None:
+        await self._request(
+            "reset_password_email", "POST", "/recover",
+            json={"email": email},
+            params={"redirect_to": redirect_to} if redirect_to else None,
+        )
 
-# Supabase credentials (get these from your Supabase project settings)
-SUPABASE_URL = os.getenv("SUPABASE_URL", "")
-SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY", "")
 
-# Create Supabase client
-supabase: Client = None
+supabase = SupabaseAuthClient(settings.SUPABASE_URL, settings.SUPABASE_ANON_KEY)
 
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("✓ Supabase client initialized successfully")
-    except Exception as e:
-        print(f"✗ Failed to initialize Supabase client: {e}")
+if supabase.configured:
+    print("✓ Supabase client initialized successfully")
 else:
     print("⚠ Supabase credentials not found. Please set SUPABASE_URL and SUPABASE_ANON_KEY in .env file")
 
 
-def get_supabase_client() -> Client:
+def get_supabase_client() -> SupabaseAuthClient:
     """Get the Supabase client instance"""
-    if not supabase:
+    if not supabase.configured:
         raise Exception("Supabase client not initialized. Check your credentials.")
     return supabase
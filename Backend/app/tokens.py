@@ -0,0 +1,100 @@
+"""
+Access and refresh tokens.
+
+Access tokens live ACCESS_TOKEN_TTL_MINUTES and carry the user's role,
+status, name and token version, so get_current_user can authorize a request
+from the token alone (see principals.resolve_principal). A worker that has
+heard of a change to the user goes back to the database for that user's
+tokens; elsewhere a change is seen when the access token expires.
+
+Refresh tokens live REFRESH_TOKEN_TTL_DAYS and are exchanged at
+POST /supabase-auth/refresh for a new pair. Each can be used once: its jti
+goes into revoked_tokens when it is used or logged out, and stays there
+until the token would have expired. A refresh re-reads the user, so it
+fails while the user is suspended, once they are deleted, or once their
+token_version has been bumped by a password change or reset, which ends
+every session they had.
+"""
+from datetime import datetime
+from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import models
+from .dependencies import BLOCKED_STATUSES
+from .security import ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, create_refresh_token, decode_token_claims
+
+
+def access_token_for(user) -> str:
+	"""An access token for `user` (a User or a row with the same columns)."""
+	return create_access_token(user.id, claims={
+		"role": user.role,
+		"status": user.status,
+		"name": user.name,
+		"ver": user.token_version or 0,
+	})
+
+
+def issue_tokens(user) -> dict:
+	"""Response fields for a sign-in: an access token and a refresh token."""
+	return {
+		"token": access_token_for(user),
+		"refresh_token": create_refresh_token(user.id, user.token_version or 0),
+		"expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+	}
+
+
+def _revoke(db: Session, claims: dict) -> bool:
+	"""Record a refresh token as used; False if it already was."""
+	now = datetime.utcnow()
+	# Rows of tokens that have expired anyway are no longer needed
+	db.query(models.RevokedToken).filter(models.RevokedToken.expires_at < now).delete(synchronize_session=False)
+	db.add(models.RevokedToken(
+		jti=claims["jti"],
+		user_id=claims["sub"],
+		expires_at=datetime.utcfromtimestamp(claims["exp"]),
+	))
+	try:
+		db.commit()
+	except IntegrityError:
+		db.rollback()
+		return False
+	return True
+
+
+def refresh_tokens(db: Session, refresh_token: str) -> dict:
+	"""Exchange a refresh token for a new access and refresh token."""
+	invalid = HTTPException(
+		status_code=status.HTTP_401_UNAUTHORIZED,
+		detail="Invalid or expired refresh token",
+		headers={"WWW-Authenticate": "Bearer"},
+	)
+	claims = decode_token_claims(refresh_token, "refresh")
+	if not claims or not claims.get("sub") or not claims.get("jti"):
+		raise invalid
+
+	user = db.query(
+		models.User.id,
+		models.User.role,
+		models.User.status,
+		models.User.name,
+		models.User.token_version,
+	).filter(models.User.id == claims["sub"]).first()
+	if not user or (user.token_version or 0) != claims.get("ver"):
+		raise invalid
+	if user.status in BLOCKED_STATUSES:
+		raise HTTPException(
+			status_code=status.HTTP_403_FORBIDDEN,
+			detail="Your account has been suspended. Please contact support for assistance.",
+		)
+
+	# The insert is what claims the token, so of two concurrent refreshes one wins
+	if not _revoke(db, claims):
+		raise invalid
+	return issue_tokens(user)
+
+
+def revoke_refresh_token(db: Session, refresh_token: str) -> None:
+	"""Log a refresh token out; invalid or already revoked tokens are ignored."""
+	claims = decode_token_claims(refresh_token, "refresh")
+	if claims and claims.get("sub") and claims.get("jti"):
+		_revoke(db, claims)
@@ -1,37 +1,435 @@
-from collections import defaultdict
+from collections import defaultdict, deque
 from typing import DefaultDict, Set, Dict, Any
 from fastapi import WebSocket
 import asyncio
+import json
+import time
+from .config import settings
+from .pubsub import PubSubBackend, EventBus, bus
+from .presence import PresenceRegistry, TypingThrottle, PRESENCE_CHANNEL
+from .principals import PRINCIPALS_CHANNEL
+from .metrics import WS_QUEUE_DEPTH, WS_EVENTS_COALESCED, WS_SLOW_CONSUMERS, WS_CONNECTIONS, WS_REAPED, WS_REJECTED
+
+# Application close code sent to clients that cannot keep up with their trade
+SLOW_CONSUMER_CLOSE_CODE = 4008
+# Close codes for sockets that stopped responding / were refused at a cap
+IDLE_CLOSE_CODE = 1001
+TRY_AGAIN_LATER_CLOSE_CODE = 1013
+# Close code for sockets of a user who was suspended or deleted
+REVOKED_CLOSE_CODE = 1008
+
+PING_EVENT = '{"type":"ping"}'
+
+
+def _coalesce_key(payload: Dict[str, Any]) -> str:
+	"""Events that only matter in their latest state share a key and replace each other."""
+	if payload.get("type") in ("typing", "presence"):
+		return f"{payload['type']}:{payload.get('userId')}"
+	return ""
+
+
+class ConnectionWriter:
+	"""
+	Outbound side of one socket: a bounded queue drained by its own task, so a
+	slow client only ever delays itself. Events with a coalesce key that are
+	still waiting in the queue are replaced in place rather than queued twice.
+	"""
+
+	def __init__(self, websocket: WebSocket, user_id: str, maxsize: int, on_error) -> None:
+		self.websocket = websocket
+		self.user_id = user_id
+		self.last_seen = time.monotonic()
+		# Set once the socket is being dropped for falling behind
+		self.dropping = False
+		self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+		self._coalesced: Dict[str, str] = {}
+		self._on_error = on_error
+		self._task = asyncio.create_task(self._run())
+
+	@property
+	def depth(self) -> int:
+		return self._queue.qsize()
+
+	def offer(self, text: str, coalesce_key: str = "") -> bool:
+		"""Queue a pre-serialized event; False means the queue is full."""
+		if coalesce_key and coalesce_key in self._coalesced:
+			self._coalesced[coalesce_key] = text
+			WS_EVENTS_COALESCED.inc()
+			return True
+		try:
+			self._queue.put_nowait(("key", coalesce_key) if coalesce_key else ("text", text))
+		except asyncio.QueueFull:
+			return False
+		if coalesce_key:
+			self._coalesced[coalesce_key] = text
+		WS_QUEUE_DEPTH.observe(self._queue.qsize())
+		return True
+
+	async def _run(self) -> None:
+		try:
+			while True:
+				kind, value = await self._queue.get()
+				text = self._coalesced.pop(value, None) if kind == "key" else value
+				if text is not None:
+					await self.websocket.send_text(text)
+		except asyncio.CancelledError:
+			raise
+		except Exception:
+			await self._on_error(self.websocket)
+
+	async def close(self, code: int | None = None, reason: str = "") -> None:
+		if self._task is not asyncio.current_task():
+			self._task.cancel()
+		if code is not None:
+			try:
+				await self.websocket.close(code=code, reason=reason)
+			except Exception:
+				pass
+
+
+class ReplayBuffer:
+	"""
+	The most recent sequenced events of one trade seen by this worker, oldest
+	first. Coalescable events (typing) keep their slot with no text so that a
+	missing sequence number always means a lost event.
+	"""
+
+	def __init__(self, maxlen: int) -> None:
+		self._events: deque = deque(maxlen=maxlen)
+
+	@property
+	def latest_seq(self) -> int | None:
+		return self._events[-1][0] if self._events else None
+
+	def append(self, seq: int, text: str | None) -> None:
+		self._events.append((seq, text))
+
+	def since(self, seq: int) -> list[str] | None:
+		"""Events after `seq`, or None if some of them are not held here."""
+		if not self._events:
+			return None
+		if seq >= self._events[-1][0]:
+			return []
+		if seq < self._events[0][0] - 1:
+			return None
+		return [text for event_seq, text in self._events if event_seq > seq and text is not None]
+
+
+def trade_channel(trade_id: str) -> str:
+	return f"trade:{trade_id}"
+
+
+def user_channel(user_id: str) -> str:
+	return f"user:{user_id}"
+
+
+def _is_sequenced(channel: str) -> bool:
+	return channel.startswith("trade:")
 
 
 class TradeConnectionManager:
-	def __init__(self) -> None:
+	"""
+	Tracks this worker's realtime sockets and the channels they listen on:
+	`trade:<id>` for a trade's events and `user:<id>` for events addressed to
+	a user (e.g. a new trade). Broadcasts go through the event bus so they
+	also reach sockets held by other workers; each worker subscribes only to
+	the channels it currently has sockets for.
+
+	Trade events are published with a per-trade sequence number (added to the
+	event as "seq") and kept in a ReplayBuffer while the worker is subscribed,
+	so a reconnecting client can ask for just the events it missed. A trade
+	subscription lingers for REALTIME_REPLAY_LINGER seconds after its last
+	socket leaves, keeping the buffer gap-free across quick reconnects.
+
+	One heartbeat task per worker pings every socket and closes those that
+	have sent nothing for WS_IDLE_TIMEOUT, so half-open connections are
+	reaped instead of lingering until a send fails. The same tick refreshes
+	this worker's entry in the presence registry.
+
+	When a user's first socket on this worker joins a trade (or their last
+	connection anywhere goes away), a coalescable presence event is sent to
+	the trade.
+	"""
+
+	def __init__(self, backend: PubSubBackend | None = None, queue_size: int | None = None) -> None:
 		self.active_connections: DefaultDict[str, Set[WebSocket]] = defaultdict(set)
+		self._memberships: Dict[WebSocket, Set[str]] = {}
+		self._writers: Dict[WebSocket, ConnectionWriter] = {}
+		self._subscribed: Set[str] = set()
+		self._buffers: Dict[str, ReplayBuffer] = {}
+		self._linger: Dict[str, asyncio.TimerHandle] = {}
+		self.presence = PresenceRegistry()
+		self._heartbeat: asyncio.Task | None = None
 		self._lock = asyncio.Lock()
+		# A manager given its own backend (e.g. in a check script) gets a private bus
+		self._bus = bus if backend is None else EventBus(backend)
+		self._bus.listen(PRESENCE_CHANNEL, self._deliver)
+		self._bus.listen(PRINCIPALS_CHANNEL, self._on_principal_change)
+		self.queue_size = queue_size or settings.WS_OUTBOUND_QUEUE_SIZE
+
+	async def register(self, websocket: WebSocket, user_id: str) -> bool:
+		"""
+		Accept a socket and give it an outbound writer; it receives nothing
+		until subscribed. Returns False (the socket is closed) at a connection cap.
+		"""
+		reject = None
+		if len(self._writers) >= settings.WS_MAX_CONNECTIONS:
+			reject = "worker_limit"
+		elif self.presence.local_count(user_id) >= settings.WS_MAX_CONNECTIONS_PER_USER:
+			reject = "user_limit"
+		if reject:
+			WS_REJECTED.labels(reason=reject).inc()
+			await websocket.accept()
+			await websocket.close(code=TRY_AGAIN_LATER_CLOSE_CODE, reason="Too many connections")
+			return False
 
-	async def connect(self, trade_id: str, websocket: WebSocket) -> None:
 		await websocket.accept()
+		await self._bus.start()
 		async with self._lock:
-			self.active_connections[trade_id].add(websocket)
+			self._writers[websocket] = ConnectionWriter(websocket, user_id, self.queue_size, self._on_send_error)
+			self._memberships[websocket] = set()
+			first = self.presence.connected(user_id)
+			WS_CONNECTIONS.set(len(self._writers))
+		if first:
+			await self._publish(PRESENCE_CHANNEL, self.presence.change_event(user_id, True))
+		if self._heartbeat is None or self._heartbeat.done():
+			self._heartbeat = asyncio.create_task(self._run_heartbeat())
+		return True
 
-	async def disconnect(self, trade_id: str, websocket: WebSocket) -> None:
+	async def unregister(self, websocket: WebSocket, code: int | None = None, reason: str = "") -> None:
+		last = False
+		announcements: list[tuple[str, str, bool]] = []
 		async with self._lock:
-			connections = self.active_connections.get(trade_id)
-			if connections and websocket in connections:
-				connections.remove(websocket)
-				if not connections:
-					self.active_connections.pop(trade_id, None)
+			writer = self._writers.pop(websocket, None)
+			WS_CONNECTIONS.set(len(self._writers))
+			if writer:
+				# Before leaving channels, so they see whether the user is still online
+				last = self.presence.disconnected(writer.user_id)
+			for channel in self._memberships.pop(websocket, ()):
+				await self._remove_from_channel(channel, websocket, writer.user_id if writer else None, announcements)
+		if last:
+			await self._publish(PRESENCE_CHANNEL, self.presence.change_event(writer.user_id, False))
+		await self._announce_all(announcements)
+		if writer:
+			await writer.close(code, reason)
 
-	async def broadcast_message(self, trade_id: str, payload: Dict[str, Any]) -> None:
+	def touch(self, websocket: WebSocket) -> None:
+		"""Record inbound activity (any frame, including pong) on a socket."""
+		writer = self._writers.get(websocket)
+		if writer:
+			writer.last_seen = time.monotonic()
+
+	async def _run_heartbeat(self) -> None:
+		while self._writers:
+			await asyncio.sleep(settings.WS_PING_INTERVAL)
+			deadline = time.monotonic() - settings.WS_IDLE_TIMEOUT
+			await self._publish(PRESENCE_CHANNEL, self.presence.refresh_event())
+			for websocket, writer in list(self._writers.items()):
+				if writer.last_seen < deadline:
+					WS_REAPED.inc()
+					await self.unregister(websocket, code=IDLE_CLOSE_CODE, reason="Idle timeout")
+				elif not writer.offer(PING_EVENT):
+					await self._drop_slow_consumer(websocket)
+
+	async def subscribe(self, websocket: WebSocket, channel: str, since_seq: int | None = None) -> bool:
+		"""
+		Add a socket to a channel. With `since_seq`, the trade events after it
+		are queued to the socket as one {"type": "replay"} event; returns False
+		if this worker's buffer cannot cover the gap and the caller must resync
+		the client some other way.
+		"""
+		announcements: list[tuple[str, str, bool]] = []
+		async with self._lock:
+			memberships = self._memberships.get(websocket)
+			if memberships is None:
+				return False
+			if channel not in memberships:
+				memberships.add(channel)
+				await self._retain(channel)
+				user_id = self._writers[websocket].user_id
+				first_here = not self._user_in_channel(channel, user_id)
+				self.active_connections[channel].add(websocket)
+				if first_here and _is_sequenced(channel):
+					announcements.append((channel, user_id, True))
+			# No await between joining and queuing the replay, so live events follow it
+			replayed = since_seq is None or self._replay(websocket, channel, since_seq)
+		await self._announce_all(announcements)
+		return replayed
+
+	async def unsubscribe(self, websocket: WebSocket, channel: str) -> None:
+		announcements: list[tuple[str, str, bool]] = []
 		async with self._lock:
-			targets = list(self.active_connections.get(trade_id, []))
+			memberships = self._memberships.get(websocket)
+			if memberships is None or channel not in memberships:
+				return
+			memberships.discard(channel)
+			writer = self._writers.get(websocket)
+			await self._remove_from_channel(channel, websocket, writer.user_id if writer else None, announcements)
+		await self._announce_all(announcements)
+
+	async def _remove_from_channel(self, channel: str, websocket: WebSocket, user_id: str | None, announcements: list) -> None:
+		# Caller holds self._lock, and publishes `announcements` once it has let go
+		connections = self.active_connections.get(channel)
+		if connections and websocket in connections:
+			connections.remove(websocket)
+			if user_id and _is_sequenced(channel) and not self.presence.is_online(user_id):
+				announcements.append((channel, user_id, False))
+			if not connections:
+				self.active_connections.pop(channel, None)
+				if channel in self._buffers and settings.REALTIME_REPLAY_LINGER > 0:
+					loop = asyncio.get_running_loop()
+					self._linger[channel] = loop.call_later(
+						settings.REALTIME_REPLAY_LINGER,
+						lambda: asyncio.create_task(self._expire(channel)),
+					)
+				else:
+					await self._release(channel)
+
+	def _user_in_channel(self, channel: str, user_id: str) -> bool:
+		for connection in self.active_connections.get(channel, ()):
+			writer = self._writers.get(connection)
+			if writer and writer.user_id == user_id:
+				return True
+		return False
+
+	async def _announce_presence(self, channel: str, user_id: str, online: bool) -> None:
+		trade_id = channel.partition(":")[2]
+		await self._publish(channel, {"type": "presence", "tradeId": trade_id, "userId": user_id, "online": online})
+
+	async def _announce_all(self, announcements: list[tuple[str, str, bool]]) -> None:
+		# Never under self._lock: a publish can deliver inline, and delivery may drop a socket
+		for channel, user_id, online in announcements:
+			await self._announce_presence(channel, user_id, online)
+
+	async def _retain(self, channel: str) -> None:
+		# Caller holds self._lock
+		handle = self._linger.pop(channel, None)
+		if handle:
+			handle.cancel()
+		if channel not in self._subscribed:
+			self._subscribed.add(channel)
+			if _is_sequenced(channel):
+				self._buffers[channel] = ReplayBuffer(settings.REALTIME_REPLAY_BUFFER_SIZE)
+			await self._bus.subscribe(channel, self._deliver)
+
+	async def _release(self, channel: str) -> None:
+		# Caller holds self._lock
+		self._subscribed.discard(channel)
+		self._buffers.pop(channel, None)
+		await self._bus.unsubscribe(channel, self._deliver)
+
+	async def _expire(self, channel: str) -> None:
+		async with self._lock:
+			self._linger.pop(channel, None)
+			if channel in self._subscribed and not self.active_connections.get(channel):
+				await self._release(channel)
+
+	def _replay(self, websocket: WebSocket, channel: str, since_seq: int) -> bool:
+		buffer = self._buffers.get(channel)
+		events = buffer.since(since_seq) if buffer else None
+		if events is None:
+			return False
+		if events:
+			trade_id = channel.partition(":")[2]
+			text = '{"type":"replay","tradeId":%s,"events":[%s]}' % (json.dumps(trade_id), ",".join(events))
+			writer = self._writers.get(websocket)
+			if writer and not writer.offer(text):
+				asyncio.create_task(self._drop_slow_consumer(websocket))
+		return True
+
+	def latest_seq(self, trade_id: str) -> int | None:
+		"""Sequence number of the newest event of a trade seen by this worker."""
+		buffer = self._buffers.get(trade_channel(trade_id))
+		return buffer.latest_seq if buffer else None
 
+	async def send_personal(self, websocket: WebSocket, payload: Dict[str, Any]) -> None:
+		"""Queue an event for one socket behind anything already waiting for it."""
+		writer = self._writers.get(websocket)
+		if writer and not writer.offer(json.dumps(payload, separators=(",", ":"))):
+			await self._drop_slow_consumer(websocket)
+
+	async def broadcast_message(self, trade_id: str, payload: Dict[str, Any]) -> None:
+		await self._publish(trade_channel(trade_id), payload)
+
+	async def publish_to_user(self, user_id: str, payload: Dict[str, Any], join_trade: str | None = None) -> None:
+		"""
+		Send an event to every socket of a user. With `join_trade`, those sockets
+		are also subscribed to that trade's channel before the event is queued.
+		"""
+		await self._publish(user_channel(user_id), payload, join_trade or "")
+
+	async def _publish(self, channel: str, payload: Dict[str, Any], join: str = "") -> None:
+		# Serialize once; a one-line header (coalesce key, trade to join) precedes the JSON
+		header = f"{_coalesce_key(payload)}\t{join}".encode()
+		data = header + b"\n" + json.dumps(payload, separators=(",", ":")).encode()
+		if _is_sequenced(channel):
+			await self._bus.publish_sequenced(channel, data)
+		else:
+			await self._bus.publish(channel, data)
+
+	async def _deliver(self, channel: str, data: bytes) -> None:
+		"""Queue a published event on this worker's sockets for the channel."""
+		seq = None
+		if _is_sequenced(channel):
+			seq_bytes, _, data = data.partition(b"\n")
+			seq = int(seq_bytes)
+		header, _, body = data.partition(b"\n")
+		coalesce_key, _, join = header.decode().partition("\t")
+		text = body.decode()
+		if channel == PRESENCE_CHANNEL:
+			self.presence.apply(json.loads(text))
+			return
+		if seq is not None:
+			text = text[:-1] + ',"seq":%d}' % seq
+			buffer = self._buffers.get(channel)
+			if buffer:
+				buffer.append(seq, None if coalesce_key else text)
+
+		targets = list(self.active_connections.get(channel, ()))
 		for connection in targets:
-			try:
-				await connection.send_json(payload)
-			except Exception:
-				await self.disconnect(trade_id, connection)
+			if join:
+				await self.subscribe(connection, trade_channel(join))
+			writer = self._writers.get(connection)
+			if writer and not writer.offer(text, coalesce_key):
+				# Not awaited: delivery may run inside a publish by a caller that holds self._lock
+				asyncio.create_task(self._drop_slow_consumer(connection))
 
+	async def _drop_slow_consumer(self, websocket: WebSocket) -> None:
+		writer = self._writers.get(websocket)
+		if writer is None or writer.dropping:
+			return
+		writer.dropping = True
+		WS_SLOW_CONSUMERS.inc()
+		await self.unregister(websocket, code=SLOW_CONSUMER_CLOSE_CODE, reason="Slow consumer")
 
-trade_ws_manager = TradeConnectionManager()
+	async def disconnect_user(self, user_id: str) -> None:
+		"""Close a user's sockets and event streams on this worker."""
+		for websocket, writer in list(self._writers.items()):
+			if writer.user_id == user_id:
+				await self.unregister(websocket, code=REVOKED_CLOSE_CODE, reason="Access revoked")
+
+	async def _on_principal_change(self, channel: str, data: bytes) -> None:
+		event = json.loads(data)
+		if event.get("disconnect"):
+			# Not awaited, like slow consumer drops: the announcement may be delivered inside a publish
+			asyncio.create_task(self.disconnect_user(event["user"]))
+
+	async def _on_send_error(self, websocket: WebSocket) -> None:
+		await self.unregister(websocket)
 
+	def queue_stats(self) -> list[Dict[str, Any]]:
+		"""Current outbound queue depth of every socket on this worker."""
+		return [
+			{
+				"user_id": writer.user_id,
+				"channels": len(self._memberships.get(websocket, ())),
+				"idle_seconds": round(time.monotonic() - writer.last_seen, 1),
+				"queue_depth": writer.depth,
+				"queue_size": self.queue_size,
+			}
+			for websocket, writer in self._writers.items()
+		]
+
+
+trade_ws_manager = TradeConnectionManager()
+typing_throttle = TypingThrottle(trade_ws_manager.broadcast_message)
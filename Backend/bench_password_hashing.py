@@ -0,0 +1,116 @@
+"""
+Event-loop lag during a login storm, with password verification run inline
+(how the auth handlers used to call security.verify_password) and through
+the hashing executor (app.hashing.verify_password_async). In-process; no
+server or database needed.
+
+A probe task sleeps PROBE_INTERVAL in a loop and records how late it wakes
+up: that lateness is what every other request and websocket on the worker
+would see. --logins verifications of a real Argon2 hash are started at
+once, as a burst of POST /supabase-auth/login would.
+
+    python bench_password_hashing.py [--logins 32] [--workers 2] [--executor process|thread]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+PROBE_INTERVAL = 0.01
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=32, help="concurrent login attempts")
+    parser.add_argument("--workers", type=int, default=2, help="hashing executor workers")
+    parser.add_argument("--executor", choices=("process", "thread"), default="process")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+os.environ.update({
+    "SSL_CA_PATH": "",
+    "PASSWORD_HASH_EXECUTOR": ARGS.executor,
+    "PASSWORD_HASH_WORKERS": str(ARGS.workers),
+    # Admit the whole storm; rejection under overload is not what is measured here
+    "PASSWORD_HASH_QUEUE_SIZE": str(ARGS.logins),
+})
+
+from app import hashing  # noqa: E402
+from app.security import hash_password, verify_password  # noqa: E402
+
+PASSWORD = "correct horse battery staple"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def probe(lags, stop):
+    while not stop.is_set():
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def storm(password_hash, offload):
+    async def login():
+        if offload:
+            ok = await hashing.verify_password_async(PASSWORD, password_hash)
+        else:
+            # What the handlers did: a blocking call inside async def
+            ok = verify_password(PASSWORD, password_hash)
+        assert ok
+        # From the start of the storm, as a client would see it
+        return time.perf_counter() - started
+
+    lags = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(login() for _ in range(ARGS.logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    return lags, latencies, elapsed
+
+
+def report(label, lags, latencies, elapsed):
+    ms = lambda seconds: seconds * 1000  # noqa: E731
+    print(f"{label}")
+    print(f"  logins/s:            {len(latencies) / elapsed:.1f} ({len(latencies)} in {elapsed:.2f}s)")
+    print(f"  login latency ms:    p50 {ms(percentile(latencies, 50)):.0f}  p99 {ms(percentile(latencies, 99)):.0f}")
+    print(f"  event-loop lag ms:   p50 {ms(percentile(lags, 50)):.1f}  p99 {ms(percentile(lags, 99)):.1f}"
+          f"  max {ms(max(lags)):.1f}  mean {ms(statistics.mean(lags)):.1f}  ({len(lags)} probes)")
+
+
+async def run():
+    password_hash = hash_password(PASSWORD)
+    # Start the pool before measuring; spawning processes is a one-off cost
+    await asyncio.gather(*(hashing.verify_password_async(PASSWORD, password_hash) for _ in range(ARGS.workers)))
+
+    before = await storm(password_hash, offload=False)
+    after = await storm(password_hash, offload=True)
+    print(f"{ARGS.logins} concurrent logins, {ARGS.executor} executor with {ARGS.workers} workers, {os.cpu_count()} CPUs\n")
+    report("Inline verify_password (before)", *before)
+    report("verify_password_async (after)", *after)
+
+    worst_before, worst_after = max(before[0]), max(after[0])
+    if worst_after < worst_before / 4:
+        print(f"\n✓ Worst event-loop stall {worst_before * 1000:.0f} ms -> {worst_after * 1000:.0f} ms")
+    else:
+        print(f"\n✗ Worst event-loop stall {worst_before * 1000:.0f} ms -> {worst_after * 1000:.0f} ms; offloading did not help")
+
+
+def main():
+    try:
+        asyncio.run(run())
+    finally:
+        hashing.shutdown()
+
+
+if __name__ == "__main__":
+    main()
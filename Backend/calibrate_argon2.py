@@ -0,0 +1,127 @@
+"""
+Pick Argon2id parameters for this host and write them to the env file.
+
+Following RFC 9106, it takes the largest memory cost that fits the
+--target-ms budget, then as many passes as still fit. Memory costs run from
+the OWASP minimum (19 MiB) up to --max-memory-mib; below 46 MiB at least 2
+passes are required. Run it on the instance type the backend is deployed
+to, while idle.
+
+The result is written as ARGON2_TIME_COST, ARGON2_MEMORY_COST and
+ARGON2_PARALLELISM to --env-file (other lines are kept). New hashes use it
+after a restart, and each user's hash is upgraded on their next login.
+
+Peak hashing memory per host is roughly
+web workers x PASSWORD_HASH_WORKERS x memory cost; keep it in mind when
+raising --max-memory-mib.
+
+    python calibrate_argon2.py [--target-ms 250] [--max-memory-mib 64] [--parallelism 1] [--env-file .env] [--dry-run]
+"""
+import argparse
+import os
+import re
+import statistics
+import time
+
+from passlib.hash import argon2
+
+PASSWORD = "correct horse battery staple"
+# KiB; 19 MiB and 46 MiB are OWASP's recommended minimums for 2 and 1 passes
+MEMORY_COSTS = (19456, 32768, 47104, 65536, 131072, 262144, 524288)
+MIN_TIME_COST = {19456: 2, 32768: 2}
+RUNS = 3
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250.0, help="time budget for one hash on this host")
+    parser.add_argument("--max-memory-mib", type=int, default=64, help="largest memory cost to consider, per hash")
+    parser.add_argument("--parallelism", type=int, default=1,
+                        help="lanes per hash; more only helps with idle cores beyond PASSWORD_HASH_WORKERS")
+    parser.add_argument("--env-file", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+    parser.add_argument("--dry-run", action="store_true", help="print the choice without writing it")
+    return parser.parse_args()
+
+
+def time_hash(time_cost, memory_cost, parallelism):
+    hasher = argon2.using(rounds=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        hasher.hash(PASSWORD)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def calibrate(target, max_memory, parallelism):
+    """(time_cost, memory_cost, seconds) of the setting chosen for `target` seconds, or None."""
+    def measure(time_cost, memory_cost):
+        elapsed = time_hash(time_cost, memory_cost, parallelism)
+        print(f"  m={memory_cost // 1024:>4} MiB  t={time_cost:<2}  {elapsed * 1000:7.1f} ms")
+        return elapsed
+
+    chosen = None
+    for memory_cost in MEMORY_COSTS:
+        if memory_cost > max_memory:
+            break
+        time_cost = MIN_TIME_COST.get(memory_cost, 1)
+        elapsed = measure(time_cost, memory_cost)
+        if elapsed > target:
+            break
+        chosen = (time_cost, memory_cost, elapsed)
+    if chosen is None:
+        return None
+
+    time_cost, memory_cost, _ = chosen
+    while True:
+        elapsed = measure(time_cost + 1, memory_cost)
+        if elapsed > target:
+            return chosen
+        time_cost += 1
+        chosen = (time_cost, memory_cost, elapsed)
+
+
+def write_env(path, values):
+    lines = []
+    if os.path.exists(path):
+        with open(path) as f:
+            lines = f.read().splitlines()
+    remaining = dict(values)
+    for i, line in enumerate(lines):
+        match = re.match(r"\s*([A-Za-z_][A-Za-z0-9_]*)\s*=", line)
+        if match and match.group(1) in remaining:
+            key = match.group(1)
+            lines[i] = f"{key}={remaining.pop(key)}"
+    if remaining:
+        lines += ["", "# Argon2 password hashing cost (calibrate_argon2.py)"]
+        lines += [f"{key}={value}" for key, value in remaining.items()]
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def main():
+    args = parse_args()
+    print(f"Calibrating Argon2id for {args.target_ms:.0f} ms per hash, up to {args.max_memory_mib} MiB,"
+          f" parallelism {args.parallelism}, {os.cpu_count()} CPUs\n")
+    best = calibrate(args.target_ms / 1000, args.max_memory_mib * 1024, args.parallelism)
+    if best is None:
+        print(f"\n✗ Even m=19 MiB, t=2 takes over {args.target_ms:.0f} ms here; raise --target-ms")
+        raise SystemExit(1)
+
+    time_cost, memory_cost, elapsed = best
+    values = {
+        "ARGON2_TIME_COST": time_cost,
+        "ARGON2_MEMORY_COST": memory_cost,
+        "ARGON2_PARALLELISM": args.parallelism,
+    }
+    print(f"\n✓ Chose t={time_cost}, m={memory_cost // 1024} MiB, p={args.parallelism}: {elapsed * 1000:.0f} ms per hash")
+    if args.dry_run:
+        for key, value in values.items():
+            print(f"  {key}={value}")
+        return
+    write_env(args.env_file, values)
+    print(f"✓ Wrote {', '.join(values)} to {args.env_file}; restart the backend to apply")
+
+
+if __name__ == "__main__":
+    main()
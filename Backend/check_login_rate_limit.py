@@ -0,0 +1,160 @@
+"""
+Login rate limiter checks; no server or MySQL needed (uses a temporary
+SQLite database and bucket files).
+
+Checks that:
+
+- a bucket admits its burst, then refuses with the wait until its next token
+- the buckets are shared: processes taking from one key concurrently are
+  admitted exactly the burst between them
+- POST /supabase-auth/login answers 429 with Retry-After once an email's
+  bucket is empty, without verifying the password, and other emails from
+  the same IP are still admitted until the IP's own bucket is empty
+- the client IP is the one the proxy appended to X-Forwarded-For, so
+  clients behind it get their own buckets and cannot pick new ones
+- successful logins give their IP token back
+- admitted and refused attempts are counted in /metrics, which refuses
+  requests without METRICS_TOKEN
+
+    python check_login_rate_limit.py
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix="login-limit-check-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORK_DIR, 'check.db')}",
+    "SSL_CA_PATH": "",
+    "METRICS_TOKEN": "check-metrics-token",
+    "PASSWORD_HASH_EXECUTOR": "thread",
+    "LOGIN_RATE_LIMIT_PATH": os.path.join(WORK_DIR, "limits"),
+    "LOGIN_RATE_EMAIL_BURST": "5",
+    "LOGIN_RATE_EMAIL_PER_MINUTE": "6",
+    "LOGIN_RATE_IP_BURST": "8",
+    "LOGIN_RATE_IP_PER_MINUTE": "6",
+})
+
+METRICS_AUTH = {"Authorization": "Bearer check-metrics-token"}
+
+import httpx  # noqa: E402
+from app.ratelimit import SharedTokenBuckets  # noqa: E402
+
+
+def take_many(path, count, results):
+    # Spawned processes re-import this module, so WORK_DIR differs; take the path as given
+    buckets = SharedTokenBuckets("check", 20, 0.001, 1024, path)
+    results.put(sum(1 for _ in range(count) if buckets.take("alice@example.com") == 0))
+
+
+def check_bucket():
+    buckets = SharedTokenBuckets("bucket", 3, 10.0, 1024)
+    assert [buckets.take("k") for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = buckets.take("k")
+    assert 0 < wait <= 0.1, wait
+    assert buckets.take("other") == 0.0, "keys share a bucket"
+    time.sleep(wait + 0.01)
+    assert buckets.take("k") == 0.0, "bucket did not refill"
+
+    started = time.perf_counter()
+    for i in range(10000):
+        buckets.take(f"key-{i}")
+    per_call = (time.perf_counter() - started) / 10000
+    print(f"✓ Bucket admits its burst, then refuses for {wait * 1000:.0f} ms until it refills ({per_call * 1e6:.1f} µs per take)")
+
+
+def check_shared():
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=take_many, args=(os.path.join(WORK_DIR, "shared"), 15, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    admitted = sum(results.get(timeout=30) for _ in processes)
+    for process in processes:
+        process.join()
+    assert admitted == 20, f"{admitted} of 60 attempts admitted across processes, burst is 20"
+    print("✓ 4 processes making 60 attempts on one key were admitted the burst of 20 between them")
+
+
+async def check_login_endpoint():
+    from app.main import app
+    from app.database import SessionLocal
+    from app import models
+    from app.security import hash_password
+
+    db = SessionLocal()
+    for name in ("carol", "dave"):
+        db.add(models.User(
+            id=f"u-{name}", name=name, email=f"{name}@example.com",
+            password_hash=hash_password(f"{name}-password"), is_verified=True, auth_provider="local",
+        ))
+    db.commit()
+    db.close()
+
+    # Every request comes through one proxy, as on Railway
+    transport = httpx.ASGITransport(app=app, client=("10.0.0.2", 40000))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        async def login(email, password, forwarded="203.0.113.7"):
+            headers = {"X-Forwarded-For": forwarded}
+            return await http.post("/supabase-auth/login", json={"email": email, "password": password}, headers=headers)
+
+        async def verifications():
+            metrics = (await http.get("/metrics/", headers=METRICS_AUTH)).text
+            for line in metrics.splitlines():
+                if line.startswith('password_hash_seconds_count{operation="verify"}'):
+                    return float(line.split()[-1])
+            return 0.0
+
+        # The client sends its own X-Forwarded-For; only the proxy's entry counts
+        statuses = [
+            (await login("carol@example.com", "guess", f"198.51.100.{i}, 203.0.113.7")).status_code
+            for i in range(5)
+        ]
+        assert statuses == [401] * 5, statuses
+        before = await verifications()
+        res = await login("carol@example.com", "guess")
+        assert res.status_code == 429 and int(res.headers["Retry-After"]) >= 1, (res.status_code, res.headers)
+        assert (await login("carol@example.com", "carol-password")).status_code == 429
+        assert await verifications() == before, "a refused login still verified the password"
+        print(f"✓ 6th attempt on one email got 429 (Retry-After {res.headers['Retry-After']}s) without hashing")
+
+        # The IP has used 7 of its 8 tokens, including the refused attempts;
+        # successful logins give theirs back
+        statuses = [(await login("dave@example.com", "dave-password")).status_code for _ in range(3)]
+        assert statuses == [200] * 3, statuses
+        print("✓ Successful logins from the IP did not use up its bucket")
+
+        assert (await login("dave@example.com", "guess")).status_code == 401
+        res = await login("dave@example.com", "dave-password")
+        assert res.status_code == 429, res.status_code
+        print("✓ Another email from the same IP was admitted until the IP's bucket ran out")
+
+        assert (await login("dave@example.com", "dave-password", "203.0.113.8")).status_code == 200
+        print("✓ Another client behind the same proxy has its own IP bucket")
+
+        metrics = (await http.get("/metrics/", headers=METRICS_AUTH)).text
+        assert 'login_attempts_total{endpoint="supabase-auth",outcome="admitted"} 10.0' in metrics
+        assert 'login_attempts_total{endpoint="supabase-auth",outcome="limited_email"} 2.0' in metrics
+        assert 'login_attempts_total{endpoint="supabase-auth",outcome="limited_ip"} 1.0' in metrics
+        print("✓ Admitted and refused attempts are counted in /metrics")
+
+        assert (await http.get("/metrics/")).status_code == 401
+        assert (await http.get("/metrics/", headers={"Authorization": "Bearer guess"})).status_code == 401
+        print("✓ /metrics refuses scrapers without METRICS_TOKEN")
+
+
+def main():
+    try:
+        check_bucket()
+        check_shared()
+        asyncio.run(check_login_endpoint())
+    except Exception as e:
+        print(f"✗ Login rate limit check failed: {e!r}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
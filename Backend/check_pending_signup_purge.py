@@ -0,0 +1,118 @@
+"""
+Pending signup purge checks; no server or MySQL needed (uses a temporary
+SQLite database).
+
+Checks that:
+
+- expired email signups are deleted in batches of the configured size,
+  oldest first, and unexpired ones are kept
+- signups waiting for admin approval are kept however old they are
+- the deleted rows and runs are counted in /metrics
+- the job starts with the app and stops with it
+
+    python check_pending_signup_purge.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+WORK_DIR = tempfile.mkdtemp(prefix="pending-purge-check-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORK_DIR, 'check.db')}",
+    "SSL_CA_PATH": "",
+    "METRICS_TOKEN": "check-metrics-token",
+    "PASSWORD_HASH_EXECUTOR": "thread",
+    "LOGIN_RATE_LIMIT_PATH": "",
+    "PENDING_SIGNUP_PURGE_INTERVAL": "0.2",
+    "PENDING_SIGNUP_PURGE_BATCH": "100",
+})
+
+METRICS_AUTH = {"Authorization": "Bearer check-metrics-token"}
+
+import httpx  # noqa: E402
+
+
+def seed(db, models, count, expires_at, method="email"):
+    for i in range(count):
+        db.add(models.PendingSignup(
+            id=str(uuid4()), name="pending", email=f"{uuid4()}@example.com",
+            password_hash="x", verification_method=method, expires_at=expires_at,
+        ))
+    db.commit()
+
+
+async def check_purge():
+    from app.main import app
+    from app.database import SessionLocal
+    from app import models
+    from app.services import pending_signups
+
+    now = datetime.utcnow()
+    db = SessionLocal()
+    seed(db, models, 1050, now - timedelta(hours=1))
+    seed(db, models, 20, now + timedelta(hours=23))
+    seed(db, models, 5, now - timedelta(days=30), method="admin")
+
+    batches = []
+    purge_batch = pending_signups.purge_expired_batch
+
+    def counting_batch(batch_size, now=None):
+        deleted = purge_batch(batch_size, now)
+        batches.append(deleted)
+        return deleted
+
+    pending_signups.purge_expired_batch = counting_batch
+    try:
+        deleted = await pending_signups.purge_expired_pending_signups()
+    finally:
+        pending_signups.purge_expired_batch = purge_batch
+    assert deleted == 1050, deleted
+    assert batches == [100] * 10 + [50], batches
+    print(f"✓ 1050 expired signups deleted in {len(batches)} batches of at most 100")
+
+    left = db.query(models.PendingSignup.verification_method, models.PendingSignup.expires_at).all()
+    assert sorted(row.verification_method for row in left) == ["admin"] * 5 + ["email"] * 20, len(left)
+    assert all(row.expires_at > now for row in left if row.verification_method == "email")
+    print("✓ Unexpired signups and signups awaiting admin approval were kept")
+
+    # The scheduled job runs within one interval of startup
+    seed(db, models, 30, now - timedelta(minutes=5))
+    db.close()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        await app.router.startup()
+        try:
+            for _ in range(50):
+                await asyncio.sleep(0.1)
+                db = SessionLocal()
+                remaining = db.query(models.PendingSignup).count()
+                db.close()
+                if remaining == 25:
+                    break
+            assert remaining == 25, f"{remaining} pending signups left after startup"
+            metrics = (await http.get("/metrics/", headers=METRICS_AUTH)).text
+        finally:
+            await app.router.shutdown()
+    assert pending_signups.pending_signup_purger._task is None, "job still running after shutdown"
+    print("✓ The job started with the app purged new expired signups, and stopped on shutdown")
+
+    assert "pending_signups_purged_total 1080.0" in metrics, [
+        line for line in metrics.splitlines() if line.startswith("pending_signups_purged")
+    ]
+    assert 'pending_signup_purge_runs_total{outcome="ok"}' in metrics
+    print("✓ Purged rows and runs are counted in /metrics")
+
+
+def main():
+    try:
+        asyncio.run(check_purge())
+    except Exception as e:
+        print(f"✗ Pending signup purge check failed: {e!r}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
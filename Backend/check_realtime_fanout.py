@@ -0,0 +1,316 @@
+"""
+Multi-worker realtime fan-out check, entirely on localhost.
+
+Starts two uvicorn workers against a throwaway SQLite database with
+REALTIME_BACKEND=local, opens a trade socket on worker A and posts a message
+over HTTP to worker B (and the reverse over websockets), then checks that
+each event crosses the worker boundary with one shared per-trade sequence,
+and that a since_seq reconnect replays just the gap. A /ws/user socket is
+also checked to pick up a trade created on the other worker. Last, a user
+suspended through worker B has their socket and event stream on worker A
+closed, and new ones refused. Sockets without a token, as with the old
+`?user_id=` form, are refused too. A read frame listing message ids out of
+order gets a receipt for the newest of them.
+
+Before the workers start, an in-process manager checks that a socket whose
+queue is full is dropped, without deadlocking, when someone else joins its
+trade, and a worker waiting to elect the broker is checked to keep its
+event loop running.
+
+    python check_realtime_fanout.py
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from uuid import uuid4
+
+WORK_DIR = tempfile.mkdtemp(prefix="realtime-check-")
+ENV = {
+    **os.environ,
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORK_DIR, 'check.db')}",
+    "SSL_CA_PATH": "",
+    "REALTIME_BACKEND": "local",
+    "REALTIME_SOCKET_PATH": os.path.join(WORK_DIR, "realtime.sock"),
+}
+os.environ.update(ENV)
+
+import httpx  # noqa: E402
+import websockets  # noqa: E402
+from app.database import Base, engine, SessionLocal  # noqa: E402
+from app import models  # noqa: E402
+from app.security import create_access_token  # noqa: E402
+
+PORTS = (8765, 8766)
+
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        users = []
+        extra_items = []
+        for name in ("alice", "bob"):
+            user = models.User(id=str(uuid4()), name=name, email=f"{name}@example.com", password_hash="", is_verified=True)
+            item = models.Item(id=str(uuid4()), user_id=user.id, title=f"{name}'s item")
+            spare = models.Item(id=str(uuid4()), user_id=user.id, title=f"{name}'s other item")
+            db.add_all([user, item, spare])
+            users.append((user.id, item.id))
+            extra_items.append(spare.id)
+        (alice, alice_item), (bob, bob_item) = users
+        admin = models.User(id=str(uuid4()), name="admin", email="admin@example.com", password_hash="", is_verified=True, role="admin")
+        db.add(admin)
+        trade = models.Trade(
+            id=str(uuid4()),
+            from_user_id=alice,
+            to_user_id=bob,
+            from_item_id=alice_item,
+            to_item_id=bob_item,
+            status="pending",
+        )
+        db.add(trade)
+        db.flush()
+        from app.services.conversation_state import open_conversation
+        open_conversation(db, trade)
+        db.commit()
+        return trade.id, alice, bob, extra_items, admin.id
+    finally:
+        db.close()
+
+
+def start_workers():
+    procs = []
+    for port in PORTS:
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            env=ENV,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ))
+    deadline = time.time() + 20
+    for port in PORTS:
+        while True:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError(f"Worker on port {port} did not start")
+            time.sleep(0.2)
+    return procs
+
+
+async def expect(ws, event_type, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        remaining = deadline - asyncio.get_running_loop().time()
+        payload = json.loads(await asyncio.wait_for(ws.recv(), remaining))
+        if payload.get("type") == event_type:
+            return payload
+
+
+class StalledSocket:
+    """A websocket whose client never reads: the first send blocks forever."""
+
+    def __init__(self):
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await asyncio.Event().wait()
+
+    async def close(self, code=1000, reason=""):
+        self.closed = code
+
+
+async def check_slow_consumer_presence():
+    from app.pubsub import MemoryBackend
+    from app.websocket_manager import TradeConnectionManager, SLOW_CONSUMER_CLOSE_CODE
+
+    manager = TradeConnectionManager(backend=MemoryBackend(), queue_size=2)
+    stalled, joining = StalledSocket(), StalledSocket()
+    await manager.register(stalled, "stalled-user")
+    await manager.subscribe(stalled, "trade:t1")
+    # Its own presence event is stuck in send_text; fill the queue behind it
+    writer = manager._writers[stalled]
+    await asyncio.sleep(0)
+    while writer.depth < 2:
+        await manager.broadcast_message("t1", {"type": "message"})
+    assert stalled.closed is None
+
+    # The joiner's presence event cannot be queued on the stalled socket
+    await manager.register(joining, "joining-user")
+    await asyncio.wait_for(manager.subscribe(joining, "trade:t1"), 2)
+    for _ in range(50):
+        if stalled.closed:
+            break
+        await asyncio.sleep(0.01)
+    assert stalled.closed == SLOW_CONSUMER_CLOSE_CODE, stalled.closed
+    await asyncio.wait_for(manager.unregister(joining), 2)
+    print("✓ A full socket was dropped when another user joined its trade, and the manager stayed usable")
+
+
+async def check_election_does_not_block():
+    import fcntl
+    from app.pubsub import LocalBackend
+
+    path = os.path.join(WORK_DIR, "election.sock")
+    backend = LocalBackend(path)
+    with open(path + ".lock", "w") as lock:
+        # Another worker holds the election lock
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        election = asyncio.create_task(backend._elect_broker())
+        ticks = 0
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert not election.done()
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    await asyncio.wait_for(election, 2)
+    assert backend._broker is not None
+    await backend.close()
+    print(f"✓ A worker waiting for the broker election lock kept its event loop running ({ticks} ticks)")
+
+
+async def run_checks(trade_id, alice, bob, extra_items, admin):
+    a_port, b_port = PORTS
+    alice_token = create_access_token(alice)
+    bob_token = create_access_token(bob)
+
+    async with websockets.connect(f"ws://127.0.0.1:{a_port}/ws/trades/{trade_id}?token={bob_token}") as bob_ws, \
+            websockets.connect(f"ws://127.0.0.1:{b_port}/ws/trades/{trade_id}?token={alice_token}") as alice_ws:
+        await asyncio.sleep(0.3)  # let both workers register their subscriptions
+
+        async with httpx.AsyncClient() as client:
+            res = await client.post(
+                f"http://127.0.0.1:{b_port}/messages/",
+                json={"trade_id": trade_id, "receiver_id": bob, "content": "posted to worker B"},
+                headers={"Authorization": f"Bearer {alice_token}"},
+            )
+            res.raise_for_status()
+        event = await expect(bob_ws, "message")
+        assert event["message"]["content"] == "posted to worker B"
+        first_seq = event["seq"]
+        first_message_id = event["message"]["id"]
+        await expect(alice_ws, "message")  # the sender's own copy
+        print("✓ HTTP message on worker B reached socket on worker A")
+
+        await bob_ws.send(json.dumps({"type": "send", "content": "sent via worker A", "clientId": "c1"}))
+        ack = await expect(bob_ws, "ack")
+        event = await expect(alice_ws, "message")
+        assert event["message"]["id"] == ack["message"]["id"]
+        print("✓ Websocket send on worker A reached socket on worker B")
+        assert event["seq"] == first_seq + 1, (first_seq, event["seq"])
+        print("✓ Events published from both workers share one per-trade sequence")
+
+    async with websockets.connect(f"ws://127.0.0.1:{b_port}/ws/trades/{trade_id}?token={bob_token}&since_seq={first_seq}") as bob_ws, \
+            websockets.connect(f"ws://127.0.0.1:{b_port}/ws/trades/{trade_id}?token={alice_token}") as alice_ws:
+        replay = await expect(bob_ws, "replay")
+        assert [e["seq"] for e in replay["events"]] == [first_seq + 1]
+        print("✓ Reconnect with since_seq replayed only the missed event")
+
+        async with httpx.AsyncClient() as client:
+            res = await client.get(
+                f"http://127.0.0.1:{a_port}/messages/conversations",
+                headers={"Authorization": f"Bearer {bob_token}"},
+            )
+            res.raise_for_status()
+        assert res.json()[0]["online"] is True
+        print("✓ Worker A reports alice online while her socket is on worker B")
+
+        await alice_ws.send(json.dumps({"type": "send", "content": "newer", "clientId": "c2"}))
+        newer_id = (await expect(alice_ws, "ack"))["message"]["id"]
+        await bob_ws.send(json.dumps({"type": "read", "messageIds": ["not-in-this-trade", newer_id, first_message_id]}))
+        receipt = await expect(alice_ws, "read")
+        assert receipt["userId"] == bob and receipt["messageId"] == newer_id, receipt
+        print("✓ A read frame with ids out of order got a receipt for the newest message")
+
+    async with websockets.connect(f"ws://127.0.0.1:{a_port}/ws/user?token={bob_token}") as bob_ws:
+        await asyncio.sleep(0.3)
+        async with httpx.AsyncClient() as client:
+            res = await client.post(
+                f"http://127.0.0.1:{b_port}/trades/",
+                json={"to_user_id": bob, "from_item_id": extra_items[0], "to_item_id": extra_items[1]},
+                headers={"Authorization": f"Bearer {alice_token}"},
+            )
+            res.raise_for_status()
+            new_trade_id = res.json()["id"]
+            event = await expect(bob_ws, "trade")
+            assert event["tradeId"] == new_trade_id and event["action"] == "created"
+
+            res = await client.post(
+                f"http://127.0.0.1:{b_port}/messages/",
+                json={"trade_id": new_trade_id, "receiver_id": bob, "content": "about the new trade"},
+                headers={"Authorization": f"Bearer {alice_token}"},
+            )
+            res.raise_for_status()
+        event = await expect(bob_ws, "message")
+        assert event["message"]["tradeId"] == new_trade_id
+        print("✓ /ws/user socket on worker A joined a trade created on worker B")
+
+    async with websockets.connect(f"ws://127.0.0.1:{a_port}/ws/user?token={bob_token}") as bob_ws, \
+            httpx.AsyncClient(timeout=5) as client, \
+            client.stream("GET", f"http://127.0.0.1:{a_port}/events/stream?token={bob_token}") as stream:
+        assert stream.status_code == 200
+        lines = stream.aiter_lines()
+        await asyncio.sleep(0.3)
+        res = await client.post(
+            f"http://127.0.0.1:{b_port}/admin/users/{bob}/suspend",
+            headers={"Authorization": f"Bearer {create_access_token(admin)}"},
+        )
+        res.raise_for_status()
+        try:
+            await expect(bob_ws, "never")
+        except websockets.ConnectionClosed as e:
+            assert e.rcvd.code == 1008, e.rcvd
+        async def stream_ends():
+            async for _ in lines:
+                pass
+        await asyncio.wait_for(stream_ends(), 5)
+        print("✓ Suspending bob on worker B closed his socket and event stream on worker A")
+
+        # Closed before the handshake completes, which the client sees as a 403
+        try:
+            async with websockets.connect(f"ws://127.0.0.1:{a_port}/ws/user?token={bob_token}"):
+                raise AssertionError("suspended user's socket was accepted")
+        except websockets.InvalidStatus as e:
+            assert e.response.status_code == 403, e.response.status_code
+        res = await client.get(f"http://127.0.0.1:{a_port}/events/stream?token={bob_token}")
+        assert res.status_code == 401, res.status_code
+        print("✓ The suspended user's new socket and event stream were refused")
+
+    try:
+        async with websockets.connect(f"ws://127.0.0.1:{a_port}/ws/trades/{trade_id}?user_id={alice}"):
+            raise AssertionError("a socket without a token was accepted")
+    except websockets.InvalidStatus as e:
+        assert e.response.status_code == 403, e.response.status_code
+    print("✓ A trade socket with ?user_id= and no token was refused")
+
+
+def main():
+    try:
+        asyncio.run(check_slow_consumer_presence())
+        asyncio.run(check_election_does_not_block())
+    except Exception as e:
+        print(f"✗ In-process realtime check failed: {e!r}")
+        sys.exit(1)
+    seeded = seed()
+    procs = start_workers()
+    try:
+        asyncio.run(run_checks(*seeded))
+    except Exception as e:
+        print(f"✗ Realtime fan-out check failed: {e!r}")
+        sys.exit(1)
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
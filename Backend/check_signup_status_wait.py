@@ -0,0 +1,131 @@
+"""
+Signup verification long-poll checks; no server or MySQL needed (uses a
+temporary SQLite database).
+
+Checks that:
+
+- GET /supabase-auth/check-email/{email}/wait answers at once unless the
+  signup is pending, and with "pending" once its timeout passes
+- hundreds of parked requests run no queries while they wait
+- approving the signup (admin approve_user) wakes its waiters with "verified"
+- a verification announced by another worker wakes waiters here too
+- past SIGNUP_STATUS_MAX_WAITERS, requests get the current status without waiting
+
+    python check_signup_status_wait.py
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from uuid import uuid4
+
+WORK_DIR = tempfile.mkdtemp(prefix="signup-wait-check-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORK_DIR, 'check.db')}",
+    "SSL_CA_PATH": "",
+    "METRICS_TOKEN": "check-metrics-token",
+    "PASSWORD_HASH_EXECUTOR": "thread",
+    "LOGIN_RATE_LIMIT_PATH": "",
+    "PENDING_SIGNUP_PURGE_INTERVAL": "0",
+    "SIGNUP_STATUS_MAX_WAITERS": "300",
+})
+
+METRICS_AUTH = {"Authorization": "Bearer check-metrics-token"}
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+WAITERS = 200
+
+
+async def check_wait():
+    from app.main import app
+    from app.database import SessionLocal, engine
+    from app import models
+    from app.pubsub import bus
+    from app.signup_status import signup_waiters, SIGNUPS_CHANNEL
+    from app.tokens import access_token_for
+
+    db = SessionLocal()
+    admin = models.User(id="u-admin", name="admin", email="admin@example.com", password_hash="", role="admin", status="active", token_version=0)
+    db.add(admin)
+    pending_ids = {}
+    for name in ("erin", "frank", "grace"):
+        pending_ids[name] = str(uuid4())
+        db.add(models.PendingSignup(
+            id=pending_ids[name], name=name, email=f"{name}@example.com",
+            password_hash="x", verification_method="admin",
+        ))
+    db.commit()
+    admin_token = access_token_for(admin)
+    db.close()
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(1))
+
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as http:
+        async def wait(email, timeout=10):
+            res = await http.get(f"/supabase-auth/check-email/{email}/wait", params={"timeout": timeout})
+            return res.json()["status"]
+
+        started = time.perf_counter()
+        assert await wait("nobody@example.com") == "not_found"
+        assert await wait("admin@example.com") == "verified"
+        assert await wait("erin@example.com", timeout=0.3) == "pending"
+        assert 0.3 <= time.perf_counter() - started < 2
+        print("✓ Unknown and verified emails answered at once; a pending one after its timeout")
+
+        waiters = [asyncio.create_task(wait("erin@example.com")) for _ in range(WAITERS)]
+        # Each request reads the status once, then parks
+        while len(signup_waiters) < WAITERS or queries:
+            queries.clear()
+            await asyncio.sleep(0.3)
+        await asyncio.sleep(1)
+        assert not queries, f"{len(queries)} queries while {WAITERS} requests waited"
+        print(f"✓ {WAITERS} parked requests ran no queries in a second of waiting")
+
+        started = time.perf_counter()
+        res = await http.post(f"/admin/users/{pending_ids['erin']}/approve", headers={"Authorization": f"Bearer {admin_token}"})
+        assert res.status_code == 200, res.text
+        statuses = await asyncio.gather(*waiters)
+        assert statuses == ["verified"] * WAITERS, set(statuses)
+        print(f"✓ Approving the signup woke all {WAITERS} waiters with verified in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        # As delivered from another worker's announcement
+        waiter = asyncio.create_task(wait("frank@example.com"))
+        while not len(signup_waiters):
+            await asyncio.sleep(0.01)
+        await bus._dispatch(SIGNUPS_CHANNEL, json.dumps({"email": "frank@example.com"}).encode())
+        assert await asyncio.wait_for(waiter, 2) == "verified"
+        print("✓ A verification announced by another worker woke the waiter here")
+
+        waiters = [asyncio.create_task(wait("grace@example.com", timeout=2)) for _ in range(300)]
+        while len(signup_waiters) < 300:
+            await asyncio.sleep(0.01)
+        started = time.perf_counter()
+        assert await wait("grace@example.com") == "pending"
+        assert time.perf_counter() - started < 1, "a request past the cap waited"
+        await asyncio.gather(*waiters)
+        print("✓ Past SIGNUP_STATUS_MAX_WAITERS, requests got the status without waiting")
+
+        metrics = (await http.get("/metrics/", headers=METRICS_AUTH)).text
+        assert f'signup_status_waits_total{{outcome="verified"}} {WAITERS + 1}.0' in metrics
+        assert "signup_status_waiters 0.0" in metrics
+        print("✓ Waits are counted in /metrics")
+    await app.router.shutdown()
+
+
+def main():
+    try:
+        asyncio.run(check_wait())
+    except Exception as e:
+        print(f"✗ Signup status wait check failed: {e!r}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
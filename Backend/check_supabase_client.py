@@ -0,0 +1,379 @@
+"""
+Supabase Auth client checks against a local stub server; no Supabase project
+or network access needed.
+
+Starts a stub of the Supabase Auth (GoTrue) endpoints on localhost, points
+app.supabase_client at it and checks that:
+
+- each call's request and response are translated as expected
+- a wrong password is a SupabaseError and leaves the circuit closed
+- sequential calls reuse one pooled connection
+- a stalled call fails after SUPABASE_TIMEOUT without blocking the event loop
+- repeated failures open the circuit, which then fails fast without a request
+  and closes again after a successful trial call
+- POST /supabase-auth/login goes through the client end to end, learns
+  each account's auth provider on first login, and afterwards sends logins
+  of local (legacy) accounts straight to the local hash with no Supabase call
+- a provider is only recorded as local once Supabase has rejected the
+  credentials, not while Supabase is unavailable
+- POST /supabase-auth/change-password changes a local account's hash
+- the mounted /supabase-auth handlers (signup, confirm, verify-otp, login,
+  me, profile, change-password, user, check-email) run none of their SQL on
+  the event loop thread
+
+    python check_supabase_client.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+PORT = 8771
+WORK_DIR = tempfile.mkdtemp(prefix="supabase-check-")
+ENV = {
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORK_DIR, 'check.db')}",
+    "SSL_CA_PATH": "",
+    "METRICS_TOKEN": "check-metrics-token",
+    "SUPABASE_URL": f"http://127.0.0.1:{PORT}",
+    "SUPABASE_ANON_KEY": "anon-key",
+    "SUPABASE_TIMEOUT": "0.5",
+    "SUPABASE_BREAKER_THRESHOLD": "3",
+    "SUPABASE_BREAKER_COOLDOWN": "1.0",
+    # The login checks sign in repeatedly; keep the login rate limiter out of the way
+    "LOGIN_RATE_LIMIT_PATH": "",
+    "LOGIN_RATE_EMAIL_BURST": "100",
+    "LOGIN_RATE_IP_BURST": "100",
+}
+os.environ.update(ENV)
+
+METRICS_AUTH = {"Authorization": "Bearer check-metrics-token"}
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+USER = {"id": "sb-user-1", "email": "alice@example.com", "email_confirmed_at": "2024-01-01T00:00:00Z"}
+
+
+class Stub:
+    """Supabase Auth stand-in; `mode` switches it between healthy, slow and failing."""
+
+    def __init__(self):
+        self.mode = "ok"
+        # Added to password sign-ins, as a remote round trip would be
+        self.token_delay = 0.0
+        self.requests = []
+        self.client_ports = set()
+
+
+stub = Stub()
+stub_app = FastAPI()
+
+
+@stub_app.middleware("http")
+async def record(request: Request, call_next):
+    stub.requests.append((request.method, request.url.path, dict(request.query_params), request.headers.get("authorization")))
+    stub.client_ports.add(request.client.port)
+    if request.headers.get("apikey") != "anon-key":
+        return JSONResponse({"msg": "missing apikey"}, status_code=401)
+    if stub.mode == "slow":
+        await asyncio.sleep(2)
+    if stub.mode == "fail":
+        return JSONResponse({"msg": "upstream error"}, status_code=503)
+    return await call_next(request)
+
+
+@stub_app.post("/auth/v1/signup")
+async def signup(body: dict):
+    return {**USER, "email": body["email"], "email_confirmed_at": None, "user_metadata": body.get("data")}
+
+
+@stub_app.post("/auth/v1/token")
+async def token(body: dict):
+    await asyncio.sleep(stub.token_delay)
+    if body.get("password") != "right-password":
+        return JSONResponse({"error": "invalid_grant", "error_description": "Invalid login credentials"}, status_code=400)
+    return {"access_token": "user-access-token", "token_type": "bearer", "user": USER}
+
+
+@stub_app.post("/auth/v1/verify")
+async def verify(body: dict):
+    if body.get("token") != "123456":
+        return JSONResponse({"msg": "Token has expired or is invalid"}, status_code=403)
+    return {"access_token": "user-access-token", "user": USER}
+
+
+@stub_app.post("/auth/v1/otp")
+async def otp(body: dict):
+    return {}
+
+
+@stub_app.get("/auth/v1/admin/users/{user_id}")
+async def admin_user(user_id: str):
+    return {**USER, "id": user_id}
+
+
+@stub_app.put("/auth/v1/user")
+async def update_user(request: Request):
+    if request.headers.get("authorization") != "Bearer user-access-token":
+        return JSONResponse({"msg": "invalid JWT"}, status_code=401)
+    return USER
+
+
+@stub_app.post("/auth/v1/recover")
+async def recover(body: dict):
+    return {}
+
+
+def start_stub():
+    server = uvicorn.Server(uvicorn.Config(stub_app, port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Stub server did not start")
+        time.sleep(0.05)
+    return server
+
+
+from app.supabase_client import SupabaseAuthClient, SupabaseError, SupabaseUnavailable  # noqa: E402
+
+
+async def check_calls():
+    client = SupabaseAuthClient(ENV["SUPABASE_URL"], ENV["SUPABASE_ANON_KEY"])
+    try:
+        user = await client.sign_up("bob@example.com", "pw", data={"name": "Bob"}, redirect_to="http://app/cb")
+        assert user.email == "bob@example.com" and user.email_confirmed_at is None, user
+        assert stub.requests[-1][2] == {"redirect_to": "http://app/cb"}, stub.requests[-1]
+
+        session = await client.sign_in_with_password("alice@example.com", "right-password")
+        assert session.access_token == "user-access-token" and session.user.id == USER["id"], session
+        assert stub.requests[-1][2] == {"grant_type": "password"}
+
+        assert (await client.verify_otp("alice@example.com", "123456", "signup")).id == USER["id"]
+        assert (await client.get_user_by_id("abc")).id == "abc"
+        await client.sign_in_with_otp("alice@example.com")
+        await client.reset_password_email("alice@example.com")
+        # Acts as the user whose token is passed, not as the anon key
+        assert (await client.update_user("user-access-token", {"password": "new"})).id == USER["id"]
+        assert stub.requests[-1][3] == "Bearer user-access-token"
+        print("✓ Calls translate to the Supabase Auth REST API and back")
+
+        try:
+            await client.sign_in_with_password("alice@example.com", "wrong")
+            raise AssertionError("wrong password accepted")
+        except SupabaseUnavailable:
+            raise AssertionError("wrong password counted as an outage")
+        except SupabaseError as e:
+            assert e.status_code == 400 and "Invalid login credentials" in str(e), e
+        assert client.breaker.failures == 0 and client.breaker.opened_at is None
+        print("✓ Wrong password raises SupabaseError and leaves the circuit closed")
+
+        stub.client_ports.clear()
+        for _ in range(10):
+            await client.sign_in_with_otp("alice@example.com")
+        assert len(stub.client_ports) == 1, f"{len(stub.client_ports)} connections for 10 calls"
+        print("✓ 10 sequential calls reused one pooled connection")
+    finally:
+        await client.close()
+
+
+async def check_timeout_and_breaker():
+    client = SupabaseAuthClient(ENV["SUPABASE_URL"], ENV["SUPABASE_ANON_KEY"])
+    try:
+        stub.mode = "slow"
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        started = time.monotonic()
+        try:
+            await client.sign_in_with_otp("alice@example.com")
+            raise AssertionError("stalled call did not time out")
+        except SupabaseUnavailable:
+            elapsed = time.monotonic() - started
+        ticking.cancel()
+        assert elapsed < 1.0, f"timed out after {elapsed:.2f}s"
+        assert ticks > 20, f"event loop ticked only {ticks} times during the call"
+        print(f"✓ Stalled call timed out after {elapsed:.2f}s; event loop ticked {ticks} times meanwhile")
+
+        stub.mode = "fail"
+        for _ in range(2):
+            try:
+                await client.sign_in_with_otp("alice@example.com")
+            except SupabaseUnavailable:
+                pass
+        assert client.breaker.opened_at is not None, "circuit still closed after threshold failures"
+        sent = len(stub.requests)
+        started = time.monotonic()
+        try:
+            await client.sign_in_with_otp("alice@example.com")
+            raise AssertionError("call went through an open circuit")
+        except SupabaseUnavailable as e:
+            assert "circuit open" in str(e)
+        assert len(stub.requests) == sent, "open circuit still sent a request"
+        print(f"✓ Circuit opened after 3 failures and failed fast in {(time.monotonic() - started) * 1000:.1f} ms")
+
+        stub.mode = "ok"
+        await asyncio.sleep(1.1)
+        await client.sign_in_with_otp("alice@example.com")
+        assert client.breaker.opened_at is None
+        await client.sign_in_with_otp("alice@example.com")
+        print("✓ Trial call after the cooldown closed the circuit")
+    finally:
+        stub.mode = "ok"
+        await client.close()
+
+
+async def check_login_endpoint():
+    from app.main import app
+    from app.database import SessionLocal
+    from app import models
+    from app.security import hash_password
+
+    db = SessionLocal()
+    db.add(models.User(id="u-alice", name="alice", email="alice@example.com", password_hash="", is_verified=True, supabase_user_id=USER["id"]))
+    db.add(models.User(id="u-carol", name="carol", email="carol@example.com", password_hash=hash_password("carol-password"), is_verified=True))
+    db.add(models.User(id="u-dave", name="dave", email="dave@example.com", password_hash=hash_password("dave-password"), is_verified=True))
+    db.commit()
+    db.close()
+
+    def provider(user_id):
+        db = SessionLocal()
+        try:
+            return db.query(models.User.auth_provider).filter(models.User.id == user_id).scalar()
+        finally:
+            db.close()
+
+    def token_requests():
+        return sum(1 for _, path, _, _ in stub.requests if path == "/auth/v1/token")
+
+    async def login(http, email, password):
+        started = time.perf_counter()
+        res = await http.post("/supabase-auth/login", json={"email": email, "password": password})
+        return res, time.perf_counter() - started
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        res, _ = await login(http, "alice@example.com", "right-password")
+        assert res.status_code == 200 and res.json()["user"]["id"] == "u-alice", res.text
+        assert provider("u-alice") == "supabase", provider("u-alice")
+        res, _ = await login(http, "alice@example.com", "wrong")
+        assert res.status_code == 401, res.text
+        metrics = (await http.get("/metrics/", headers=METRICS_AUTH)).text
+        assert 'supabase_requests_total{operation="sign_in_with_password",outcome="ok"}' in metrics
+        print("✓ POST /supabase-auth/login signs in through the async client and records provider 'supabase'")
+
+        stub.token_delay = 0.3
+        try:
+            res, first = await login(http, "carol@example.com", "carol-password")
+            assert res.status_code == 200, res.text
+            assert provider("u-carol") == "local", provider("u-carol")
+            sent = token_requests()
+            timings = []
+            for _ in range(5):
+                res, elapsed = await login(http, "carol@example.com", "carol-password")
+                assert res.status_code == 200, res.text
+                timings.append(elapsed)
+            res, _ = await login(http, "carol@example.com", "wrong")
+            assert res.status_code == 401, res.text
+            assert token_requests() == sent, "local account login still called Supabase"
+        finally:
+            stub.token_delay = 0.0
+        p50 = sorted(timings)[len(timings) // 2]
+        print(f"✓ Local account learned on first login ({first * 1000:.0f} ms with a 300 ms Supabase round trip);"
+              f" later logins skip Supabase, p50 {p50 * 1000:.0f} ms")
+
+        stub.mode = "fail"
+        try:
+            res, _ = await login(http, "dave@example.com", "dave-password")
+            assert res.status_code == 200, res.text
+            assert provider("u-dave") is None, provider("u-dave")
+            res, _ = await login(http, "dave@example.com", "wrong")
+            assert res.status_code == 503, res.text
+        finally:
+            stub.mode = "ok"
+        res, _ = await login(http, "dave@example.com", "dave-password")
+        assert res.status_code == 200 and provider("u-dave") == "local", (res.text, provider("u-dave"))
+        print("✓ With Supabase unavailable a local match signs in, but the provider is only recorded once Supabase rejects")
+
+        res, _ = await login(http, "carol@example.com", "carol-password")
+        headers = {"Authorization": f"Bearer {res.json()['token']}"}
+        sent = len(stub.requests)
+        res = await http.post("/supabase-auth/change-password", headers=headers,
+                              json={"old_password": "carol-password", "new_password": "carol-new-password"})
+        assert res.status_code == 200, res.text
+        assert len(stub.requests) == sent, "local password change called Supabase"
+        assert (await login(http, "carol@example.com", "carol-new-password"))[0].status_code == 200
+        assert (await login(http, "carol@example.com", "carol-password"))[0].status_code == 401
+        print("✓ Changing a local account's password replaces its hash; the old password stops working")
+
+
+async def check_queries_off_loop():
+    from sqlalchemy import event
+    from app.main import app
+    from app.database import engine
+
+    loop_thread = threading.get_ident()
+    on_loop = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == loop_thread:
+            on_loop.append(statement[:60])
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            async def call(method, path, expected=200, **kwargs):
+                res = await http.request(method, f"/supabase-auth{path}", **kwargs)
+                assert res.status_code == expected, (path, res.status_code, res.text)
+                return res.json()
+
+            for email in ("erin@example.com", "frank@example.com"):
+                await call("POST", "/signup", json={"email": email, "password": "right-password", "name": "E"})
+            await call("POST", "/confirm", json={"email": "erin@example.com"})
+            await call("POST", "/signup", 400, json={"email": "erin@example.com", "password": "right-password", "name": "E"})
+            await call("POST", "/verify-otp", json={"email": "frank@example.com", "otp": "123456"})
+            body = await call("POST", "/login", json={"email": "erin@example.com", "password": "right-password"})
+            headers = {"Authorization": f"Bearer {body['token']}"}
+            await call("GET", "/me", headers=headers)
+            await call("PUT", "/profile", headers=headers, json={"name": "Erin", "location": "Cebu"})
+            await call("GET", f"/user/{body['user']['id']}")
+            await call("POST", "/change-password", headers=headers,
+                       json={"old_password": "right-password", "new_password": "new-password"})
+            await call("GET", "/check-email/erin@example.com")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert not on_loop, f"{len(on_loop)} statements ran on the event loop thread: {on_loop[:3]}"
+    print("✓ Mounted /supabase-auth handlers ran all their SQL in the threadpool, none on the event loop")
+
+
+async def run_checks():
+    await check_calls()
+    await check_timeout_and_breaker()
+    await check_login_endpoint()
+    await check_queries_off_loop()
+
+
+def main():
+    server = start_stub()
+    try:
+        asyncio.run(run_checks())
+    except Exception as e:
+        print(f"✗ Supabase client check failed: {e!r}")
+        sys.exit(1)
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Websocket DB pool usage check, entirely on localhost.
+
+Starts one uvicorn worker against a throwaway SQLite database, opens trade
+and user sockets in growing batches, and after each batch reads the
+`db_pool_checked_out` gauge from /metrics. Open sockets must not hold pooled
+connections, so the gauge should stay flat however many sockets are open.
+
+    python check_ws_pool_usage.py [max_sockets]
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from uuid import uuid4
+
+WORK_DIR = tempfile.mkdtemp(prefix="ws-pool-check-")
+ENV = {
+    **os.environ,
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORK_DIR, 'check.db')}",
+    "SSL_CA_PATH": "",
+    "METRICS_TOKEN": "check-metrics-token",
+    "REALTIME_BACKEND": "memory",
+    # Two users hold every socket here
+    "WS_MAX_CONNECTIONS_PER_USER": "1000",
+}
+os.environ.update(ENV)
+
+METRICS_AUTH = {"Authorization": "Bearer check-metrics-token"}
+
+import httpx  # noqa: E402
+import websockets  # noqa: E402
+from app.database import Base, engine, SessionLocal  # noqa: E402
+from app import models  # noqa: E402
+from app.security import create_access_token  # noqa: E402
+
+PORT = 8767
+TRADES = 20
+# Default SQLAlchemy QueuePool: 5 connections + 10 overflow
+POOL_LIMIT = 15
+
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        users = []
+        for name in ("alice", "bob"):
+            user = models.User(id=str(uuid4()), name=name, email=f"{name}@example.com", password_hash="", is_verified=True)
+            db.add(user)
+            users.append(user.id)
+        alice, bob = users
+        trade_ids = []
+        for n in range(TRADES):
+            from_item = models.Item(id=str(uuid4()), user_id=alice, title=f"alice's item {n}")
+            to_item = models.Item(id=str(uuid4()), user_id=bob, title=f"bob's item {n}")
+            trade = models.Trade(
+                id=str(uuid4()),
+                from_user_id=alice,
+                to_user_id=bob,
+                from_item_id=from_item.id,
+                to_item_id=to_item.id,
+                status="pending",
+            )
+            db.add_all([from_item, to_item, trade])
+            trade_ids.append(trade.id)
+        db.commit()
+        return trade_ids, alice, bob
+    finally:
+        db.close()
+
+
+def start_worker():
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning"],
+        env=ENV,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    deadline = time.time() + 20
+    while True:
+        try:
+            if httpx.get(f"http://127.0.0.1:{PORT}/health").status_code == 200:
+                return proc
+        except httpx.TransportError:
+            pass
+        if time.time() > deadline:
+            proc.terminate()
+            raise RuntimeError("Worker did not start")
+        time.sleep(0.2)
+
+
+async def pool_checked_out(client: httpx.AsyncClient) -> float:
+    res = await client.get(f"http://127.0.0.1:{PORT}/metrics/", headers=METRICS_AUTH)
+    for line in res.text.splitlines():
+        if line.startswith("db_pool_checked_out "):
+            return float(line.split()[1])
+    raise RuntimeError("db_pool_checked_out not exported")
+
+
+async def run_check(trade_ids, alice, bob, max_sockets):
+    tokens = (create_access_token(alice), create_access_token(bob))
+    sockets = []
+    readings = []
+    stages = [s for s in (0, 10, 25, 50, 100, 200, 400) if s <= max_sockets]
+    try:
+        async with httpx.AsyncClient() as client:
+            for target in stages:
+                while len(sockets) < target:
+                    n = len(sockets)
+                    token = tokens[n % 2]
+                    if n % 5 == 4:
+                        url = f"ws://127.0.0.1:{PORT}/ws/user?token={token}"
+                    else:
+                        url = f"ws://127.0.0.1:{PORT}/ws/trades/{trade_ids[n % len(trade_ids)]}?token={token}"
+                    sockets.append(await asyncio.wait_for(websockets.connect(url), 10))
+                await asyncio.sleep(0.2)
+                checked_out = await pool_checked_out(client)
+                readings.append((target, checked_out))
+                print(f"  {target:4d} sockets open -> {checked_out:.0f} pooled connections checked out")
+    finally:
+        for ws in sockets:
+            await ws.close()
+
+    baseline = readings[0][1]
+    peak = max(checked_out for _, checked_out in readings)
+    assert peak <= baseline, f"pool usage grew from {baseline:.0f} to {peak:.0f} with open sockets"
+    print(f"✓ Pool usage stayed at {baseline:.0f} with up to {stages[-1]} open sockets (pool limit {POOL_LIMIT})")
+
+
+def main():
+    max_sockets = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    trade_ids, alice, bob = seed()
+    proc = start_worker()
+    try:
+        asyncio.run(run_check(trade_ids, alice, bob, max_sockets))
+    except Exception as e:
+        print(f"✗ Websocket pool usage check failed: {e!r}")
+        sys.exit(1)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Websocket load test against a local SQLite-backed worker; no external
+services needed.
+
+Starts one uvicorn worker, seeds trades between pairs of users, opens
+--clients asyncio websocket clients spread across the trades on
+/ws/trades/{trade_id}, then drives POST /messages/ at --rate messages per
+second for --duration seconds. Reports:
+
+- end-to-end delivery latency (POST sent -> event received) percentiles
+- dropped deliveries (expected socket deliveries that never arrived)
+- server memory per open connection (RSS delta / clients)
+- DB pool utilization (db_pool_checked_out gauge, sampled during the run)
+
+    python loadtest_websockets.py --clients 2000 --trades 200 --rate 50 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from uuid import uuid4
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000, help="websocket clients to open")
+    parser.add_argument("--trades", type=int, default=100, help="trades the clients are spread over")
+    parser.add_argument("--rate", type=float, default=20.0, help="POST /messages/ per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to send messages for")
+    parser.add_argument("--drain", type=float, default=5.0, help="seconds to wait for deliveries after sending stops")
+    parser.add_argument("--port", type=int, default=8770)
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="websocket handshakes in flight")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+WORK_DIR = tempfile.mkdtemp(prefix="ws-loadtest-")
+ENV = {
+    **os.environ,
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORK_DIR, 'loadtest.db')}",
+    "SSL_CA_PATH": "",
+    "REALTIME_BACKEND": "memory",
+    "WS_MAX_CONNECTIONS": str(ARGS.clients + 100),
+    "WS_MAX_CONNECTIONS_PER_USER": str(ARGS.clients),
+}
+os.environ.update(ENV)
+
+import httpx  # noqa: E402
+import psutil  # noqa: E402
+import websockets  # noqa: E402
+from app.database import Base, engine, SessionLocal  # noqa: E402
+from app import models  # noqa: E402
+from app.security import create_access_token  # noqa: E402
+from app.services.conversation_state import open_conversation  # noqa: E402
+
+BASE_URL = f"http://127.0.0.1:{ARGS.port}"
+WS_URL = f"ws://127.0.0.1:{ARGS.port}"
+
+
+def raise_fd_limit():
+    # Every client socket is a file descriptor here and in the worker
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, ARGS.clients * 2 + 1024))
+    if wanted > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+    if wanted < ARGS.clients + 256:
+        print(f"Warning: file descriptor limit {wanted} is low for {ARGS.clients} clients")
+
+
+def seed():
+    """Trades [(trade_id, from_user, to_user)] between fresh user pairs."""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        trades = []
+        for n in range(ARGS.trades):
+            users = [
+                models.User(id=str(uuid4()), name=f"user{n}{side}", email=f"user{n}{side}@example.com", password_hash="", is_verified=True)
+                for side in ("a", "b")
+            ]
+            items = [models.Item(id=str(uuid4()), user_id=u.id, title=f"{u.name}'s item") for u in users]
+            trade = models.Trade(
+                id=str(uuid4()),
+                from_user_id=users[0].id,
+                to_user_id=users[1].id,
+                from_item_id=items[0].id,
+                to_item_id=items[1].id,
+                status="active",
+            )
+            db.add_all(users + items + [trade])
+            db.flush()
+            open_conversation(db, trade)
+            trades.append((trade.id, users[0].id, users[1].id))
+        db.commit()
+        return trades
+    finally:
+        db.close()
+
+
+def start_worker():
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(ARGS.port), "--log-level", "warning"],
+        env=ENV,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    deadline = time.time() + 20
+    while True:
+        try:
+            if httpx.get(f"{BASE_URL}/health").status_code == 200:
+                return proc
+        except httpx.TransportError:
+            pass
+        if time.time() > deadline:
+            proc.terminate()
+            raise RuntimeError("Worker did not start")
+        time.sleep(0.2)
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.received = defaultdict(int)   # message marker -> deliveries
+        self.expected = {}                 # message marker -> sockets on its trade
+        self.closed_early = 0
+        self.pool_samples = []
+
+
+async def client(url, stats, ready):
+    try:
+        async with websockets.connect(url, max_queue=None, open_timeout=30) as ws:
+            ready.set_result(True)
+            async for raw in ws:
+                event = json.loads(raw)
+                if event.get("type") == "ping":
+                    await ws.send('{"type":"pong"}')
+                elif event.get("type") == "message":
+                    parts = event["message"]["content"].split()
+                    if len(parts) == 3 and parts[0] == "lt":
+                        stats.latencies.append(time.monotonic() - float(parts[2]))
+                        stats.received[parts[1]] += 1
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        if not ready.done():
+            ready.set_exception(e)
+        else:
+            stats.closed_early += 1
+
+
+async def sample_pool(http, stats, stop):
+    while not stop.is_set():
+        res = await http.get(f"{BASE_URL}/metrics/")
+        for line in res.text.splitlines():
+            if line.startswith("db_pool_checked_out "):
+                stats.pool_samples.append(float(line.split()[1]))
+        await asyncio.sleep(0.25)
+
+
+async def run(trades, worker):
+    stats = Stats()
+    process = psutil.Process(worker.pid)
+    sockets_per_trade = defaultdict(int)
+    tasks = []
+    tokens = {}
+
+    rss_before = process.memory_info().rss
+    semaphore = asyncio.Semaphore(ARGS.connect_concurrency)
+    started = time.monotonic()
+
+    async def open_client(n):
+        trade_id, from_user, to_user = trades[n % len(trades)]
+        user = from_user if (n // len(trades)) % 2 == 0 else to_user
+        token = tokens.setdefault(user, create_access_token(user))
+        ready = asyncio.get_running_loop().create_future()
+        async with semaphore:
+            tasks.append(asyncio.create_task(client(f"{WS_URL}/ws/trades/{trade_id}?token={token}", stats, ready)))
+            await ready
+        sockets_per_trade[trade_id] += 1
+
+    results = await asyncio.gather(*(open_client(n) for n in range(ARGS.clients)), return_exceptions=True)
+    failed = [r for r in results if isinstance(r, Exception)]
+    opened = ARGS.clients - len(failed)
+    connect_seconds = time.monotonic() - started
+    await asyncio.sleep(1.0)
+    rss_after = process.memory_info().rss
+    print(f"Opened {opened}/{ARGS.clients} sockets in {connect_seconds:.1f}s"
+          + (f" ({len(failed)} failed, first: {failed[0]!r})" if failed else ""))
+
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=50)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+        sampler = asyncio.create_task(sample_pool(http, stats, stop))
+        post_errors = 0
+        post_latencies = []
+
+        async def post(n):
+            nonlocal post_errors
+            trade_id, from_user, to_user = trades[n % len(trades)]
+            marker = f"m{n}"
+            stats.expected[marker] = sockets_per_trade[trade_id]
+            t0 = time.monotonic()
+            try:
+                res = await http.post(
+                    f"{BASE_URL}/messages/",
+                    json={"trade_id": trade_id, "receiver_id": to_user, "content": f"lt {marker} {t0}"},
+                    headers={"Authorization": f"Bearer {tokens.setdefault(from_user, create_access_token(from_user))}"},
+                )
+                res.raise_for_status()
+                post_latencies.append(time.monotonic() - t0)
+            except Exception:
+                post_errors += 1
+                stats.expected.pop(marker, None)
+
+        posts = []
+        total = int(ARGS.rate * ARGS.duration)
+        send_started = time.monotonic()
+        for n in range(total):
+            # Open-loop pacing: fire on schedule regardless of response times
+            delay = send_started + n / ARGS.rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            posts.append(asyncio.create_task(post(n)))
+        await asyncio.gather(*posts)
+        await asyncio.sleep(ARGS.drain)
+        stop.set()
+        await sampler
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    expected = sum(stats.expected.values())
+    delivered = sum(min(stats.received[m], n) for m, n in stats.expected.items())
+    report(stats, opened, rss_before, rss_after, expected, delivered, post_errors, post_latencies, total)
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def report(stats, opened, rss_before, rss_after, expected, delivered, post_errors, post_latencies, total):
+    ms = lambda seconds: seconds * 1000  # noqa: E731
+    print()
+    print(f"Messages posted:        {total - post_errors}/{total} ({post_errors} failed)")
+    print(f"POST latency ms:        p50 {ms(percentile(post_latencies, 50)):.1f}  p99 {ms(percentile(post_latencies, 99)):.1f}")
+    print(f"Deliveries:             {delivered}/{expected} ({expected - delivered} dropped)")
+    print(f"Delivery latency ms:    p50 {ms(percentile(stats.latencies, 50)):.1f}  p90 {ms(percentile(stats.latencies, 90)):.1f}"
+          f"  p99 {ms(percentile(stats.latencies, 99)):.1f}  max {ms(max(stats.latencies, default=float('nan'))):.1f}")
+    if stats.latencies:
+        print(f"                        mean {ms(statistics.mean(stats.latencies)):.1f}")
+    print(f"Sockets closed early:   {stats.closed_early}")
+    if opened:
+        print(f"Server RSS:             {rss_before / 2**20:.1f} MiB -> {rss_after / 2**20:.1f} MiB"
+              f" ({(rss_after - rss_before) / opened / 1024:.1f} KiB per connection)")
+    if stats.pool_samples:
+        print(f"DB pool checked out:    mean {statistics.mean(stats.pool_samples):.2f}  max {max(stats.pool_samples):.0f}"
+              f"  (pool 5 + 10 overflow)")
+
+
+def main():
+    raise_fd_limit()
+    trades = seed()
+    worker = start_worker()
+    try:
+        asyncio.run(run(trades, worker))
+    finally:
+        worker.terminate()
+        worker.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+-- Migration: Add the denormalized conversation_state inbox table and backfill
+-- it for existing trades. python rebuild_conversation_state.py recomputes the
+-- same rows if they ever drift.
+
+CREATE TABLE IF NOT EXISTS conversation_state (
+	trade_id CHAR(36) NOT NULL,
+	user_id CHAR(36) NOT NULL,
+	other_user_id CHAR(36) NOT NULL,
+	last_message_id CHAR(36) NULL,
+	last_message_at DATETIME NULL,
+	last_message_preview VARCHAR(255) NULL,
+	unread_count INT NOT NULL DEFAULT 0,
+	updated_at DATETIME NOT NULL,
+	PRIMARY KEY (trade_id, user_id),
+	INDEX idx_conversation_state_user_updated (user_id, updated_at),
+	CONSTRAINT fk_conversation_state_trade FOREIGN KEY (trade_id) REFERENCES trades(id) ON DELETE CASCADE,
+	CONSTRAINT fk_conversation_state_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+	CONSTRAINT fk_conversation_state_other_user FOREIGN KEY (other_user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- One row per participant of every existing trade, summarizing its messages
+INSERT IGNORE INTO conversation_state
+	(trade_id, user_id, other_user_id, last_message_id, last_message_at, last_message_preview, unread_count, updated_at)
+SELECT
+	p.trade_id,
+	p.user_id,
+	p.other_user_id,
+	lm.id,
+	lm.created_at,
+	LEFT(lm.content, 255),
+	(SELECT COUNT(*) FROM messages m WHERE m.trade_id = p.trade_id AND m.receiver_id = p.user_id AND m.is_read = FALSE),
+	GREATEST(COALESCE(t.updated_at, t.created_at, NOW()), COALESCE(lm.created_at, t.updated_at, t.created_at, NOW()))
+FROM (
+	SELECT id AS trade_id, from_user_id AS user_id, to_user_id AS other_user_id FROM trades
+	UNION
+	SELECT id, to_user_id, from_user_id FROM trades
+) p
+JOIN trades t ON t.id = p.trade_id
+LEFT JOIN (
+	SELECT id, trade_id, content, created_at,
+		ROW_NUMBER() OVER (PARTITION BY trade_id ORDER BY created_at DESC, id DESC) AS rn
+	FROM messages
+) lm ON lm.trade_id = p.trade_id AND lm.rn = 1;
@@ -0,0 +1,8 @@
+-- Migration: Add composite indexes used by GET /messages/conversations
+-- Run this once on existing databases (new installs get them from schema.sql)
+
+-- Latest message per trade (ROW_NUMBER() over trade_id ordered by created_at)
+CREATE INDEX idx_messages_trade_created ON messages(trade_id, created_at);
+
+-- Grouped unread counts for the current user
+CREATE INDEX idx_messages_receiver_unread ON messages(receiver_id, is_read, trade_id);
@@ -0,0 +1,11 @@
+-- Migration: Purge expired pending signups
+-- The purge job (app/services/pending_signups.py) deletes email signups
+-- past expires_at, oldest first along this index. Rows saved without an
+-- expiry get the 24 hours signups have now, so they are purged too; signups
+-- waiting for admin approval are never purged.
+
+UPDATE pending_signups
+SET expires_at = DATE_ADD(COALESCE(created_at, NOW()), INTERVAL 24 HOUR)
+WHERE expires_at IS NULL AND (verification_method IS NULL OR verification_method <> 'admin');
+
+CREATE INDEX idx_pending_signups_expires_at ON pending_signups (expires_at);
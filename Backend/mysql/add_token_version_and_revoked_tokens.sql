@@ -0,0 +1,15 @@
+-- Migration: Short-lived access tokens with a refresh flow
+-- users.token_version is embedded in every token; bumping it (password
+-- change or reset) makes the user's older tokens unusable.
+-- revoked_tokens holds refresh tokens already used or logged out, until they
+-- would have expired anyway.
+
+ALTER TABLE users ADD COLUMN token_version INT NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+	jti CHAR(36) PRIMARY KEY,
+	user_id CHAR(36) NOT NULL,
+	expires_at DATETIME NOT NULL,
+	revoked_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+	INDEX idx_revoked_tokens_expires_at (expires_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,11 @@
+-- Migration: Record which verifier owns each user's password
+-- 'local' (users.password_hash) or 'supabase' (Supabase Auth); NULL until the
+-- first successful login tells /supabase-auth/login which one to use.
+
+ALTER TABLE users ADD COLUMN auth_provider VARCHAR(20) NULL;
+
+-- Backfill the unambiguous cases; the rest are learned on login
+UPDATE users SET auth_provider = 'supabase'
+WHERE auth_provider IS NULL AND supabase_user_id IS NOT NULL AND (password_hash = '' OR password_hash = 'SUPABASE_AUTH');
+UPDATE users SET auth_provider = 'local'
+WHERE auth_provider IS NULL AND supabase_user_id IS NULL AND (password_hash LIKE '$argon2%' OR password_hash LIKE '$2%');
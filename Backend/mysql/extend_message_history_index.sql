@@ -0,0 +1,6 @@
+-- Migration: Extend the per-trade message index with id for cursor pagination
+-- GET /messages/ pages history on (created_at, id); including id lets every
+-- page be served as a range scan of this index.
+
+DROP INDEX idx_messages_trade_created ON messages;
+CREATE INDEX idx_messages_trade_created ON messages(trade_id, created_at, id);
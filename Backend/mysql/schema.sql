@@ -18,7 +18,18 @@ CREATE TABLE IF NOT EXISTS users (
 	remember_token VARCHAR(255) NULL,
 	email_verification_token VARCHAR(255) NULL,
 	password_reset_token VARCHAR(255) NULL,
-	password_reset_expires DATETIME NULL
+	password_reset_expires DATETIME NULL,
+	auth_provider VARCHAR(20) NULL,
+	token_version INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Refresh tokens that may no longer be used (rotated or logged out)
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+	jti CHAR(36) PRIMARY KEY,
+	user_id CHAR(36) NOT NULL,
+	expires_at DATETIME NOT NULL,
+	revoked_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+	INDEX idx_revoked_tokens_expires_at (expires_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Sessions
@@ -92,6 +103,22 @@ CREATE TABLE IF NOT EXISTS messages (
 	CONSTRAINT fk_messages_receiver FOREIGN KEY (receiver_id) REFERENCES users(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Conversation inbox rows (one per trade participant, maintained on message writes)
+CREATE TABLE IF NOT EXISTS conversation_state (
+	trade_id CHAR(36) NOT NULL,
+	user_id CHAR(36) NOT NULL,
+	other_user_id CHAR(36) NOT NULL,
+	last_message_id CHAR(36) NULL,
+	last_message_at DATETIME NULL,
+	last_message_preview VARCHAR(255) NULL,
+	unread_count INT NOT NULL DEFAULT 0,
+	updated_at DATETIME NOT NULL,
+	PRIMARY KEY (trade_id, user_id),
+	CONSTRAINT fk_conversation_state_trade FOREIGN KEY (trade_id) REFERENCES trades(id) ON DELETE CASCADE,
+	CONSTRAINT fk_conversation_state_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+	CONSTRAINT fk_conversation_state_other_user FOREIGN KEY (other_user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Ratings
 CREATE TABLE IF NOT EXISTS user_ratings (
 	id CHAR(36) PRIMARY KEY,
@@ -121,6 +148,9 @@ CREATE INDEX idx_trades_status ON trades(status);
 CREATE INDEX idx_messages_trade_id ON messages(trade_id);
 CREATE INDEX idx_messages_sender ON messages(sender_id);
 CREATE INDEX idx_messages_receiver ON messages(receiver_id);
+CREATE INDEX idx_messages_trade_created ON messages(trade_id, created_at, id);
+CREATE INDEX idx_messages_receiver_unread ON messages(receiver_id, is_read, trade_id);
+CREATE INDEX idx_conversation_state_user_updated ON conversation_state(user_id, updated_at);
 CREATE INDEX idx_ratings_to_user ON user_ratings(to_user_id);
 
 
@@ -0,0 +1,28 @@
+"""
+Recompute the conversation_state inbox table from messages.
+
+The migration backfills the table; run this any time the denormalized rows are
+suspected to have drifted:
+
+    python rebuild_conversation_state.py [batch_size]
+"""
+import sys
+from app.database import SessionLocal
+from app.services.conversation_state import rebuild_conversation_state
+
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    db = SessionLocal()
+    try:
+        processed = rebuild_conversation_state(db, batch_size=batch_size)
+        print(f"✓ Rebuilt conversation_state for {processed} trades")
+    except Exception as e:
+        db.rollback()
+        print(f"Error: {e}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,13 @@
+import { authService } from '../services/authService';
+
 // Use environment variable in production, fallback to localhost for development
 export const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:9000';
 
-/**
- * Check if token is a UUID (offline mode) or JWT (backend mode)
- */
-function isUuidToken(token: string): boolean {
-	// UUID format: xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx
-	const uuidRegex = /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/i;
-	return uuidRegex.test(token);
-}
-
+// authService.authorizedFetch adds the access token (JWTs only, not offline-mode UUIDs)
 function getAuthHeaders(): Record<string, string> {
-	const token = localStorage.getItem('bayanihan_token');
-	const headers: Record<string, string> = {
+	return {
 		'Content-Type': 'application/json'
 	};
-	
-	// Only include Authorization header for JWT tokens (not UUID tokens from offline mode)
-	if (token && !isUuidToken(token)) {
-		headers['Authorization'] = `Bearer ${token}`;
-	}
-	
-	return headers;
 }
 
 async function handleResponse<T>(res: Response): Promise<T> {
@@ -44,6 +30,7 @@ async function handleResponse<T>(res: Response): Promise<T> {
 		
 		// Log specific error types for debugging
 		if (res.status === 401) {
+			// Already retried once after refreshing the session
 			console.error('Authentication failed - token may be invalid or expired');
 		} else if (res.status === 400) {
 			console.error('Bad request - check request parameters:', errorMessage);
@@ -59,7 +46,8 @@ async function fetchWithTimeout(url: string, options: RequestInit = {}, timeout
 	const timeoutId = setTimeout(() => controller.abort(), timeout);
 	
 	try {
-		const response = await fetch(url, {
+		// Refreshes the session and retries once on a 401
+		const response = await authService.authorizedFetch(url, {
 			...options,
 			signal: controller.signal
 		});
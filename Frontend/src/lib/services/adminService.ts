@@ -1,17 +1,17 @@
 import { API_BASE_URL } from '../config/api';
 import { authStore } from '../stores/authStore';
+import { authService } from './authService';
 
 class AdminService {
+    // authService.authorizedFetch adds the access token
     private getHeaders() {
-        const token = localStorage.getItem('bayanihan_token');
         return {
-            'Content-Type': 'application/json',
-            'Authorization': `Bearer ${token}`
+            'Content-Type': 'application/json'
         };
     }
 
     async getStats() {
-        const response = await fetch(`${API_BASE_URL}/admin/stats`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/stats`, {
             headers: this.getHeaders()
         });
         if (!response.ok) throw new Error('Failed to fetch stats');
@@ -19,7 +19,7 @@ class AdminService {
     }
 
     async getUsers(skip = 0, limit = 20) {
-        const response = await fetch(`${API_BASE_URL}/admin/users?skip=${skip}&limit=${limit}`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/users?skip=${skip}&limit=${limit}`, {
             headers: this.getHeaders()
         });
         if (!response.ok) throw new Error('Failed to fetch users');
@@ -27,7 +27,7 @@ class AdminService {
     }
 
     async deleteUser(userId: string) {
-        const response = await fetch(`${API_BASE_URL}/admin/users/${userId}`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/users/${userId}`, {
             method: 'DELETE',
             headers: this.getHeaders()
         });
@@ -36,7 +36,7 @@ class AdminService {
     }
 
     async verifyUser(userId: string) {
-        const response = await fetch(`${API_BASE_URL}/admin/users/${userId}/verify`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/users/${userId}/verify`, {
             method: 'PUT',
             headers: this.getHeaders()
         });
@@ -45,7 +45,7 @@ class AdminService {
     }
 
     async updateUserRole(userId: string, role: string) {
-        const response = await fetch(`${API_BASE_URL}/admin/users/${userId}/role`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/users/${userId}/role`, {
             method: 'PUT',
             headers: this.getHeaders(),
             body: JSON.stringify({ role })
@@ -55,7 +55,7 @@ class AdminService {
     }
 
     async createUser(userData: any) {
-        const response = await fetch(`${API_BASE_URL}/admin/users`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/users`, {
             method: 'POST',
             headers: this.getHeaders(),
             body: JSON.stringify(userData)
@@ -68,7 +68,7 @@ class AdminService {
     }
 
     async resetUserPassword(userId: string, password: string) {
-        const response = await fetch(`${API_BASE_URL}/admin/users/${userId}/password`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/users/${userId}/password`, {
             method: 'PUT',
             headers: this.getHeaders(),
             body: JSON.stringify({ password })
@@ -78,7 +78,7 @@ class AdminService {
     }
 
     async getSupportRequests() {
-        const response = await fetch(`${API_BASE_URL}/admin/requests`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/requests`, {
             headers: this.getHeaders()
         });
         if (!response.ok) throw new Error('Failed to fetch support requests');
@@ -86,7 +86,7 @@ class AdminService {
     }
 
     async updateRequestStatus(requestId: string, status: string) {
-        const response = await fetch(`${API_BASE_URL}/admin/requests/${requestId}/status?status=${status}`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/requests/${requestId}/status?status=${status}`, {
             method: 'PUT',
             headers: this.getHeaders()
         });
@@ -95,7 +95,7 @@ class AdminService {
     }
 
     async getItems(skip = 0, limit = 20) {
-        const response = await fetch(`${API_BASE_URL}/admin/items?skip=${skip}&limit=${limit}`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/items?skip=${skip}&limit=${limit}`, {
             headers: this.getHeaders()
         });
         if (!response.ok) throw new Error('Failed to fetch items');
@@ -103,7 +103,7 @@ class AdminService {
     }
 
     async deleteItem(itemId: string) {
-        const response = await fetch(`${API_BASE_URL}/admin/items/${itemId}`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/items/${itemId}`, {
             method: 'DELETE',
             headers: this.getHeaders()
         });
@@ -112,7 +112,7 @@ class AdminService {
     }
 
     async getTrades(skip = 0, limit = 20) {
-        const response = await fetch(`${API_BASE_URL}/admin/trades?skip=${skip}&limit=${limit}`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/trades?skip=${skip}&limit=${limit}`, {
             headers: this.getHeaders()
         });
         if (!response.ok) throw new Error('Failed to fetch trades');
@@ -120,7 +120,7 @@ class AdminService {
     }
 
     async deleteTrade(tradeId: string) {
-        const response = await fetch(`${API_BASE_URL}/admin/trades/${tradeId}`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/trades/${tradeId}`, {
             method: 'DELETE',
             headers: this.getHeaders()
         });
@@ -129,7 +129,7 @@ class AdminService {
     }
 
     async updateItemStatus(itemId: string, status: string) {
-        const response = await fetch(`${API_BASE_URL}/admin/items/${itemId}/status`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/items/${itemId}/status`, {
             method: 'PUT',
             headers: this.getHeaders(),
             body: JSON.stringify({ status })
@@ -139,7 +139,7 @@ class AdminService {
     }
 
     async updateTradeStatus(tradeId: string, status: string) {
-        const response = await fetch(`${API_BASE_URL}/admin/trades/${tradeId}/status`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/admin/trades/${tradeId}/status`, {
             method: 'PUT',
             headers: this.getHeaders(),
             body: JSON.stringify({ status })
@@ -155,6 +155,9 @@ class BrowserDatabase {
 const database = new BrowserDatabase();
 
 class AuthService {
+    private refreshTimer: ReturnType<typeof setTimeout> | null = null;
+    private refreshing: Promise<boolean> | null = null;
+
     /**
      * Sign in user with email and password
      */
@@ -183,8 +186,8 @@ class AuthService {
             const data = await res.json();
             const { user: apiUser, token } = data;
 
-            // Store the token in localStorage
-            localStorage.setItem('bayanihan_token', token);
+            // Store the tokens in localStorage
+            this.storeTokens(data);
 
             const user = {
                 id: apiUser.id,
@@ -235,9 +238,9 @@ class AuthService {
         try {
             const token = this.getToken();
             if (!token || this.isUuidToken(token)) return null; // UUID tokens are for offline mode only
-            const res = await fetch(`${API_BASE_URL}/supabase-auth/profile`, {
+            const res = await this.authorizedFetch(`${API_BASE_URL}/supabase-auth/profile`, {
                 method: 'PUT',
-                headers: { 'Content-Type': 'application/json', Authorization: `Bearer ${token}` },
+                headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
                     name,
                     location: location || '',
@@ -270,12 +273,16 @@ class AuthService {
         try {
             const token = this.getToken();
             if (!token || this.isUuidToken(token)) return false; // UUID tokens are for offline mode only
-            const res = await fetch(`${API_BASE_URL}/supabase-auth/change-password`, {
+            const res = await this.authorizedFetch(`${API_BASE_URL}/supabase-auth/change-password`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json', Authorization: `Bearer ${token}` },
+                headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ old_password: oldPassword, new_password: newPassword })
             });
-            return res.ok;
+            if (!res.ok) return false;
+            // Other sessions are signed out; this one gets new tokens
+            const data = await res.json();
+            if (data.token) this.storeTokens(data);
+            return true;
         } catch (e) {
             console.error('Change password error:', e);
             return false;
@@ -337,7 +344,7 @@ class AuthService {
             }
 
             if (data.token && data.user) {
-                localStorage.setItem('bayanihan_token', data.token);
+                this.storeTokens(data);
                 const user = {
                     id: data.user.id,
                     email: data.user.email,
@@ -375,7 +382,7 @@ class AuthService {
             }
 
             if (data.token && data.user) {
-                localStorage.setItem('bayanihan_token', data.token);
+                this.storeTokens(data);
                 const user = {
                     id: data.user.id,
                     email: data.user.email,
@@ -549,13 +556,14 @@ class AuthService {
                 return user;
             }
 
-            // Token is a JWT, try backend first
-            const res = await fetch(`${API_BASE_URL}/supabase-auth/me`, { headers: { Authorization: `Bearer ${token}` } });
+            // Token is a JWT, try backend first (renewed if it has expired)
+            const res = await this.authorizedFetch(`${API_BASE_URL}/supabase-auth/me`);
             if (!res.ok) {
                 // JWT token is invalid/expired, clear it
-                localStorage.removeItem('bayanihan_token');
+                this.clearTokens();
                 return null;
             }
+            this.scheduleTokenRefresh();
             const apiUser = await res.json();
             return {
                 id: apiUser.id,
@@ -724,16 +732,33 @@ class AuthService {
      * Sign out user
      */
     async signOut(): Promise<void> {
+        const refreshToken = localStorage.getItem('bayanihan_refresh_token');
         try {
-            const token = localStorage.getItem('bayanihan_token');
+            if (refreshToken) {
+                await fetch(`${API_BASE_URL}/supabase-auth/logout`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ refresh_token: refreshToken })
+                });
+            }
         } catch (error) {
             console.error('Sign out error:', error);
         } finally {
             // Always clear local storage
-            localStorage.removeItem('bayanihan_token');
+            this.clearTokens();
         }
     }
 
+    /**
+     * Forget the stored tokens without signing out on the server
+     */
+    clearTokens(): void {
+        if (this.refreshTimer) clearTimeout(this.refreshTimer);
+        this.refreshTimer = null;
+        localStorage.removeItem('bayanihan_token');
+        localStorage.removeItem('bayanihan_refresh_token');
+    }
+
     /**
      * Check if user is authenticated
      */
@@ -747,6 +772,122 @@ class AuthService {
     getToken(): string | null {
         return localStorage.getItem('bayanihan_token');
     }
+
+    /**
+     * Get the access token for a request, renewed first if it has expired or
+     * is about to: the refresh timer does not run while the laptop sleeps and
+     * is throttled in background tabs
+     */
+    async getValidToken(): Promise<string | null> {
+        const token = this.getToken();
+        if (!token || this.isUuidToken(token)) return token;
+        const expiresAt = this.tokenExpiry(token);
+        if (expiresAt !== null && expiresAt - Date.now() < 30_000 && (await this.refreshSession())) {
+            return this.getToken();
+        }
+        return token;
+    }
+
+    /**
+     * fetch() with the access token. A 401 refreshes the session (one refresh
+     * shared by concurrent requests) and retries the request once.
+     */
+    async authorizedFetch(url: string, init: RequestInit = {}): Promise<Response> {
+        const send = (token: string | null) => {
+            const headers = new Headers(init.headers);
+            // UUID tokens are for offline mode only
+            if (token && !this.isUuidToken(token)) headers.set('Authorization', `Bearer ${token}`);
+            return fetch(url, { ...init, headers });
+        };
+        const token = await this.getValidToken();
+        const res = await send(token);
+        if (res.status !== 401 || !token || this.isUuidToken(token)) return res;
+        // Another request may have renewed the token while this one was in flight
+        if (this.getToken() === token && !(await this.refreshSession())) return res;
+        return send(this.getToken());
+    }
+
+    /**
+     * Store the tokens from a sign-in response and keep the access token fresh
+     */
+    private storeTokens(data: { token: string; refresh_token?: string }): void {
+        localStorage.setItem('bayanihan_token', data.token);
+        if (data.refresh_token) {
+            localStorage.setItem('bayanihan_refresh_token', data.refresh_token);
+        }
+        this.scheduleTokenRefresh();
+    }
+
+    /**
+     * Renew the access token a minute before it expires. Requests read the
+     * token from localStorage each time, so they pick up the new one.
+     */
+    private scheduleTokenRefresh(): void {
+        if (this.refreshTimer) clearTimeout(this.refreshTimer);
+        this.refreshTimer = null;
+        const token = this.getToken();
+        if (!token || this.isUuidToken(token) || !localStorage.getItem('bayanihan_refresh_token')) return;
+        const expiresAt = this.tokenExpiry(token);
+        if (expiresAt === null) return;
+        const delay = Math.max(0, expiresAt - Date.now() - 60_000);
+        this.refreshTimer = setTimeout(() => void this.refreshSession(), delay);
+    }
+
+    /**
+     * Expiry of a JWT access token in milliseconds, or null if it has none
+     */
+    private tokenExpiry(token: string): number | null {
+        try {
+            const payload = token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/');
+            const exp = JSON.parse(atob(payload)).exp;
+            return typeof exp === 'number' ? exp * 1000 : null;
+        } catch {
+            return null;
+        }
+    }
+
+    /**
+     * Exchange the refresh token for new tokens; false if the session has ended.
+     * Refresh tokens are single-use, so concurrent callers share one exchange.
+     */
+    refreshSession(): Promise<boolean> {
+        if (!this.refreshing) {
+            this.refreshing = this.exchangeRefreshToken().finally(() => {
+                this.refreshing = null;
+            });
+        }
+        return this.refreshing;
+    }
+
+    private async exchangeRefreshToken(): Promise<boolean> {
+        const refreshToken = localStorage.getItem('bayanihan_refresh_token');
+        if (!refreshToken) return false;
+        try {
+            const res = await fetch(`${API_BASE_URL}/supabase-auth/refresh`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ refresh_token: refreshToken })
+            });
+            if (!res.ok) {
+                // Another tab may have used this refresh token first
+                if (localStorage.getItem('bayanihan_refresh_token') !== refreshToken) {
+                    this.scheduleTokenRefresh();
+                    return true;
+                }
+                if (res.status === 401 || res.status === 403) {
+                    localStorage.removeItem('bayanihan_refresh_token');
+                }
+                return false;
+            }
+            this.storeTokens(await res.json());
+            return true;
+        } catch (e) {
+            console.error('Refresh session error:', e);
+            // Network error: try again in a minute
+            this.refreshTimer = setTimeout(() => void this.refreshSession(), 60_000);
+            return false;
+        }
+    }
 }
 
 // Export singleton instance
@@ -1,4 +1,5 @@
 import { API_BASE_URL } from '$lib/config/api';
+import { authService } from './authService';
 
 export type ChatSocketHandlers = {
 	onMessage?: (payload: any) => void;
@@ -11,9 +12,12 @@ export type ChatSocketHandlers = {
 type OutgoingEvent =
 	| { type: 'typing'; tradeId: string; userId: string; isTyping: boolean }
 	| { type: 'read'; tradeId: string; userId: string; messageIds: string[] }
-	| { type: 'presence'; tradeId: string; userId: string; status: 'online' | 'offline' };
+	| { type: 'presence'; tradeId: string; userId: string; status: 'online' | 'offline' }
+	| { type: 'pong' };
 
 const WS_BASE_URL = API_BASE_URL.replace(/^http/, 'ws');
+// Close code for a refused token or an account that was suspended or deleted
+const POLICY_VIOLATION = 1008;
 
 class ChatSocketManager {
 	private socket: WebSocket | null = null;
@@ -22,19 +26,27 @@ class ChatSocketManager {
 	private handlers: ChatSocketHandlers | null = null;
 	private reconnectAttempts = 0;
 	private reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+	// Bumped on every open and disconnect, so a stale token lookup does not open a socket
+	private generation = 0;
 
 	connect(tradeId: string, userId: string, handlers: ChatSocketHandlers) {
 		this.tradeId = tradeId;
 		this.userId = userId;
 		this.handlers = handlers;
-		this.openSocket();
+		void this.openSocket();
 	}
 
-	private openSocket() {
+	private async openSocket() {
 		if (!this.tradeId || !this.userId) return;
 		this.cleanup();
+		const generation = ++this.generation;
 
-		const socketUrl = `${WS_BASE_URL}/ws/trades/${this.tradeId}?user_id=${encodeURIComponent(this.userId)}`;
+		// The socket authenticates once, so the token must be current when it opens
+		const token = await authService.getValidToken();
+		if (generation !== this.generation || !this.tradeId) return;
+		if (!token || authService.isUuidToken(token)) return;
+
+		const socketUrl = `${WS_BASE_URL}/ws/trades/${this.tradeId}?token=${encodeURIComponent(token)}`;
 		this.socket = new WebSocket(socketUrl);
 
 		this.socket.onopen = () => {
@@ -60,6 +72,10 @@ class ChatSocketManager {
 							online: Boolean(payload.online)
 						});
 						break;
+					case 'ping':
+						// Server heartbeat; sockets that never answer are closed as idle
+						this.send({ type: 'pong' });
+						break;
 					case 'read':
 						this.handlers?.onRead?.({
 							messageId: payload.messageId,
@@ -79,7 +95,9 @@ class ChatSocketManager {
 			this.handlers?.onError?.(event);
 		};
 
-		this.socket.onclose = () => {
+		this.socket.onclose = (event) => {
+			// Refused: reconnecting with the same session would be refused again
+			if (event.code === POLICY_VIOLATION) return;
 			this.scheduleReconnect();
 		};
 	}
@@ -89,7 +107,7 @@ class ChatSocketManager {
 		if (this.reconnectAttempts >= 5) return;
 		const delay = Math.min(1000 * 2 ** this.reconnectAttempts, 10000);
 		this.reconnectAttempts += 1;
-		this.reconnectTimer = setTimeout(() => this.openSocket(), delay);
+		this.reconnectTimer = setTimeout(() => void this.openSocket(), delay);
 	}
 
 	send(event: OutgoingEvent) {
@@ -108,6 +126,7 @@ class ChatSocketManager {
 	}
 
 	disconnect() {
+		this.generation += 1;
 		this.tradeId = null;
 		this.userId = null;
 		this.handlers = null;
@@ -1,5 +1,6 @@
 import type { Item, Category, CreateItemData, UpdateItemData, ItemFilters } from '../types/items';
 import { api, API_BASE_URL } from '../config/api';
+import { authService } from './authService';
 
 class ItemService {
 	// Items CRUD operations
@@ -52,18 +53,9 @@ class ItemService {
 
 	async deleteItem(id: string): Promise<boolean> {
 		try {
-			const token = localStorage.getItem('bayanihan_token');
-			const headers: Record<string, string> = {
-				'Content-Type': 'application/json'
-			};
-
-			if (token) {
-				headers['Authorization'] = `Bearer ${token}`;
-			}
-
-			const response = await fetch(`${API_BASE_URL}/items/${id}`, {
+			const response = await authService.authorizedFetch(`${API_BASE_URL}/items/${id}`, {
 				method: 'DELETE',
-				headers
+				headers: { 'Content-Type': 'application/json' }
 			});
 			return response.ok;
 		} catch (error: any) {
@@ -1,6 +1,13 @@
 import type { Message, Conversation, CreateMessageData, MessageFilters } from '../types/messages';
 import { api, API_BASE_URL } from '../config/api';
 
+export interface MessagePage {
+	messages: Message[];
+	has_more: boolean;
+	next_before: string | null;
+	next_after: string | null;
+}
+
 class MessageService {
 	// Messages CRUD operations
 	async createMessage(messageData: CreateMessageData): Promise<Message> {
@@ -16,13 +23,23 @@ class MessageService {
 	async getMessageById(id: string): Promise<Message | null> { return null; }
 
 	async getMessages(filters: MessageFilters): Promise<Message[]> {
+		if (!filters.tradeId) return [];
+		const page = await this.getMessagePage(filters.tradeId);
+		return page.messages;
+	}
+
+	/**
+	 * One page of a trade's messages, oldest first: the latest page, or the
+	 * one before `before` (a page's next_before) when scrolling back
+	 */
+	async getMessagePage(tradeId: string, before?: string | null): Promise<MessagePage> {
 		try {
-			if (!filters.tradeId) return [];
-			const msgs = await api.get<Message[]>(`/messages/?trade_id=${encodeURIComponent(filters.tradeId)}`);
-			return msgs;
+			let path = `/messages/?trade_id=${encodeURIComponent(tradeId)}`;
+			if (before) path += `&before=${encodeURIComponent(before)}`;
+			return await api.get<MessagePage>(path);
 		} catch (error) {
 			console.error('Error getting messages:', error);
-			return [];
+			return { messages: [], has_more: false, next_before: null, next_after: null };
 		}
 	}
 
@@ -1,16 +1,16 @@
 import { API_BASE_URL } from '../config/api';
+import { authService } from './authService';
 
 class SupportService {
+    // authService.authorizedFetch adds the access token
     private getHeaders() {
-        const token = localStorage.getItem('bayanihan_token');
         return {
-            'Content-Type': 'application/json',
-            'Authorization': `Bearer ${token}`
+            'Content-Type': 'application/json'
         };
     }
 
     async createRequest(data: { type: string; subject: string; message: string }) {
-        const response = await fetch(`${API_BASE_URL}/support/requests`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/support/requests`, {
             method: 'POST',
             headers: this.getHeaders(),
             body: JSON.stringify(data)
@@ -20,7 +20,7 @@ class SupportService {
     }
 
     async getRequests() {
-        const response = await fetch(`${API_BASE_URL}/support/requests`, {
+        const response = await authService.authorizedFetch(`${API_BASE_URL}/support/requests`, {
             headers: this.getHeaders()
         });
         if (!response.ok) throw new Error('Failed to fetch support requests');
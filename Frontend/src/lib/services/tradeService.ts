@@ -1,27 +1,12 @@
 import type { Trade, CreateTradeData, UpdateTradeData, TradeFilters } from '../types/trades';
 import { api, API_BASE_URL } from '../config/api';
+import { authService } from './authService';
 
-/**
- * Check if token is a UUID (offline mode) or JWT (backend mode)
- */
-function isUuidToken(token: string): boolean {
-	// UUID format: xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx
-	const uuidRegex = /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/i;
-	return uuidRegex.test(token);
-}
-
+// authService.authorizedFetch adds the access token (JWTs only, not offline-mode UUIDs)
 function getAuthHeaders(): Record<string, string> {
-	const token = localStorage.getItem('bayanihan_token');
-	const headers: Record<string, string> = {
+	return {
 		'Content-Type': 'application/json'
 	};
-
-	// Only include Authorization header for JWT tokens (not UUID tokens from offline mode)
-	if (token && !isUuidToken(token)) {
-		headers['Authorization'] = `Bearer ${token}`;
-	}
-
-	return headers;
 }
 
 class TradeService {
@@ -64,7 +49,7 @@ class TradeService {
 
 	async updateTrade(id: string, updates: UpdateTradeData): Promise<Trade | null> {
 		try {
-			const updated = await fetch(`${API_BASE_URL}/trades/${id}`, {
+			const updated = await authService.authorizedFetch(`${API_BASE_URL}/trades/${id}`, {
 				method: 'PATCH',
 				headers: getAuthHeaders(),
 				body: JSON.stringify(updates)
@@ -82,7 +67,7 @@ class TradeService {
 
 	async deleteTrade(id: string): Promise<boolean> {
 		try {
-			const response = await fetch(`${API_BASE_URL}/trades/${id}`, {
+			const response = await authService.authorizedFetch(`${API_BASE_URL}/trades/${id}`, {
 				method: 'DELETE',
 				headers: getAuthHeaders()
 			});
@@ -132,7 +117,7 @@ class TradeService {
 		feedback?: string
 	): Promise<boolean> {
 		try {
-			const res = await fetch(`${API_BASE_URL}/trades/${tradeId}/ratings`, {
+			const res = await authService.authorizedFetch(`${API_BASE_URL}/trades/${tradeId}/ratings`, {
 				method: 'POST',
 				headers: getAuthHeaders(),
 				body: JSON.stringify({
@@ -1,4 +1,5 @@
 import { API_BASE_URL } from '../config/api';
+import { authService } from './authService';
 import type { User } from '../types/auth';
 
 class UserService {
@@ -23,14 +24,12 @@ class UserService {
   }
 
   async reportUser(reportedUserId: string, reason: string, description: string): Promise<void> {
-    const token = localStorage.getItem('bayanihan_token');
-    if (!token) throw new Error('You must be logged in to report a user');
+    if (!authService.getToken()) throw new Error('You must be logged in to report a user');
 
-    const res = await fetch(`${API_BASE_URL}/reports/user`, {
+    const res = await authService.authorizedFetch(`${API_BASE_URL}/reports/user`, {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json',
-        Authorization: `Bearer ${token}`
+        'Content-Type': 'application/json'
       },
       body: JSON.stringify({
         reported_user_id: reportedUserId,
@@ -8,6 +8,9 @@ interface MessagesState {
 	userId: string | null;
 	items: Message[];
 	isLoading: boolean;
+	isLoadingOlder: boolean;
+	// Cursor for the page before the oldest loaded message, if there is one
+	nextBefore: string | null;
 	isSending: boolean;
 	typingUsers: Record<string, number>;
 	onlineUsers: Record<string, boolean>;
@@ -21,6 +24,8 @@ const initialState: MessagesState = {
 	userId: null,
 	items: [],
 	isLoading: false,
+	isLoadingOlder: false,
+	nextBefore: null,
 	isSending: false,
 	typingUsers: {},
 	onlineUsers: {},
@@ -38,12 +43,12 @@ function createMessagesStore() {
 	async function loadMessages(tradeId: string, userId: string) {
 		update((current) => ({ ...current, tradeId, userId, isLoading: true }));
 		try {
-			const data = await messageService.getMessages({ tradeId });
+			// Only the latest page; older ones are loaded as the user scrolls up
+			const page = await messageService.getMessagePage(tradeId);
 			update((current) => ({
 				...current,
-				items: data.sort(
-					(a, b) => new Date(a.created_at).getTime() - new Date(b.created_at).getTime()
-				),
+				items: page.messages,
+				nextBefore: page.has_more ? page.next_before : null,
 				isLoading: false
 			}));
 		} catch (error) {
@@ -52,6 +57,25 @@ function createMessagesStore() {
 		}
 	}
 
+	async function loadOlderMessages() {
+		const state = get(store);
+		if (!state.tradeId || !state.nextBefore || state.isLoadingOlder) return;
+		const tradeId = state.tradeId;
+		update((current) => ({ ...current, isLoadingOlder: true }));
+		const page = await messageService.getMessagePage(tradeId, state.nextBefore);
+		update((current) => {
+			// The conversation may have changed while the page loaded
+			if (current.tradeId !== tradeId) return current;
+			const known = new Set(current.items.map((message) => message.id));
+			return {
+				...current,
+				items: [...page.messages.filter((message) => !known.has(message.id)), ...current.items],
+				nextBefore: page.has_more ? page.next_before : null,
+				isLoadingOlder: false
+			};
+		});
+	}
+
 	function connectSocket(tradeId: string, userId: string) {
 		chatSocketManager.connect(tradeId, userId, {
 			onMessage: (incoming) => {
@@ -206,6 +230,7 @@ function createMessagesStore() {
 			await loadMessages(tradeId, userId);
 			connectSocket(tradeId, userId);
 		},
+		loadOlder: loadOlderMessages,
 		async send(content: string, receiverId: string, tradeId: string) {
 			await sendMessage(content, receiverId, tradeId);
 		},